@@ -1,6 +1,7 @@
 import express from "express";
 import path from "path";
 import { DB } from "./databaseFunctions.js";
+import { lttb, pickResolution } from "./downsample.js";
 import fs from "fs";
 
 const router = express.Router();
@@ -51,17 +52,33 @@ router.post("/overview", async (req, res) => {
 // Return the table schema
 router.post("/intraday", async (req, res) => {
   try {
-    const { symbol, start, end } = req.body;
-
-    // Read the SQL query from the file
-    const queryPath = path.resolve("backend/sql_queries", "intraday.sql");
-    const query = fs.readFileSync(queryPath, "utf-8");
-
-    // Execute the query
-    const result = await db.query(query, [symbol, start, end]);
+    const { symbol, start, end, points } = req.body;
+
+    // Without a point budget, every hourly close in the range
+    if (!points) {
+      const queryPath = path.resolve("backend/sql_queries", "intraday.sql");
+      const query = fs.readFileSync(queryPath, "utf-8");
+      res.json(await db.query(query, [symbol, start, end]));
+      return;
+    }
+
+    // Otherwise the coarsest resolution that fills the chart, built by
+    // data-collection-scripts/intraday_pyramid.py, reduced to the budget
+    const countsPath = path.resolve("backend/sql_queries", "intraday_resolution.sql");
+    const [counts] = await db.query(fs.readFileSync(countsPath, "utf-8"), [symbol, start, end]);
+    const resolution = pickResolution(counts, points);
+
+    let result;
+    if (resolution === "hourly") {
+      const queryPath = path.resolve("backend/sql_queries", "intraday.sql");
+      result = await db.query(fs.readFileSync(queryPath, "utf-8"), [symbol, start, end]);
+    } else {
+      const queryPath = path.resolve("backend/sql_queries", "intraday_pyramid.sql");
+      result = await db.query(fs.readFileSync(queryPath, "utf-8"), [resolution, symbol, start, end]);
+    }
 
     // Send JSON result
-    res.json(result);
+    res.json(lttb(result, points, (d) => Date.parse(d.datetime.replace(" ", "T") + "Z"), (d) => d.close));
   } catch (err) {
     // Handle any errors
     console.error("Error executing query:", err);
@@ -73,12 +90,12 @@ router.post("/balance_sheet_senkey", async (req, res) => {
   try {
     const { symbol, start, end, report_type } = req.body;
 
-    // Read the SQL query from the file
-    const queryPath = path.resolve("backend/sql_queries", "balance_sheet_senkey2.sql");
+    // Flows are precomputed into sankey_edges by data-collection-scripts/sankey_edges.py
+    const queryPath = path.resolve("backend/sql_queries", "sankey_edges.sql");
     const query = fs.readFileSync(queryPath, "utf-8");
 
     // Execute the query
-    const result = await db.query(query, [symbol, start, end, report_type]);
+    const result = await db.query(query, ["balance_sheet", symbol, start, end, report_type]);
 
     // Send the result as JSON
     res.json(result);
@@ -92,12 +109,12 @@ router.post("/cash_flow_senkey", async (req, res) => {
   try {
     const { symbol, start, end, report_type } = req.body;
 
-    // Read the SQL query from the file
-    const queryPath = path.resolve("backend/sql_queries", "cash_flow_senkey.sql");
+    // Flows are precomputed into sankey_edges by data-collection-scripts/sankey_edges.py
+    const queryPath = path.resolve("backend/sql_queries", "sankey_edges.sql");
     const query = fs.readFileSync(queryPath, "utf-8");
 
     // Execute the query
-    const result = await db.query(query, [symbol, start, end, report_type]);
+    const result = await db.query(query, ["cash_flow", symbol, start, end, report_type]);
 
     // Send the result as JSON
     res.json(result);
@@ -111,12 +128,12 @@ router.post("/income_statement_senkey", async (req, res) => {
   try {
     const { symbol, start, end, report_type } = req.body;
 
-    // Read the SQL query from the file
-    const queryPath = path.resolve("backend/sql_queries", "income_statement_senkey.sql");
+    // Flows are precomputed into sankey_edges by data-collection-scripts/sankey_edges.py
+    const queryPath = path.resolve("backend/sql_queries", "sankey_edges.sql");
     const query = fs.readFileSync(queryPath, "utf-8");
 
     // Execute the query
-    const result = await db.query(query, [symbol, start, end, report_type]);
+    const result = await db.query(query, ["income_statement", symbol, start, end, report_type]);
 
     // Send the result as JSON
     res.json(result);
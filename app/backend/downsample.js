@@ -0,0 +1,81 @@
+/**
+ * Chart downsampling for /intraday, the JavaScript side of
+ * data-collection-scripts/intraday_pyramid.py (same resolution choice and
+ * the same largest-triangle-three-buckets selection as its lttb()).
+ */
+
+// Coarsest first, the order resolutions are tried in
+export const RESOLUTIONS = ["monthly", "weekly", "daily"];
+
+/**
+ * The coarsest resolution with at least `points` rows in the range, else "hourly"
+ * @param {Object} counts - { monthly, weekly, daily } row counts
+ * @param {Number} points - The point budget of the chart
+ * @returns {String}
+ */
+export function pickResolution(counts, points) {
+  return RESOLUTIONS.find((resolution) => counts[resolution] >= points) ?? "hourly";
+}
+
+/**
+ * Reduces rows to `threshold` rows with largest-triangle-three-buckets. The
+ * first and last rows are kept; from each of threshold - 2 equal buckets in
+ * between, the row forming the largest triangle with the row kept before it
+ * and the average of the next bucket.
+ * @param {Array} rows - Rows sorted by x
+ * @param {Number} threshold - Rows to keep
+ * @param {Function} x - Row to number
+ * @param {Function} y - Row to number
+ * @returns {Array}
+ */
+export function lttb(rows, threshold, x, y) {
+  const count = rows.length;
+  if (threshold >= count || threshold < 3) {
+    return rows;
+  }
+  const xs = rows.map(x);
+  const ys = rows.map(y);
+  // Same bucket edges as np.floor(np.linspace(1, count - 1, threshold - 1))
+  const step = (count - 2) / (threshold - 2);
+  const edges = [];
+  for (let i = 0; i < threshold - 1; i++) {
+    edges.push(Math.floor(i * step + 1));
+  }
+  edges[threshold - 2] = count - 1;
+
+  const kept = [rows[0]];
+  let previous = 0;
+  for (let bucket = 0; bucket < threshold - 2; bucket++) {
+    const start = edges[bucket];
+    const end = edges[bucket + 1];
+    let nextX = xs[count - 1];
+    let nextY = ys[count - 1];
+    if (bucket + 2 < edges.length) {
+      const nextEnd = edges[bucket + 2];
+      nextX = 0;
+      nextY = 0;
+      for (let i = end; i < nextEnd; i++) {
+        nextX += xs[i];
+        nextY += ys[i];
+      }
+      nextX /= nextEnd - end;
+      nextY /= nextEnd - end;
+    }
+    let best = start;
+    let bestArea = -1;
+    for (let i = start; i < end; i++) {
+      // Twice the triangle area; the factor does not change the maximum
+      const area = Math.abs(
+        (xs[previous] - nextX) * (ys[i] - ys[previous]) - (xs[previous] - xs[i]) * (nextY - ys[previous])
+      );
+      if (area > bestArea) {
+        bestArea = area;
+        best = i;
+      }
+    }
+    kept.push(rows[best]);
+    previous = best;
+  }
+  kept.push(rows[count - 1]);
+  return kept;
+}
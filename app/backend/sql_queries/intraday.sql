@@ -1,9 +1,9 @@
       
  SELECT
-  datetime,
+  datetime(datetime, 'unixepoch') AS datetime,
   close
 FROM company_intraday_data
 WHERE symbol    = ?
-  AND datetime >= ?
-  AND datetime <= ?
-ORDER BY datetime ASC;
\ No newline at end of file
+  AND datetime >= CAST(strftime('%s', ?) AS INTEGER)
+  AND datetime <  CAST(strftime('%s', ?) AS INTEGER)
+ORDER BY company_intraday_data.datetime ASC;
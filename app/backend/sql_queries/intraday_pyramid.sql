@@ -0,0 +1,21 @@
+-- Closes of one aggregate resolution, built by data-collection-scripts/intraday_pyramid.py.
+-- Each row is dated by the last bar of its day, week or month.
+-- Parameters: resolution ('daily', 'weekly' or 'monthly'), symbol, start, end.
+SELECT datetime(datetime, 'unixepoch') AS datetime, close
+FROM (
+  SELECT datetime, close FROM intraday_daily
+  WHERE ?1 = 'daily' AND symbol = ?2
+    AND datetime >= CAST(strftime('%s', ?3) AS INTEGER)
+    AND datetime <  CAST(strftime('%s', ?4) AS INTEGER)
+  UNION ALL
+  SELECT datetime, close FROM intraday_weekly
+  WHERE ?1 = 'weekly' AND symbol = ?2
+    AND datetime >= CAST(strftime('%s', ?3) AS INTEGER)
+    AND datetime <  CAST(strftime('%s', ?4) AS INTEGER)
+  UNION ALL
+  SELECT datetime, close FROM intraday_monthly
+  WHERE ?1 = 'monthly' AND symbol = ?2
+    AND datetime >= CAST(strftime('%s', ?3) AS INTEGER)
+    AND datetime <  CAST(strftime('%s', ?4) AS INTEGER)
+)
+ORDER BY 1;
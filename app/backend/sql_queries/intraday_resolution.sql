@@ -0,0 +1,18 @@
+-- Points each aggregate resolution has for a symbol in [start, end), used by
+-- /intraday to pick the coarsest one that fills the chart (hourly bars from
+-- intraday.sql when none does). The tables are built by
+-- data-collection-scripts/intraday_pyramid.py.
+-- Parameters: symbol, start, end.
+SELECT
+  (SELECT COUNT(*) FROM intraday_monthly
+   WHERE symbol = ?1
+     AND datetime >= CAST(strftime('%s', ?2) AS INTEGER)
+     AND datetime <  CAST(strftime('%s', ?3) AS INTEGER)) AS monthly,
+  (SELECT COUNT(*) FROM intraday_weekly
+   WHERE symbol = ?1
+     AND datetime >= CAST(strftime('%s', ?2) AS INTEGER)
+     AND datetime <  CAST(strftime('%s', ?3) AS INTEGER)) AS weekly,
+  (SELECT COUNT(*) FROM intraday_daily
+   WHERE symbol = ?1
+     AND datetime >= CAST(strftime('%s', ?2) AS INTEGER)
+     AND datetime <  CAST(strftime('%s', ?3) AS INTEGER)) AS daily;
@@ -0,0 +1,21 @@
+-- Sankey flows of one report, precomputed by data-collection-scripts/sankey_edges.py.
+-- Parameters: statement ('income_statement', 'balance_sheet' or 'cash_flow'),
+-- symbol, start, end, report_type. Like the per-statement queries it replaces,
+-- the earliest USD report in [start, end] is drawn.
+SELECT
+  source,
+  target,
+  value,
+  flow_order
+FROM sankey_edges
+WHERE (symbol, statement, reportType, fiscalDateEnding) = (
+  SELECT symbol, statement, reportType, fiscalDateEnding
+  FROM sankey_edges
+  WHERE statement = ?
+    AND symbol = ?
+    AND fiscalDateEnding BETWEEN ? AND ?
+    AND reportType = ?
+  ORDER BY fiscalDateEnding
+  LIMIT 1
+)
+ORDER BY flow_order;
@@ -1,12 +1,11 @@
+-- Average ticker sentiment over [start, end], read from the daily rollup
+-- maintained by data-collection-scripts/sentiment_rollup.py. Bounds are
+-- 'YYYYMMDDTHHMMSS' strings and are applied per whole day.
 SELECT
-  AVG(nts.ticker_sentiment_score) AS "value"
+  SUM(score_sum) / SUM(score_count) AS "value"
 FROM
-  news_ticker_sentiment nts
-JOIN
-  news_articles na
-ON
-  nts.article_id = na.id
+  ticker_sentiment_daily
 WHERE
-  nts.ticker_symbol = ?
-  AND na.time_published BETWEEN ? AND ?
+  ticker_symbol = ?
+  AND day BETWEEN SUBSTR(?, 1, 8) AND SUBSTR(?, 1, 8)
 ;
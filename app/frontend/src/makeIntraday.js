@@ -166,14 +166,15 @@ export async function makeIntraday(containerID) {
   const changeData = async (transition = true) => {
     // Set overview data
     const { start, end } = state.queryDateRange(PageState.DATE_TYPE.INTRADAY);
-    const data = await queryData("intraday", { symbol: state.symbol, start, end });
+
+    // Get initial chart dimensions; about one point per pixel is requested
+    const { width, height } = getDimensions();
+
+    const data = await queryData("intraday", { symbol: state.symbol, start, end, points: Math.round(width) });
     const duration = transition ? state.duration : 0;
 
     // ------ Error Message ------ //
 
-    // Get initial chart dimensions
-    const { width, height } = getDimensions();
-
     const isError = !Array.isArray(data) || !data.length;
 
     // Display error message
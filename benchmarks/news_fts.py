@@ -0,0 +1,216 @@
+# news_fts.py
+"""
+Index build, ingestion cost and query latency of the news full-text index
+(data-collection-scripts/news_search.py) on a synthetic archive of millions of
+articles.
+
+The archive is written once to data/news_fts/<articles>.db. Articles have the
+shape of synthetic.news_feed (100 tickers, 2015-2024) but go straight into
+news_articles and news_ticker_sentiment, the only tables search reads, and
+are not indexed. Each run copies it and times:
+
+    backfill   news_search.backfill(rebuild=True) over the whole archive, and
+               the size the index adds to the file
+    ingest     store_news_sentiment of INGEST_FEEDS feeds into a fresh
+               database, with and without indexing
+    queries    search() for each of QUERIES against a LIKE scan collecting
+               every match (ranking needs all of them)
+
+Usage:
+    python news_fts.py [articles] [--regenerate]
+"""
+
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = os.path.join(BENCHMARK_DIR, 'data', 'news_fts')
+
+import synthetic
+from run import RESULTS_DIR, commit_id
+
+from fetch_funcs import NEWS_ARTICLE_INSERT, NEWS_TICKER_SENTIMENT_INSERT, store_news_sentiment
+import news_search
+from storage import get_db
+
+DEFAULT_ARTICLES = 2_000_000
+TICKERS = 100
+YEARS = 10
+INGEST_FEEDS = 20
+INGEST_ARTICLES = 1000
+REPEATS = 5
+
+
+def archive_path(articles):
+    return os.path.join(WORK_DIR, f"{articles}.db")
+
+
+def write_archive(articles, seed=0):
+    """
+    Writes `articles` unindexed articles and their ticker mentions.
+    """
+    path = archive_path(articles)
+    for leftover in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    rng = random.Random(seed)
+    universe = synthetic.symbols(TICKERS)
+    weights = synthetic.mention_weights(universe)
+    words = synthetic.vocabulary(seed=seed)
+    months = synthetic.periods(YEARS)
+    per_feed = -(-articles // (TICKERS * len(months)))
+    db = get_db(path)
+    cursor = db.cursor()
+    article_id = 1
+    started = time.monotonic()
+    for period in months:
+        for ticker in universe:
+            count = min(per_feed, articles - article_id + 1)
+            if count <= 0:
+                break
+            article_rows, sentiment_rows = [], []
+            for article in synthetic.news_feed(ticker, period, count, universe, weights, words, rng)['feed']:
+                article_rows.append((
+                    article_id, article['title'], article['url'], article['time_published'],
+                    ','.join(article['authors']), article['summary'], None, article['source'],
+                    article['category_within_source'], article['source_domain'],
+                    ','.join(topic['topic'] for topic in article['topics']),
+                    article['overall_sentiment_score'], article['overall_sentiment_label'], '2025-01-01 00:00:00',
+                ))
+                sentiment_rows.extend((article_id, mention['ticker'], mention['relevance_score'],
+                                       mention['ticker_sentiment_score'], mention['ticker_sentiment_label'])
+                                      for mention in article['ticker_sentiment'])
+                article_id += 1
+            with db.unit() as unit_cursor:
+                unit_cursor.executemany(NEWS_ARTICLE_INSERT, article_rows)
+                unit_cursor.executemany(NEWS_TICKER_SENTIMENT_INSERT, sentiment_rows)
+        print(f"[news_fts] {period}: {article_id - 1} articles in {time.monotonic() - started:.0f}s")
+    db.flush()
+    cursor.execute("ANALYZE")
+    db.close()
+    return article_id - 1
+
+
+def file_bytes(cursor):
+    return cursor.execute("PRAGMA page_count").fetchone()[0] * cursor.execute("PRAGMA page_size").fetchone()[0]
+
+
+def queries(words):
+    """
+    {name: (search() arguments, equivalent LIKE scan and its parameters)}.
+    """
+    word, other = words[100], words[2000]
+    hub, tail = synthetic.symbols(TICKERS)[0], synthetic.symbols(TICKERS)[TICKERS - 1]
+    like_word = "(a.title LIKE ?1 OR a.summary LIKE ?1)"
+    return {
+        'term': ((word,), f"SELECT a.id FROM news_articles a WHERE {like_word}", (f"%{word}%",)),
+        'two terms': ((f"{word} {other}",),
+                      f"SELECT a.id FROM news_articles a WHERE {like_word} AND (a.title LIKE ?2 OR a.summary LIKE ?2)",
+                      (f"%{word}%", f"%{other}%")),
+        'phrase': ((f'"{word} {other}"',),
+                   "SELECT a.id FROM news_articles a WHERE a.title LIKE ?1 OR a.summary LIKE ?1",
+                   (f"%{word} {other}%",)),
+        'prefix': ((f"{word[:3]}*",), f"SELECT a.id FROM news_articles a WHERE {like_word}", (f"%{word[:3]}%",)),
+        'term, hub ticker': ((word, hub), f'''
+            SELECT a.id FROM news_ticker_sentiment t JOIN news_articles a ON a.id = t.article_id
+            WHERE t.ticker_symbol = ?2 AND {like_word}''', (f"%{word}%", hub)),
+        'term, tail ticker': ((word, tail), f'''
+            SELECT a.id FROM news_ticker_sentiment t JOIN news_articles a ON a.id = t.article_id
+            WHERE t.ticker_symbol = ?2 AND {like_word}''', (f"%{word}%", tail)),
+        'term, hub ticker, 1 month': ((word, hub, '2020-03-01', '2020-04-01'), f'''
+            SELECT a.id FROM news_ticker_sentiment t JOIN news_articles a ON a.id = t.article_id
+            WHERE t.ticker_symbol = ?2 AND a.time_published >= '20200301' AND a.time_published < '20200401'
+              AND {like_word}''', (f"%{word}%", hub)),
+    }
+
+
+def timed(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+def ingest(indexed):
+    path = os.path.join(WORK_DIR, f"ingest-{'fts' if indexed else 'plain'}.db")
+    for leftover in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    rng = random.Random(1)
+    universe = synthetic.symbols(TICKERS)
+    weights = synthetic.mention_weights(universe)
+    words = synthetic.vocabulary()
+    feeds = [synthetic.news_feed(universe[index % TICKERS], f"2024-{index % 12 + 1:02d}", INGEST_ARTICLES, universe,
+                                 weights, words, rng, url_prefix=f"https://ingest/{index}")
+             for index in range(INGEST_FEEDS)]
+    news_search.ENABLED = indexed
+    db = get_db(path)
+    with redirect_stdout(open(os.devnull, 'w')):
+        started = time.perf_counter()
+        for index, feed in enumerate(feeds):
+            store_news_sentiment(universe[index % TICKERS], feed, db)
+        db.flush()
+        elapsed = time.perf_counter() - started
+    db.close()
+    news_search.ENABLED = True
+    return INGEST_FEEDS * INGEST_ARTICLES / elapsed
+
+
+def run(articles, regenerate=False):
+    os.makedirs(WORK_DIR, exist_ok=True)
+    if regenerate or not os.path.exists(archive_path(articles)):
+        print(f"Writing a synthetic archive of {articles} articles.")
+        write_archive(articles)
+
+    path = os.path.join(WORK_DIR, 'work.db')
+    for leftover in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    shutil.copyfile(archive_path(articles), path)
+    db = get_db(path)
+    cursor = db.cursor()
+    results = {}
+
+    before = file_bytes(cursor)
+    started = time.perf_counter()
+    indexed = news_search.backfill(db, rebuild=True)
+    elapsed = time.perf_counter() - started
+    results['backfill'] = {'articles': indexed, 'seconds': elapsed, 'articles_per_s': indexed / elapsed,
+                           'index_mb': (file_bytes(cursor) - before) / 2**20, 'archive_mb': before / 2**20}
+    print(f"backfill        {indexed} articles in {elapsed:.1f}s ({indexed / elapsed:.0f}/s), "
+          f"index {results['backfill']['index_mb']:.0f} MB on a {before / 2**20:.0f} MB archive")
+
+    plain, fts = ingest(False), ingest(True)
+    results['ingest'] = {'plain_articles_per_s': plain, 'fts_articles_per_s': fts}
+    print(f"ingest          {plain:.0f} articles/s without the index, {fts:.0f}/s with it "
+          f"({(plain / fts - 1) * 100:.0f}% slower)")
+
+    results['queries'] = {}
+    for name, (arguments, like, params) in queries(synthetic.vocabulary()).items():
+        search_ms, found = timed(lambda: news_search.search(*arguments, limit=50, db=db), REPEATS)
+        like_ms, matches = timed(lambda: cursor.execute(like, params).fetchall(), 1)
+        results['queries'][name] = {'search_ms': search_ms, 'like_ms': like_ms,
+                                    'returned': len(found), 'like_matches': len(matches)}
+        print(f"{name:<28} search {search_ms:>8.2f} ms ({len(found):>2} best)   "
+              f"LIKE {like_ms:>9.1f} ms ({len(matches)} matches)")
+    db.close()
+
+    report = {'commit': commit_id(), 'articles': articles, 'results': results}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, f"{report['commit']}-news-fts-{articles}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    print(f"Written to {run(int(args[0]) if args else DEFAULT_ARTICLES, regenerate='--regenerate' in sys.argv)}")
@@ -0,0 +1,332 @@
+# run.py
+"""
+Benchmarks for the ingestion and query hot paths.
+
+A synthetic database (synthetic.py) is generated once per scale under
+benchmarks/data/<tickers>/ and copied before every run, so each run starts
+from the same state. Timed:
+
+    store_*              the collectors' store functions, writing new
+                         tickers/articles on top of the synthetic data
+    check_existing_news  whole-month windows (coverage index) and arbitrary
+                         windows (SQL count)
+    query:*              the served SQL in app/backend/sql_queries, with the
+                         parameters dataRoute.js binds for the year and quarter
+                         ranges the UI offers, prepared on every call like the
+                         backend does
+    ohlcv:*              rebuilding the per-symbol bar files, and reading the
+                         intraday.sql ranges and whole histories from them
+
+Results are written as JSON to benchmarks/results/<commit>-<tickers>.json (and
+printed), and two result files can be compared:
+
+    python run.py run [tickers] [--regenerate]
+    python run.py compare <old.json> <new.json>
+
+`compare` exits with status 1 if any benchmark got slower than
+REGRESSION_THRESHOLD.
+"""
+
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import synthetic
+from synthetic import SCALES, periods, statement_payload, symbols
+
+from fetch_funcs import check_existing_news, store_intraday_data, store_news_sentiment
+from news_planner import period_window
+from ohlcv_store import get_ohlcv_store
+from storage import DB_PATH, get_db
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+QUERY_DIR = os.path.join(BENCHMARK_DIR, '..', 'app', 'backend', 'sql_queries')
+
+REGRESSION_THRESHOLD = 0.10
+QUERY_SYMBOLS = 10
+CHECK_SYMBOLS = 50
+
+# Fixed workloads, the same at every scale
+NEW_TICKERS = 10
+NEW_FEEDS = 50
+FEED_ARTICLES = 200
+
+QUARTERS = (('01-01', '12-31'), ('01-01', '03-31'), ('04-01', '06-30'), ('07-01', '09-30'), ('10-01', '12-31'))
+
+
+def summarize(timings, rows=0, total=None):
+    """
+    Per-call milliseconds of `timings` (seconds). `total` defaults to their sum
+    and is what rows_per_s is computed from.
+    """
+    total = sum(timings) if total is None else total
+    ordered = sorted(timings)
+    result = {
+        'calls': len(timings),
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'total_s': total,
+    }
+    if rows:
+        result['rows'] = rows
+        result['rows_per_s'] = rows / total if total else None
+    return result
+
+
+def timed_stores(db, calls):
+    """
+    Runs (fn, args, rows) calls one at a time plus the final commit. Returns
+    summarize() of them, the commit counted in the total.
+    """
+    timings = []
+    rows = 0
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        for fn, args, count in calls:
+            call_started = time.perf_counter()
+            fn(*args, db)
+            timings.append(time.perf_counter() - call_started)
+            rows += count
+        db.flush()
+    return summarize(timings, rows, time.perf_counter() - started)
+
+
+def bench_stores(db, scale, rng):
+    results = {}
+    universe = symbols(scale['tickers'])
+    new_tickers = symbols(NEW_TICKERS, prefix='B')
+    last_year = periods(1)
+
+    payloads = [synthetic.intraday_payload(ticker, period, rng) for ticker in new_tickers for period in last_year]
+    calls = [(store_intraday_data, (payload,), len(payload)) for payload in payloads]
+    results['store_intraday_data'] = timed_stores(db, calls)
+    # The same months again, every row an upsert
+    results['store_intraday_data:upsert'] = timed_stores(db, calls)
+
+    weights = synthetic.mention_weights(universe)
+    words = synthetic.vocabulary()
+    feeds = [(ticker, synthetic.news_feed(ticker, last_year[index % 12], FEED_ARTICLES, universe, weights, words,
+                                          rng, url_prefix='https://bench.example.com'))
+             for index, ticker in enumerate(rng.choices(universe, k=NEW_FEEDS))]
+    calls = [(store_news_sentiment, (ticker, feed), FEED_ARTICLES) for ticker, feed in feeds]
+    results['store_news_sentiment'] = timed_stores(db, calls)
+    # Every article already stored, the deduplication path
+    results['store_news_sentiment:duplicates'] = timed_stores(db, calls)
+
+    for table, store in synthetic.STATEMENT_TABLES.items():
+        columns = synthetic.statement_columns(db, table)
+        payloads = [statement_payload(ticker, columns, scale['years'], rng) for ticker in new_tickers]
+        calls = [(store, (payload,), len(payload['annualReports']) + len(payload['quarterlyReports']))
+                 for payload in payloads]
+        results[f"store_{table}"] = timed_stores(db, calls)
+    return results
+
+
+def bench_check_existing_news(scale, rng):
+    results = {}
+    sample = rng.sample(symbols(scale['tickers']), min(CHECK_SYMBOLS, scale['tickers']))
+    windows = {
+        'month': [period_window(period) for period in periods(scale['years'])],
+        'window': [(f"{period[:4]}{period[5:7]}01T0000", f"{period[:4]}{period[5:7]}15T2359")
+                   for period in periods(scale['years'])],
+    }
+    for name, ranges in windows.items():
+        timings = []
+        for ticker in sample:
+            for time_from, time_to in ranges:
+                started = time.perf_counter()
+                check_existing_news(ticker, time_from, time_to)
+                timings.append(time.perf_counter() - started)
+        results[f"check_existing_news:{name}"] = summarize(timings)
+    return results
+
+
+def query_params(scale, rng):
+    """
+    {query file: [parameter tuples]} as dataRoute.js binds them, for a sample
+    of symbols over every year and quarter range the UI offers.
+    """
+    sample = rng.sample(symbols(scale['tickers']), min(QUERY_SYMBOLS, scale['tickers']))
+    years = range(synthetic.END_YEAR - scale['years'] + 1, synthetic.END_YEAR + 1)
+    ranges = [(year, start, end) for year in years for start, end in QUARTERS]
+    params = {}
+    for symbol in sample:
+        for year, start, end in ranges:
+            date_from, date_to = f"{year}-{start}", f"{year}-{end}"
+            cloud_from, cloud_to = f"{year}{start.replace('-', '')}T000000", f"{year}{end.replace('-', '')}T235959"
+            params.setdefault('intraday.sql', []).append(
+                (symbol, f"{date_from} 00:00:00", f"{date_to} 23:59:59"))
+            for statement in synthetic.STATEMENT_TABLES:
+                for report_type in ('annual', 'quarterly'):
+                    params.setdefault(f"sankey_edges.sql:{statement}", []).append(
+                        (statement, symbol, date_from, date_to, report_type))
+            params.setdefault('symbol_sentiment_speedometer.sql', []).append((symbol, cloud_from, cloud_to))
+            params.setdefault('wordcloud.sql', []).append((symbol, cloud_from, cloud_to, 15))
+    return params
+
+
+def bench_queries(path, scale, rng, repeats=3):
+    results = {}
+    # The backend prepares the query text on every request
+    conn = sqlite3.connect(path, cached_statements=0)
+    for name, param_list in query_params(scale, rng).items():
+        with open(os.path.join(QUERY_DIR, name.split(':')[0])) as f:
+            query = f.read()
+        timings = []
+        rows = 0
+        for attempt in range(repeats):
+            for params in param_list:
+                started = time.perf_counter()
+                result = conn.execute(query, params).fetchall()
+                timings.append(time.perf_counter() - started)
+                if attempt == 0:
+                    rows += len(result)
+        results[f"query:{name}"] = {**summarize(timings), 'rows': rows}
+    conn.close()
+    return results
+
+
+def bench_ohlcv(db, scale, rng, repeats=3):
+    results = {}
+    store = get_ohlcv_store(db.path)
+    started = time.perf_counter()
+    bars = store.rebuild(db)
+    elapsed = time.perf_counter() - started
+    results['ohlcv:rebuild'] = summarize([elapsed], bars, elapsed)
+
+    ranges = query_params(scale, rng)['intraday.sql']
+    for name, calls in (('range', [(symbol, start, end) for symbol, start, end in ranges]),
+                        ('history', [(symbol, None, None) for symbol in sorted({call[0] for call in ranges})])):
+        timings = []
+        rows = 0
+        for attempt in range(repeats):
+            for symbol, start, end in calls:
+                started = time.perf_counter()
+                result = store.bars(symbol, start, end)
+                timings.append(time.perf_counter() - started)
+                if attempt == 0:
+                    rows += len(result)
+        results[f"ohlcv:{name}"] = {**summarize(timings), 'rows': rows}
+    return results
+
+
+def commit_id():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARK_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def base_database(tickers, regenerate=False):
+    """
+    Path of the synthetic database of a scale, generated on first use.
+    """
+    path = os.path.join(DATA_DIR, str(tickers), 'base.db')
+    if regenerate and os.path.exists(path):
+        os.remove(path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.partial'
+        for leftover in (partial, partial + '-wal', partial + '-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        print(f"Generating the {tickers} ticker database, this is done once per scale.")
+        synthetic.generate(partial, **SCALES[tickers])
+        os.replace(partial, path)
+    return path
+
+
+def run(tickers, regenerate=False, seed=1):
+    scale = SCALES[tickers]
+    base = base_database(tickers, regenerate)
+    # check_existing_news and the coverage index read finance_data.db in the working directory
+    work_dir = os.path.join(DATA_DIR, str(tickers), 'work')
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    for leftover in (DB_PATH + '-wal', DB_PATH + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    shutil.copyfile(base, DB_PATH)
+
+    rng = random.Random(seed)
+    results = {}
+    results.update(bench_queries(DB_PATH, scale, rng))
+    results.update(bench_check_existing_news(scale, rng))
+    results.update(bench_ohlcv(get_db(), scale, rng))
+    results.update(bench_stores(get_db(), scale, rng))
+    get_db().close()
+
+    report = {
+        'commit': commit_id(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'scale': scale,
+        'database_bytes': os.path.getsize(base),
+        'results': results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, f"{report['commit']}-{tickers}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report, output
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints the median per-call change of every benchmark in both reports.
+    Returns the names that got slower by more than threshold.
+    """
+    regressions = []
+    print(f"{'benchmark':<48} {old['commit']:>14} {new['commit']:>14}   change")
+    for name, before in old['results'].items():
+        after = new['results'].get(name)
+        if after is None:
+            continue
+        change = after['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  slower'
+        print(f"{name:<48} {before['median_ms']:>11.3f} ms {after['median_ms']:>11.3f} ms {change:>+8.1%}{flag}")
+    if old['scale'] != new['scale']:
+        print(f"Note: the reports were run at different scales ({old['scale']} vs {new['scale']}).")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    command = args[0] if args else 'run'
+    if command == 'run':
+        tickers = int(args[1]) if len(args) > 1 else 60
+        if tickers not in SCALES:
+            raise SystemExit(f"Unknown scale {tickers}, expected one of {', '.join(map(str, SCALES))}")
+        report, output = run(tickers, regenerate='--regenerate' in sys.argv)
+        print(json.dumps(report, indent=2))
+        print(f"Written to {output}")
+    elif command == 'compare' and len(args) == 3:
+        with open(args[1]) as f:
+            old = json.load(f)
+        with open(args[2]) as f:
+            new = json.load(f)
+        if compare(old, new):
+            sys.exit(1)
+    else:
+        raise SystemExit("Usage: python run.py run [60|500|5000] [--regenerate]\n"
+                         "       python run.py compare <old.json> <new.json>")
@@ -0,0 +1,174 @@
+# stream_memory.py
+"""
+Peak memory and throughput of whole-response vs streamed ingestion
+(AV_STREAMING=1, see data-collection-scripts/streaming.py).
+
+Synthetic responses are written once into a response cache under
+benchmarks/data/streaming/ and served from it in replay mode, so both paths
+read the same gzip blobs and only the parsing and storing differ:
+
+    news      FEEDS NEWS_SENTIMENT responses of 1000 articles each
+    intraday  one datatype=csv response of `bars` 5-minute bars, newest first,
+              reaching back past the 2016 cutoff
+
+Each path stores into a fresh database. Peak memory is the tracemalloc peak
+(Python objects and NumPy buffers) of one call; time and rows/s come from a
+separate run without tracing.
+
+Usage:
+    python stream_memory.py [bars] [--regenerate]
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = os.path.join(BENCHMARK_DIR, 'data', 'streaming')
+os.environ['AV_CACHE_DIR'] = os.path.join(WORK_DIR, 'response_cache')
+os.environ['AV_CACHE_MODE'] = 'replay'
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+from run import RESULTS_DIR, commit_id
+
+from bulk_loader import apply_cutoff, frame_from_csv, store_intraday_frame
+from fetch_funcs import fetch_intraday_data_bulk_csv, fetch_news_sentiment, news_params, store_news_sentiment
+from response_cache import ResponseCache
+from storage import get_db
+from streaming import fetch_intraday_csv_frames, fetch_news_stream, store_intraday_frames
+
+FEEDS = 5
+FEED_ARTICLES = 1000
+DEFAULT_BARS = 1_000_000
+INTERVAL = '5min'
+TICKER = 'BIG'
+API_KEY = 'benchmark'
+
+
+def news_windows():
+    return [(f"2024{month:02d}01T0000", f"2024{month:02d}28T2359") for month in range(1, FEEDS + 1)]
+
+
+def csv_params():
+    return {'function': 'TIME_SERIES_INTRADAY', 'symbol': TICKER, 'interval': INTERVAL,
+            'datatype': 'csv', 'outputsize': 'full', 'apikey': API_KEY}
+
+
+def write_fixtures(bars, seed=0):
+    """
+    Records the synthetic responses into the replay cache.
+    """
+    shutil.rmtree(os.environ['AV_CACHE_DIR'], ignore_errors=True)
+    cache = ResponseCache(os.environ['AV_CACHE_DIR'], 'record')
+    rng = random.Random(seed)
+    universe = synthetic.symbols(60)
+    weights = synthetic.mention_weights(universe)
+    words = synthetic.vocabulary(seed=seed)
+    for month, (time_from, time_to) in enumerate(news_windows(), 1):
+        data = synthetic.news_feed(TICKER, f"2024-{month:02d}", FEED_ARTICLES, universe + [TICKER],
+                                   weights + [1.0], words, rng)
+        cache.put(news_params(TICKER, time_from, time_to, API_KEY), json.dumps(data).encode())
+
+    np_rng = np.random.default_rng(seed)
+    end = np.datetime64('2024-12-31T19:55:00', 's')
+    close = 100 * np.exp(np.cumsum(np_rng.normal(0, 0.002, bars)))[::-1]
+    frame = pd.DataFrame({
+        'timestamp': (end - np.arange(bars) * 300).astype(str),
+        'open': np.round(close * (1 + np_rng.normal(0, 0.001, bars)), 4),
+        'high': np.round(close * 1.002, 4),
+        'low': np.round(close * 0.998, 4),
+        'close': np.round(close, 4),
+        'volume': np_rng.integers(1000, 2_000_000, bars),
+    })
+    frame['timestamp'] = frame['timestamp'].str.replace('T', ' ')
+    path = os.path.join(WORK_DIR, 'intraday.csv')
+    frame.to_csv(path, index=False)
+    with open(path, 'rb') as f:
+        cache.put_file(csv_params(), f)
+    os.remove(path)
+
+
+def news_whole(db):
+    for window in news_windows():
+        store_news_sentiment(TICKER, fetch_news_sentiment(TICKER, *window, API_KEY), db)
+    return FEEDS * FEED_ARTICLES
+
+
+def news_streamed(db):
+    for window in news_windows():
+        store_news_sentiment(TICKER, fetch_news_stream(TICKER, *window, API_KEY), db)
+    return FEEDS * FEED_ARTICLES
+
+
+def intraday_whole(db):
+    df = fetch_intraday_data_bulk_csv(TICKER, API_KEY, INTERVAL)
+    return store_intraday_frame(apply_cutoff(frame_from_csv(df, TICKER)), db)
+
+
+def intraday_streamed(db):
+    return store_intraday_frames(fetch_intraday_csv_frames(TICKER, API_KEY, INTERVAL), db)
+
+
+PATHS = {
+    'news:whole': news_whole,
+    'news:streamed': news_streamed,
+    'intraday:whole': intraday_whole,
+    'intraday:streamed': intraday_streamed,
+}
+
+
+def measure(name, fn, traced):
+    path = os.path.join(WORK_DIR, f"{name.replace(':', '-')}.db")
+    for leftover in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    db = get_db(path)
+    with redirect_stdout(open(os.devnull, 'w')):
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        rows = fn(db)
+        db.flush()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traced else None
+        tracemalloc.stop()
+    db.close()
+    return rows, elapsed, peak
+
+
+def run(bars, regenerate=False):
+    os.makedirs(WORK_DIR, exist_ok=True)
+    marker = os.path.join(WORK_DIR, 'fixtures.json')
+    fixtures = {'bars': bars, 'feeds': FEEDS, 'articles': FEED_ARTICLES}
+    if regenerate or not os.path.exists(marker) or json.load(open(marker)) != fixtures:
+        print(f"Writing synthetic responses ({bars} bars, {FEEDS} x {FEED_ARTICLES} articles).")
+        write_fixtures(bars)
+        with open(marker, 'w') as f:
+            json.dump(fixtures, f)
+
+    results = {}
+    for name, fn in PATHS.items():
+        rows, elapsed, _ = measure(name, fn, traced=False)
+        _, _, peak = measure(name, fn, traced=True)
+        results[name] = {'rows': rows, 'seconds': elapsed, 'rows_per_s': rows / elapsed, 'peak_mb': peak / 2**20}
+        print(f"{name:<20} {rows:>9} rows {elapsed:>7.2f}s {rows / elapsed:>10.0f} rows/s  peak {peak / 2**20:>7.1f} MB")
+
+    report = {'commit': commit_id(), 'fixtures': fixtures, 'results': results}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, f"{report['commit']}-streaming.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    print(f"Written to {run(int(args[0]) if args else DEFAULT_BARS, regenerate='--regenerate' in sys.argv)}")
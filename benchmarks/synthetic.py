@@ -0,0 +1,231 @@
+# synthetic.py
+"""
+Synthetic finance_data.db for the benchmarks.
+
+Everything is written through the collectors' own store functions, so the
+derived tables (coverage, news_word_counts, ticker_sentiment_daily,
+financial_facts, sankey_edges) match what a real collection run produces.
+Payloads have the shape of the Alpha Vantage responses after parsing:
+
+    intraday     hourly bars 04:00-19:00 on weekdays, a random walk per ticker
+    news         `articles` articles per ticker-month, each also mentioning up
+                 to three other tickers, drawn with a Zipf-like weighting so a
+                 few hubs are mentioned everywhere
+    statements   annual and quarterly reports for every year
+
+The same seed always produces the same database.
+
+Usage:
+    python synthetic.py <path> [tickers]
+"""
+
+import calendar
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data-collection-scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from fetch_funcs import store_balance_sheet, store_cash_flow, store_income_statement, store_intraday_rows, store_news_sentiment
+from storage import get_db
+
+END_YEAR = 2024
+BATCH_SIZE = 500
+
+# Ticker counts the suite is run at; articles are per ticker-month
+SCALES = {
+    60: {'tickers': 60, 'years': 10, 'articles': 30},
+    500: {'tickers': 500, 'years': 10, 'articles': 20},
+    5000: {'tickers': 5000, 'years': 10, 'articles': 10},
+}
+
+SENTIMENT_LABELS = ((-0.35, 'Bearish'), (-0.15, 'Somewhat-Bearish'), (0.15, 'Neutral'),
+                    (0.35, 'Somewhat-Bullish'), (1.0, 'Bullish'))
+SOURCES = ('Benzinga', 'Motley Fool', 'Zacks Commentary', 'Reuters', 'CNBC', 'MarketWatch')
+TOPICS = ('Earnings', 'Technology', 'Financial Markets', 'Manufacturing', 'Economy - Monetary',
+          'Retail & Wholesale', 'Energy & Transportation', 'Life Sciences', 'Mergers & Acquisitions')
+FILLER = ('the', 'and', 'for', 'with', 'that', 'its', 'after', 'over', 'into', 'more')
+STATEMENT_TABLES = {
+    'income_statement': store_income_statement,
+    'balance_sheet': store_balance_sheet,
+    'cash_flow': store_cash_flow,
+}
+
+
+def symbols(count, prefix='S'):
+    return [f"{prefix}{i:04d}" for i in range(count)]
+
+
+def periods(years):
+    return [f"{year}-{month:02d}" for year in range(END_YEAR - years + 1, END_YEAR + 1) for month in range(1, 13)]
+
+
+def vocabulary(size=4000, seed=0):
+    """
+    Pronounceable pseudo-words, the word cloud's input, with stop words making
+    up about a fifth of the list.
+    """
+    rng = random.Random(seed)
+    syllables = [c + v for c in 'bcdfghklmnprstvz' for v in 'aeiou']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words) + list(FILLER) * (size // len(FILLER) // 4)
+
+
+def bar_times(period):
+    """
+    Epoch seconds of the hourly bars of a 'YYYY-MM' month.
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    return [calendar.timegm((year, month, day, hour, 0, 0))
+            for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            if calendar.weekday(year, month, day) < 5
+            for hour in range(4, 20)]
+
+
+def intraday_rows(ticker, period, rng, price=100.0):
+    """
+    store_intraday_rows rows for one month, and the closing price to continue from.
+    """
+    rows = []
+    for epoch in bar_times(period):
+        close = max(1.0, price * (1 + rng.gauss(0, 0.004)))
+        high = max(price, close) * (1 + rng.random() * 0.002)
+        low = min(price, close) * (1 - rng.random() * 0.002)
+        rows.append((ticker, epoch, price, high, low, close, int(rng.random() * 2_000_000) + 1000))
+        price = close
+    return rows, price
+
+
+def intraday_payload(ticker, period, rng):
+    """
+    One month of bars as parse_intraday_data returns them, for store_intraday_data.
+    """
+    rows, _ = intraday_rows(ticker, period, rng)
+    return [{
+        'symbol': ticker,
+        'datetime': datetime.utcfromtimestamp(epoch),
+        'open': str(open_), 'high': str(high), 'low': str(low), 'close': str(close), 'volume': str(volume),
+    } for ticker, epoch, open_, high, low, close, volume in rows]
+
+
+def sentiment(rng):
+    score = max(-1.0, min(1.0, rng.gauss(0.1, 0.25)))
+    label = next(label for bound, label in SENTIMENT_LABELS if score <= bound)
+    return f"{score:.6f}", label
+
+
+def news_feed(ticker, period, count, universe, weights, words, rng, url_prefix='https://news.example.com'):
+    """
+    A parsed NEWS_SENTIMENT response: `count` articles about ticker published
+    in period. URLs are unique per (url_prefix, ticker, period, index).
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    days = calendar.monthrange(year, month)[1]
+    feed = []
+    for index in range(count):
+        mentioned = {ticker, *rng.choices(universe, weights, k=rng.randint(0, 3))}
+        ticker_sentiment = []
+        for symbol in sorted(mentioned):
+            score, label = sentiment(rng)
+            ticker_sentiment.append({'ticker': symbol, 'relevance_score': f"{rng.random():.6f}",
+                                     'ticker_sentiment_score': score, 'ticker_sentiment_label': label})
+        score, label = sentiment(rng)
+        summary = ' '.join(rng.choices(words, k=rng.randint(25, 60)))
+        feed.append({
+            'title': f"{ticker} {' '.join(rng.choices(words, k=6))}",
+            'url': f"{url_prefix}/{ticker}/{period}/{index}",
+            'time_published': f"{year}{month:02d}{rng.randint(1, days):02d}T{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}00",
+            'authors': [f"Author {rng.randint(1, 500)}"],
+            'summary': summary,
+            'banner_image': None,
+            'source': rng.choice(SOURCES),
+            'category_within_source': 'n/a',
+            'source_domain': 'news.example.com',
+            'topics': [{'topic': topic, 'relevance_score': '0.5'} for topic in rng.sample(TOPICS, 2)],
+            'overall_sentiment_score': float(score),
+            'overall_sentiment_label': label,
+            'ticker_sentiment': ticker_sentiment,
+        })
+    return {'items': str(count), 'feed': feed}
+
+
+def statement_columns(db, table):
+    """
+    Amount columns of a statement table, i.e. the API fields store_* reads.
+    """
+    return [row[1] for row in db.cursor().execute(f"SELECT * FROM pragma_table_info('{table}')")
+            if row[1] not in ('symbol', 'fiscalDateEnding', 'reportType', 'reportedCurrency')]
+
+
+def statement_payload(ticker, columns, years, rng):
+    """
+    A statement response with annual and quarterly reports for `years` years.
+    """
+    def report(fiscal_date):
+        values = {column: str(rng.randint(-10**9, 10**11)) if rng.random() > 0.05 else 'None' for column in columns}
+        return {'fiscalDateEnding': fiscal_date, 'reportedCurrency': 'USD', **values}
+
+    first = END_YEAR - years + 1
+    return {
+        'symbol': ticker,
+        'annualReports': [report(f"{year}-12-31") for year in range(END_YEAR, first - 1, -1)],
+        'quarterlyReports': [report(f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}")
+                             for year in range(END_YEAR, first - 1, -1) for month in (12, 9, 6, 3)],
+    }
+
+
+def mention_weights(universe):
+    return [1 / (rank + 1) ** 0.8 for rank in range(len(universe))]
+
+
+def generate(path, tickers=60, years=10, articles=30, seed=0):
+    """
+    Writes a synthetic database to path (which must not exist yet).
+    Returns the number of rows stored per dataset.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    universe = symbols(tickers)
+    weights = mention_weights(universe)
+    words = vocabulary(seed=seed)
+    months = periods(years)
+    db = get_db(path, BATCH_SIZE)
+    columns = {table: statement_columns(db, table) for table in STATEMENT_TABLES}
+    counts = {'bars': 0, 'articles': 0, 'reports': 0}
+    started = time.monotonic()
+    # The store functions log every call
+    with open(os.devnull, 'w') as devnull:
+        for number, ticker in enumerate(universe, 1):
+            with redirect_stdout(devnull):
+                price = 100.0
+                for period in months:
+                    rows, price = intraday_rows(ticker, period, rng, price)
+                    store_intraday_rows(rows, {(ticker, 'intraday', period): len(rows)}, db)
+                    counts['bars'] += len(rows)
+                    store_news_sentiment(ticker, news_feed(ticker, period, articles, universe, weights, words, rng), db)
+                    counts['articles'] += articles
+                for table, store in STATEMENT_TABLES.items():
+                    payload = statement_payload(ticker, columns[table], years, rng)
+                    store(payload, db)
+                    counts['reports'] += len(payload['annualReports']) + len(payload['quarterlyReports'])
+            if number % 10 == 0 or number == len(universe):
+                print(f"[synthetic] {number}/{len(universe)} tickers, {counts['bars']} bars, "
+                      f"{counts['articles']} articles in {time.monotonic() - started:.0f}s")
+    db.close()
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python synthetic.py <path> [tickers]")
+    scale = SCALES.get(int(sys.argv[2]) if len(sys.argv) > 2 else 60)
+    if scale is None:
+        raise SystemExit(f"Unknown scale, expected one of {', '.join(map(str, SCALES))}")
+    print(generate(sys.argv[1], **scale))
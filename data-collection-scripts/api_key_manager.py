@@ -4,6 +4,8 @@ import os
 from alpha_vantage_keygen import generate_api_key
 from dotenv import load_dotenv, set_key
 from helpers import connect_nordvpn, disconnect_nordvpn
+import metrics
+from response_cache import replay_mode
 
 ENV_FILE = ".env"
 ENV_VAR_NAME = "API_KEY_ALPHAVANTAGE_sbabel_umass_edu"
@@ -15,6 +17,9 @@ class APIKeyManager:
     def __init__(self):
         self.api_keys = os.getenv(ENV_VAR_NAME, '').split(',')
         self.api_keys = [key.strip() for key in self.api_keys if key.strip()]
+        # Replayed responses never reach the API, so no real key is needed
+        if not self.api_keys and replay_mode():
+            self.api_keys = ['replay']
         if not self.api_keys:
             raise ValueError(f"No API keys found in the environment variable '{ENV_VAR_NAME}'.")
         self.index = 0
@@ -28,6 +33,8 @@ class APIKeyManager:
         return self.get_current_key()
 
     def add_new_key(self):
+        if replay_mode():
+            return None
         print("[APIKeyManager] Generating new API key...")
         new_key = generate_api_key()
         if new_key:
@@ -43,12 +50,15 @@ class APIKeyManager:
             return None
 
     def reconnect_vpn(self):
+        if replay_mode():
+            return
         print("[APIKeyManager] Rotating VPN...")
         disconnect_nordvpn()
         connect_nordvpn()
 
     def handle_failure_and_continue(self):
         # Rotate key and change IP, then return new working key
+        metrics.inc('retries_total', reason='key_rotation')
         self.rotate_key()
         self.reconnect_vpn()
 
@@ -0,0 +1,366 @@
+# async_fetch.py
+"""
+Asyncio fetch engine for the Alpha Vantage collectors.
+
+Runs many TIME_SERIES_INTRADAY, NEWS_SENTIMENT and statement requests in flight
+over one pooled aiohttp session, while a per-key token bucket scheduler keeps
+every API key inside its calls-per-minute and calls-per-day quota.
+
+Results follow the same contract as fetch_funcs ('data exists', 'no data',
+'limit reached' or the parsed list/dict), so the collector loops can be swapped
+onto it. A call that still fails after max_attempts returns 'error' rather
+than 'no data', so the job is retried instead of recorded as empty. Point
+base_url at a local stub server to exercise it offline.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from fetch_funcs import (
+    check_existing_news,
+    intraday_month_exists,
+    parse_intraday_data,
+    parse_news_sentiment,
+    parse_statement,
+    statement_exists,
+    store_financial_data,
+    store_intraday_data,
+)
+import metrics
+from news_windows import WindowSplit, empty_result, store_news_windows
+
+from response_cache import get_cache, is_rate_limited
+
+BASE_URL = "https://www.alphavantage.co/query"
+
+# Documented free tier quota, override per deployment
+CALLS_PER_MINUTE = 5
+CALLS_PER_DAY = 25
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills `capacity`
+    tokens every `period` seconds.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    def try_take(self):
+        """
+        Takes a token if one is available. Returns 0 on success, otherwise the
+        number of seconds until the next token will be available.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) * self.period / self.capacity
+
+
+class KeyScheduler:
+    """
+    Hands out API keys so each key stays inside both its per-minute and its
+    per-day quota. Keys that report a rate limit are parked until the daily
+    window rolls over.
+    """
+
+    def __init__(self, api_keys, calls_per_minute=CALLS_PER_MINUTE, calls_per_day=CALLS_PER_DAY):
+        if not api_keys:
+            raise ValueError("KeyScheduler needs at least one API key.")
+        self.api_keys = list(api_keys)
+        self.minute = {key: TokenBucket(calls_per_minute, 60) for key in self.api_keys}
+        self.day = {key: TokenBucket(calls_per_day, 24 * 60 * 60) for key in self.api_keys}
+        self.parked_until = {}
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until some key has quota left and returns it.
+        """
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                waits = []
+                for key in self.api_keys:
+                    if self.parked_until.get(key, 0) > now:
+                        waits.append(self.parked_until[key] - now)
+                        continue
+                    # Only spend the daily token once the minute bucket allows the call
+                    minute_wait = self.minute[key].try_take()
+                    if minute_wait:
+                        waits.append(minute_wait)
+                        continue
+                    day_wait = self.day[key].try_take()
+                    if day_wait:
+                        self.minute[key].tokens += 1
+                        waits.append(day_wait)
+                        continue
+                    return key
+            await asyncio.sleep(min(waits))
+
+    def park(self, key, seconds=24 * 60 * 60):
+        """
+        Stops handing out a key that the API reported as rate limited.
+        """
+        print(f"[KeyScheduler] Key {key[:10]}... hit its quota, parking for {seconds}s")
+        self.parked_until[key] = time.monotonic() + seconds
+
+
+class AsyncFetcher:
+    """
+    Shared aiohttp session plus key scheduler. Use as an async context manager:
+
+        async with AsyncFetcher(api_keys) as fetcher:
+            results = await fetcher.gather(fetcher.fetch_intraday(t, y, m) for ...)
+    """
+
+    def __init__(self, api_keys, base_url=BASE_URL, max_in_flight=8,
+                 calls_per_minute=CALLS_PER_MINUTE, calls_per_day=CALLS_PER_DAY, max_attempts=3):
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.scheduler = KeyScheduler(api_keys, calls_per_minute, calls_per_day)
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def get_json(self, params):
+        """
+        Issues one API call with a scheduled key. Rate limited keys are parked and
+        the call is retried on another key. Cached responses are returned without
+        spending a key. Returns the JSON body, or None if every attempt failed.
+        """
+        cache = get_cache()
+        function = params.get('function')
+        body = cache.get(params)
+        if body is not None:
+            metrics.inc('av_requests_total', function=function, source='cache')
+            with metrics.timer('json_decode_seconds', function=function):
+                return json.loads(body)
+        if cache.mode == 'replay':
+            print(f"[ResponseCache] Replay miss for {cache.request_params(params)}")
+            metrics.inc('av_requests_total', function=function, source='replay_miss')
+            return None
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                metrics.inc('retries_total', reason='async_request')
+            api_key = await self.scheduler.acquire()
+            try:
+                # Includes waiting for a free connection, like the caller does
+                with metrics.timer('av_request_seconds', function=function):
+                    async with self.session.get(self.base_url, params={**params, "apikey": api_key}) as response:
+                        if response.status != 200:
+                            print(f"Request {function} failed. Status code: {response.status}")
+                            continue
+                        body = await response.read()
+                metrics.inc('av_requests_total', function=function, source='network')
+                metrics.observe('av_response_bytes', len(body), function=function)
+                with metrics.timer('json_decode_seconds', function=function):
+                    data = json.loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Error fetching {function} for {params.get('symbol') or params.get('tickers')}: {e}")
+                continue
+
+            if is_rate_limited(data):
+                metrics.inc('av_rate_limited_total', function=function)
+                self.scheduler.park(api_key)
+                continue
+            cache.put(params, body)
+            return data
+        return None
+
+    async def fetch_intraday(self, ticker, year, month, interval='60min'):
+        if intraday_month_exists(ticker, year, month):
+            return 'data exists'
+        print(f"Fetching data for {ticker} for {year}-{month:02d}...")
+        data = await self.get_json({
+            "function": "TIME_SERIES_INTRADAY",
+            "symbol": ticker,
+            "interval": interval,
+            "month": f"{year}-{month:02d}",
+        })
+        if data is None:
+            return 'error'
+        return parse_intraday_data(ticker, data, interval)
+
+    async def fetch_news(self, ticker, time_from, time_to):
+        data = await self.get_json({
+            "function": "NEWS_SENTIMENT",
+            "tickers": ticker,
+            "time_from": time_from,
+            "time_to": time_to,
+            "sort": "RELEVANCE",
+            "limit": 1000,
+        })
+        if data is None:
+            return "error"
+        return parse_news_sentiment(ticker, data)
+
+
+    async def fetch_statement(self, function, ticker):
+        if statement_exists(function, ticker):
+            return 'data exists'
+        print(f"Fetching data for {ticker} for function {function}...")
+        data = await self.get_json({"function": function, "symbol": ticker})
+        if data is None:
+            return 'error'
+        if 'symbol' not in data:
+            return 'no data'
+        return parse_statement(data)
+
+    async def gather(self, coros):
+        """
+        Runs coroutines concurrently; concurrency is bounded by the connector
+        pool and pacing by the key scheduler.
+        """
+        return await asyncio.gather(*coros)
+
+
+async def collect_intraday(api_keys, tickers, years, months=range(1, 13), **fetcher_options):
+    """
+    Async counterpart of company-intraday-60min.py. Stores each month as soon as
+    it arrives and returns {(ticker, year, month): status}.
+    """
+    statuses = {}
+
+    async def one(fetcher, ticker, year, month):
+        result = await fetcher.fetch_intraday(ticker, year, month)
+        if isinstance(result, list):
+            store_intraday_data(result)
+            statuses[(ticker, year, month)] = 'stored'
+        else:
+            statuses[(ticker, year, month)] = result
+
+    async with AsyncFetcher(api_keys, **fetcher_options) as fetcher:
+        await fetcher.gather(one(fetcher, t, y, m) for t in tickers for y in years for m in months)
+    return statuses
+
+
+def month_windows(tickers, years):
+    """
+    Yields (ticker, time_from, time_to) NEWS_SENTIMENT windows, one per calendar month.
+    """
+    now = datetime.now()
+    for ticker in tickers:
+        for year in years:
+            for month in range(1, 13):
+                if (year, month) > (now.year, now.month):
+                    continue
+                start_date = datetime(year, month, 1)
+                end_date = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+                yield ticker, start_date.strftime("%Y%m%dT0000"), end_date.strftime("%Y%m%dT2359")
+
+
+async def collect_news(api_keys, windows, db=None, planner=None, **fetcher_options):
+    """
+    Async counterpart of company-news.py. `windows` is an iterable of
+    (ticker, time_from, time_to) tuples. They are requested in waves of
+    max_in_flight, and each wave re-checks the coverage (through
+    planner.should_fetch if a news_planner.NewsPlanner is given) so windows
+    covered by earlier feeds are skipped.
+    """
+    statuses = {}
+
+    async def one(fetcher, ticker, time_from, time_to):
+        # Saturated windows are fetched again as weeks, then days
+        split = WindowSplit(ticker, time_from, time_to)
+        while split.level:
+            split.add(await fetcher.gather(fetcher.fetch_news(ticker, *window) for window in split.level))
+        result = split.result()
+        if isinstance(result, dict):
+            store_news_windows(ticker, result, db)
+            statuses[(ticker, time_from)] = 'stored'
+        else:
+            if result == "no data":
+                store_news_windows(ticker, empty_result(time_from, time_to), db)
+            statuses[(ticker, time_from)] = result
+
+
+    async with AsyncFetcher(api_keys, **fetcher_options) as fetcher:
+        windows = list(windows)
+        for start in range(0, len(windows), fetcher.max_in_flight):
+            wave = []
+            for ticker, time_from, time_to in windows[start:start + fetcher.max_in_flight]:
+                if planner is not None:
+                    covered = not planner.should_fetch(ticker, f"{time_from[:4]}-{time_from[4:6]}")
+                else:
+                    covered = check_existing_news(ticker, time_from, time_to) == "data exists"
+                if covered:
+                    statuses[(ticker, time_from)] = 'data exists'
+                else:
+                    wave.append((ticker, time_from, time_to))
+            await fetcher.gather(one(fetcher, *window) for window in wave)
+    return statuses
+
+
+async def collect_statements(api_keys, tickers, **fetcher_options):
+    """
+    Async counterpart of company-financial-statements.py.
+    """
+    statuses = {}
+
+    async def one(fetcher, ticker):
+        income_statement, balance_sheet, cash_flow = await fetcher.gather([
+            fetcher.fetch_statement('INCOME_STATEMENT', ticker),
+            fetcher.fetch_statement('BALANCE_SHEET', ticker),
+            fetcher.fetch_statement('CASH_FLOW', ticker),
+        ])
+        if 'error' in (income_statement, balance_sheet, cash_flow):
+            statuses[ticker] = 'error'
+            return
+        statuses[ticker] = store_financial_data(ticker, income_statement, balance_sheet, cash_flow) or 'stored'
+
+    async with AsyncFetcher(api_keys, **fetcher_options) as fetcher:
+        await fetcher.gather(one(fetcher, ticker) for ticker in tickers)
+    return statuses
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from api_key_manager import APIKeyManager
+
+    dataset = sys.argv[1] if len(sys.argv) > 1 else 'intraday'
+    key_manager = APIKeyManager()
+
+    conn = sqlite3.connect('company_overview.db')
+    tickers = [row[0] for row in conn.execute('SELECT DISTINCT Symbol FROM company_overview') if row[0] != 'PLTR']
+    conn.close()
+
+    if dataset == 'intraday':
+        results = asyncio.run(collect_intraday(key_manager.api_keys, tickers, range(2016, 2025)))
+    elif dataset == 'news':
+        from coverage_index import month_periods
+        from news_planner import NewsPlanner, period_window
+        from storage import get_db
+
+        planner = NewsPlanner(get_db(), tickers)
+        periods = [period for period in month_periods(range(2016, 2025)) if period <= datetime.now().strftime('%Y-%m')]
+        windows = [(ticker, *period_window(period)) for ticker, period in planner.windows(periods)]
+        results = asyncio.run(collect_news(key_manager.api_keys, windows, planner=planner))
+    elif dataset == 'statements':
+        results = asyncio.run(collect_statements(key_manager.api_keys, tickers))
+    else:
+        raise SystemExit(f"Unknown dataset '{dataset}', expected 'intraday', 'news' or 'statements'")
+    print(f"Finished {len(results)} {dataset} jobs.")
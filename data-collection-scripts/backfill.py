@@ -0,0 +1,260 @@
+# backfill.py
+"""
+Multi-process intraday backfill.
+
+The ticker universe (company_overview.db, or data/top60tickers.txt before the
+overview has been collected) is split into one shard per ticker holding the
+months that are not covered yet. Shards run on a ProcessPoolExecutor: each
+worker fetches its months (from the response cache when possible) and parses
+them into compact column buffers, one array per column instead of a dict per
+bar. A single writer process drains the buffers into finance_data.db, so
+SQLite still sees one writer.
+
+Network requests, not cache hits, go through one SharedRateLimit, so the
+combined request rate of all workers stays under calls_per_minute. Calls are
+spread round-robin over the API keys.
+
+Usage:
+    python backfill.py [workers] [calls_per_minute]
+
+With AV_CACHE_MODE=replay no request leaves the machine and ingestion of the
+cached responses is limited only by the cores and the writer.
+"""
+
+import calendar
+import json
+import multiprocessing as mp
+import os
+import queue
+import sqlite3
+import sys
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+
+from coverage_index import get_coverage, month_periods
+from fetch_funcs import store_intraday_rows
+from response_cache import av_get, get_cache, is_rate_limited
+from storage import BATCH_SIZE, DB_PATH, get_db
+
+YEARS = range(2016, 2025)
+OVERVIEW_DB = 'company_overview.db'
+TICKERS_FILE = 'data/top60tickers.txt'
+INTERVAL = '60min'
+QUEUE_SIZE = 64
+
+# Free tier quota per key, as in async_fetch
+CALLS_PER_MINUTE = 5
+
+
+class SharedRateLimit:
+    """
+    Spaces requests 60 / calls_per_minute seconds apart across every process
+    it was handed to.
+    """
+
+    def __init__(self, calls_per_minute, ctx=mp):
+        self.interval = 60.0 / calls_per_minute
+        self.next_slot = ctx.Value('d', 0.0)
+        self.calls = ctx.RawValue('q', 0)
+
+    def wait(self):
+        """
+        Blocks until the caller's slot and returns its global call number.
+        """
+        with self.next_slot.get_lock():
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+            call = self.calls.value
+            self.calls.value += 1
+        time.sleep(max(0.0, slot - now))
+        return call
+
+
+def load_tickers(overview_db=OVERVIEW_DB, tickers_file=TICKERS_FILE):
+    """
+    Symbols to backfill, without PLTR like the other collectors.
+    """
+    if os.path.exists(overview_db):
+        conn = sqlite3.connect(overview_db)
+        try:
+            tickers = [row[0] for row in conn.execute('SELECT DISTINCT Symbol FROM company_overview')]
+        finally:
+            conn.close()
+    else:
+        with open(tickers_file) as f:
+            tickers = [ticker.strip().strip("'").strip('"') for ticker in f.read().split(',') if ticker.strip()]
+    return [ticker for ticker in tickers if ticker != 'PLTR']
+
+
+def plan_shards(tickers, years=YEARS, db_path=DB_PATH):
+    """
+    {ticker: ['YYYY-MM', ...]} of the months not covered yet.
+    """
+    db = get_db(db_path)
+    coverage = get_coverage(db)
+    # The writer process updates the table, not this process's cached index
+    coverage.load(db)
+    missing = coverage.missing(tickers, 'intraday', month_periods(years))
+    # Closed before any process starts, nothing inherits the connection
+    db.close()
+    shards = {}
+    for ticker, period in missing:
+        shards.setdefault(ticker, []).append(period)
+    return shards
+
+
+def parse_intraday_buffers(data, interval=INTERVAL):
+    """
+    Parses a TIME_SERIES_INTRADAY response into (epochs, prices, volumes):
+    array('q') of epoch seconds (as fetch_funcs.to_epoch), array('d') of
+    open, high, low, close per bar, and array('q') of volumes. Returns None if
+    the series is missing.
+    """
+    series = data.get(f'Time Series ({interval})')
+    if not series:
+        return None
+    epochs, prices, volumes = array('q'), array('d'), array('q')
+    timegm = calendar.timegm
+    for timestamp, values in series.items():
+        # 'YYYY-MM-DD HH:MM:SS', sliced instead of strptime
+        epochs.append(timegm((int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                              int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))))
+        prices.extend((float(values['1. open']), float(values['2. high']),
+                       float(values['3. low']), float(values['4. close'])))
+        volumes.append(int(float(values['5. volume'])))
+    return epochs, prices, volumes
+
+
+def buffer_rows(ticker, epochs, prices, volumes):
+    """
+    store_intraday_rows rows for one month of buffers.
+    """
+    return list(zip(repeat(ticker), epochs, prices[0::4], prices[1::4], prices[2::4], prices[3::4], volumes))
+
+
+# Set in every worker process by _init_worker
+_payloads = None
+_rate_limit = None
+_api_keys = ()
+
+
+def _init_worker(payloads, rate_limit, api_keys):
+    global _payloads, _rate_limit, _api_keys
+    _payloads, _rate_limit, _api_keys = payloads, rate_limit, api_keys
+
+
+def fetch_month(ticker, period, interval=INTERVAL):
+    """
+    Response body for one month, from the cache or rate limited from the API.
+    """
+    params = {'function': 'TIME_SERIES_INTRADAY', 'symbol': ticker, 'interval': interval, 'month': period}
+    cache = get_cache()
+    body = cache.get(params)
+    if body is not None:
+        return body
+    if cache.mode != 'replay':
+        call = _rate_limit.wait()
+        params['apikey'] = _api_keys[call % len(_api_keys)]
+    return av_get(params).content
+
+
+def backfill_shard(ticker, periods):
+    """
+    Fetches and parses the given months of one ticker and queues their buffers
+    for the writer. Returns a Counter of outcomes.
+    """
+    outcomes = Counter()
+    for period in periods:
+        try:
+            data = json.loads(fetch_month(ticker, period))
+        except Exception as e:
+            print(f"[backfill] {ticker} {period} failed: {e}")
+            outcomes['failed'] += 1
+            continue
+        if is_rate_limited(data):
+            outcomes['limit reached'] += 1
+            continue
+        buffers = parse_intraday_buffers(data)
+        if buffers is None:
+            outcomes['no data'] += 1
+            continue
+        # Blocks while the writer is behind
+        _payloads.put((ticker, period, *buffers))
+        outcomes['stored'] += 1
+        outcomes['bars'] += len(buffers[0])
+    return outcomes
+
+
+def write_loop(payloads, db_path=DB_PATH, batch_size=BATCH_SIZE):
+    """
+    Single writer: stores queued buffers until it receives None.
+    """
+    db = get_db(db_path, batch_size)
+    try:
+        while True:
+            try:
+                item = payloads.get_nowait()
+            except queue.Empty:
+                # Commit before waiting on the fetch workers
+                db.flush()
+                item = payloads.get()
+            if item is None:
+                return
+            ticker, period, epochs, prices, volumes = item
+            try:
+                store_intraday_rows(buffer_rows(ticker, epochs, prices, volumes),
+                                    {(ticker, 'intraday', period): len(epochs)}, db)
+            except Exception as e:
+                print(f"[backfill] write {ticker} {period} failed: {e}")
+    finally:
+        db.close()
+
+
+def backfill(shards, workers=None, calls_per_minute=CALLS_PER_MINUTE, api_keys=(),
+             db_path=DB_PATH, batch_size=BATCH_SIZE):
+    """
+    Runs every shard on `workers` processes (default: one per core) plus the
+    writer process. Returns the combined Counter of outcomes.
+    """
+    if not api_keys and get_cache().mode != 'replay':
+        raise ValueError("API keys are required unless AV_CACHE_MODE=replay")
+    ctx = mp.get_context('spawn')
+    payloads = ctx.Queue(maxsize=QUEUE_SIZE)
+    rate_limit = SharedRateLimit(calls_per_minute, ctx)
+    writer = ctx.Process(target=write_loop, args=(payloads, db_path, batch_size), name='backfill-writer')
+    writer.start()
+    outcomes = Counter()
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count(), mp_context=ctx, initializer=_init_worker,
+                                 initargs=(payloads, rate_limit, tuple(api_keys))) as pool:
+            futures = [pool.submit(backfill_shard, ticker, periods) for ticker, periods in shards.items()]
+            for future in as_completed(futures):
+                outcomes.update(future.result())
+    finally:
+        payloads.put(None)
+        writer.join()
+    return outcomes
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+
+    api_keys = ()
+    if get_cache().mode != 'replay':
+        from api_key_manager import APIKeyManager
+        api_keys = tuple(APIKeyManager().api_keys)
+    calls_per_minute = float(sys.argv[2]) if len(sys.argv) > 2 else CALLS_PER_MINUTE * max(len(api_keys), 1)
+
+    shards = plan_shards(load_tickers())
+    print(f"Backfilling {sum(len(periods) for periods in shards.values())} months of {len(shards)} tickers "
+          f"on {workers} workers, at most {calls_per_minute:g} API calls per minute.")
+    started = time.monotonic()
+    outcomes = backfill(shards, workers, calls_per_minute, api_keys)
+    elapsed = time.monotonic() - started
+    print(f"{outcomes['stored']} months ({outcomes['bars']} bars) stored, {outcomes['no data']} without data, "
+          f"{outcomes['limit reached']} rate limited, {outcomes['failed']} failed in {elapsed:.1f}s "
+          f"({outcomes['bars'] / max(elapsed, 1e-9):.0f} bars/s)")
@@ -0,0 +1,135 @@
+# bulk_loader.py
+"""
+Vectorized intraday loading.
+
+Responses are parsed column-wise into typed pandas/NumPy columns (int64 epoch
+seconds, float64 prices, int64 volume) instead of one dict per bar, frames are
+collected in a list and concatenated once, and the result is written into
+company_intraday_data with a single executemany over column tuples.
+
+Usage:
+    python bulk_loader.py all_tickers_data.csv [more.csv ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from coverage_index import get_coverage
+from fetch_funcs import INTRADAY_UPSERT, recount_intraday_coverage
+import intraday_pyramid
+import ohlcv_store
+from storage import get_db
+
+FRAME_COLUMNS = ['symbol', 'datetime', 'open', 'high', 'low', 'close', 'volume']
+
+JSON_COLUMNS = {
+    '1. open': 'open',
+    '2. high': 'high',
+    '3. low': 'low',
+    '4. close': 'close',
+    '5. volume': 'volume',
+}
+
+CUTOFF_DATE = "2016-01-01"
+
+
+def typed_frame(symbols, timestamps, open_, high, low, close, volume):
+    """
+    Builds the canonical intraday frame. Timestamps are converted to epoch
+    seconds the same way fetch_funcs.to_epoch does (wall-clock read as UTC).
+    """
+    epoch = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    return pd.DataFrame({
+        'symbol': symbols,
+        'datetime': epoch,
+        'open': pd.to_numeric(open_, errors='coerce').astype(np.float64),
+        'high': pd.to_numeric(high, errors='coerce').astype(np.float64),
+        'low': pd.to_numeric(low, errors='coerce').astype(np.float64),
+        'close': pd.to_numeric(close, errors='coerce').astype(np.float64),
+        'volume': pd.to_numeric(volume, errors='coerce').fillna(0).astype(np.int64),
+    }, columns=FRAME_COLUMNS)
+
+
+def frame_from_json(ticker, data, interval='60min'):
+    """
+    Column-wise parse of a TIME_SERIES_INTRADAY JSON response. Returns an empty
+    frame if the series is missing.
+    """
+    series = data.get(f'Time Series ({interval})') if isinstance(data, dict) else None
+    if not series:
+        return pd.DataFrame(columns=FRAME_COLUMNS)
+    raw = pd.DataFrame.from_dict(series, orient='index').rename(columns=JSON_COLUMNS)
+    return typed_frame(ticker, raw.index, raw['open'], raw['high'], raw['low'], raw['close'], raw['volume'])
+
+
+def frame_from_csv(df, ticker=None):
+    """
+    Converts a datatype=csv response (timestamp, open, high, low, close, volume)
+    or a CSV previously written by company-intraday-bulk.py (which adds a
+    ticker column) into the canonical frame.
+    """
+    if 'timestamp' not in df.columns:
+        return pd.DataFrame(columns=FRAME_COLUMNS)
+    symbols = df['ticker'].to_numpy() if ticker is None else ticker
+    return typed_frame(symbols, df['timestamp'], df['open'], df['high'], df['low'], df['close'], df['volume'])
+
+
+def apply_cutoff(frame, cutoff_date=CUTOFF_DATE):
+    cutoff = int(pd.Timestamp(cutoff_date).timestamp())
+    return frame[frame['datetime'].to_numpy() >= cutoff]
+
+
+def store_intraday_frame(frame, db=None):
+    """
+    Upserts a canonical frame in one unit, in key order so the b-tree is
+    appended to rather than split. Coverage comes from the frame itself; only
+    months that already held bars are recounted in SQL. Returns rows written.
+    """
+    if frame.empty:
+        return 0
+    db = db or get_db()
+    if db.legacy_intraday:
+        raise RuntimeError("company_intraday_data has not been migrated yet, run migrate_intraday.py first.")
+    coverage = get_coverage(db)
+
+    frame = frame.drop_duplicates(['symbol', 'datetime'], keep='last').sort_values(['symbol', 'datetime'])
+    # Bucket by month in NumPy and format only the distinct (symbol, month) keys
+    months = frame['datetime'].to_numpy().astype('datetime64[s]').astype('datetime64[M]')
+    counts = frame.groupby([frame['symbol'].to_numpy(), months]).size()
+    entries = {(symbol, 'intraday', str(month)[:7]): int(count) for (symbol, month), count in counts.items()}
+    existing = [key for key in entries if coverage.has(*key)]
+
+    # tolist() hands sqlite3 native ints/floats instead of NumPy scalars
+    rows = zip(*(frame[column].tolist() for column in FRAME_COLUMNS))
+    with db.unit() as cursor:
+        cursor.executemany(INTRADAY_UPSERT, rows)
+        entries.update(recount_intraday_coverage(cursor, existing))
+        coverage.record(db, cursor, entries, replace=True)
+        ohlcv_store.record_frame(db, frame)
+        intraday_pyramid.record_frame(db, frame)
+    db.flush()
+    return len(frame)
+
+
+def load_csv_files(paths, db=None, cutoff_date=CUTOFF_DATE):
+    """
+    Loads CSV files already on disk into company_intraday_data.
+    """
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path)
+        frames.append(apply_cutoff(frame_from_csv(df), cutoff_date))
+    if not frames:
+        return 0
+    return store_intraday_frame(pd.concat(frames, ignore_index=True), db)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python bulk_loader.py file.csv [more.csv ...]")
+    started = time.perf_counter()
+    written = load_csv_files(sys.argv[1:])
+    print(f"Loaded {written} bars in {time.perf_counter() - started:.1f}s")
@@ -2,6 +2,9 @@ from fetch_funcs import fetch_income_statement, fetch_balance_sheet, fetch_cash_
 from helpers import connect_nordvpn, disconnect_nordvpn
 import sqlite3
 from api_key_manager import APIKeyManager
+from coverage_index import ALL_PERIODS
+from job_queue import JobQueue
+from storage import get_db
 
 # Initialize API key manager
 key_manager = APIKeyManager()
@@ -10,35 +13,38 @@ key_manager = APIKeyManager()
 conn = sqlite3.connect('company_overview.db')
 cursor = conn.cursor()
 cursor.execute('SELECT DISTINCT Symbol FROM company_overview')
-tickers = [row[0] for row in cursor.fetchall()]
+tickers = [row[0] for row in cursor.fetchall() if row[0] != 'PLTR']
 
-for ticker in tickers:
-    if ticker == 'PLTR':
-        continue
-    
+# Queue every ticker once; finished tickers are never queued again
+db = get_db()
+job_queue = JobQueue()
+print(f"Queued {job_queue.enqueue('statements', [(ticker, ALL_PERIODS) for ticker in tickers])} new statement jobs.")
+
+for job in job_queue.jobs('statements'):
+    ticker = job.symbol
     success = False
     attempts = 0
     max_attempts = len(key_manager.api_keys)
-    
+
     while not success and attempts < max_attempts:
         api_key = key_manager.get_current_key()
         print(f"Fetching financial statements for {ticker} using key: {api_key}")
-        
+
         income_statement = fetch_income_statement(ticker, api_key)
         balance_sheet = fetch_balance_sheet(ticker, api_key)
         cash_flow = fetch_cash_flow(ticker, api_key)
-        
+
         if income_statement == 'data exists' and balance_sheet == 'data exists' and cash_flow == 'data exists':
             print(f"Financial data already exists for {ticker}. Skipping.")
             success = True  # Mark as success to skip further attempts
         elif income_statement != 'no data' and balance_sheet != 'no data' and cash_flow != 'no data':
-            store_financial_data(ticker, income_statement, balance_sheet, cash_flow)
+            store_financial_data(ticker, income_statement, balance_sheet, cash_flow, db)
             success = True
         else:
             print(f"No financial data returned for {ticker}. Rotating key and changing VPN.")
             key_manager.handle_failure_and_continue()
             attempts += 1
-    
+
     if not success:
         print(f"All keys failed for {ticker}, generating a new key...")
         new_key = key_manager.fallback_to_new_key()
@@ -49,9 +55,18 @@ for ticker in tickers:
             cash_flow = fetch_cash_flow(ticker, new_key)
             if income_statement == 'data exists' and balance_sheet == 'data exists' and cash_flow == 'data exists':
                 print(f"Financial data already exists for {ticker}. Skipping.")
-                continue
+                success = True
             elif income_statement != 'no data' and balance_sheet != 'no data' and cash_flow != 'no data':
-                store_financial_data(ticker, income_statement, balance_sheet, cash_flow)
+                store_financial_data(ticker, income_statement, balance_sheet, cash_flow, db)
                 print("Success with new key.")
-                continue
+                success = True
+
+    if success:
+        job_queue.complete(job, db)
+    else:
         print(f"Skipping {ticker} after exhausting all options.")
+        job_queue.fail(job, 'no data after exhausting all keys')
+
+# Each store was committed and its job marked done as it went; only the connections are left
+db.close()
+job_queue.close()
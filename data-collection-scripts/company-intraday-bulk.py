@@ -1,8 +1,10 @@
 from fetch_funcs import fetch_intraday_data_bulk_csv
+from bulk_loader import apply_cutoff, frame_from_csv, store_intraday_frame
 from helpers import connect_nordvpn, disconnect_nordvpn
 import sqlite3
 import pandas as pd
 from api_key_manager import APIKeyManager
+from streaming import STREAMING, fetch_intraday_csv_frames, store_intraday_frames
 
 # Initialize API key manager
 key_manager = APIKeyManager()
@@ -16,8 +18,10 @@ tickers = [row[0] for row in cursor.fetchall()]
 # Define the cutoff date
 cutoff_date = "2016-01-01"
 
-# Initialize an empty DataFrame to hold all the data
-all_data = pd.DataFrame()
+# Collect one typed frame per ticker and concatenate once at the end; with
+# AV_STREAMING=1 each response is instead stored chunk by chunk as it is read
+frames = []
+streamed = 0
 
 # Loop through each ticker
 for ticker in tickers:
@@ -32,6 +36,18 @@ for ticker in tickers:
         # Connect to VPN for each attempt (if needed)
         # connect_nordvpn()
         
+        if STREAMING:
+            written = store_intraday_frames(fetch_intraday_csv_frames(ticker, api_key, cutoff_date=cutoff_date))
+            if written:
+                success = True
+                streamed += written
+                print(f"Stored {written} bars for {ticker}")
+            else:
+                print(f"No data returned for {ticker}. Rotating key.")
+                key_manager.handle_failure_and_continue()
+                attempts += 1
+            continue
+
         # Fetch data for the ticker
         intraday_data = fetch_intraday_data_bulk_csv(ticker, api_key)
         
@@ -48,15 +64,8 @@ for ticker in tickers:
             success = True
             print(f"Successfully fetched data for {ticker}")
             
-            # Convert timestamp to datetime and filter based on cutoff date
-            intraday_data["timestamp"] = pd.to_datetime(intraday_data["timestamp"])
-            intraday_data = intraday_data[intraday_data["timestamp"] >= cutoff_date]
-            
-            # Add the ticker symbol to the data
-            intraday_data["ticker"] = ticker
-
-            # Append the data to the all_data DataFrame
-            all_data = pd.concat([all_data, intraday_data], ignore_index=True)
+            # Parse column-wise and filter based on cutoff date
+            frames.append(apply_cutoff(frame_from_csv(intraday_data, ticker), cutoff_date))
 
         else:
             # If no data is returned, rotate the API key and disconnect VPN
@@ -70,26 +79,29 @@ for ticker in tickers:
         new_key = key_manager.fallback_to_new_key()
         if new_key:
             print("Retrying with new key...")
+            if STREAMING:
+                written = store_intraday_frames(fetch_intraday_csv_frames(ticker, new_key, cutoff_date=cutoff_date))
+                streamed += written
+                print(f"Stored {written} bars for {ticker}" if written else f"Skipping {ticker} after exhausting all options.")
+                continue
             # Retry fetching the data with the new API key
             intraday_data = fetch_intraday_data_bulk_csv(ticker, new_key)
 
             if not intraday_data.empty:
                 print("Success with new key.")
-                # Convert timestamp to datetime and filter based on cutoff date
-                intraday_data["timestamp"] = pd.to_datetime(intraday_data["timestamp"])
-                intraday_data = intraday_data[intraday_data["timestamp"] >= cutoff_date]
-                
-                # Add the ticker symbol to the data
-                intraday_data["ticker"] = ticker
-
-                # Append the data to the all_data DataFrame
-                all_data = pd.concat([all_data, intraday_data], ignore_index=True)
+                # Parse column-wise and filter based on cutoff date
+                frames.append(apply_cutoff(frame_from_csv(intraday_data, ticker), cutoff_date))
             else:
                 print(f"Skipping {ticker} after exhausting all options.")
         else:
             print(f"Unable to generate new key. Skipping {ticker}.")
 
-# Save the combined data to a CSV file
-output_file = "all_tickers_data.csv"
-all_data.to_csv(output_file, index=False)
-print(f"Filtered data saved to {output_file}")
+# Write the combined data straight into finance_data.db
+if frames:
+    all_data = pd.concat(frames, ignore_index=True)
+    written = store_intraday_frame(all_data)
+    print(f"Stored {written} filtered bars in company_intraday_data")
+elif streamed:
+    print(f"Stored {streamed} filtered bars in company_intraday_data")
+else:
+    print("No intraday data fetched.")
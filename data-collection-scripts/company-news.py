@@ -1,14 +1,18 @@
 
-import sqlite3
-import time
-import os
 from datetime import datetime, timedelta
 from api_key_manager import APIKeyManager
-from fetch_funcs import check_existing_news, fetch_news_sentiment, store_news_sentiment
+from news_windows import empty_result, fetch_news_windowed, store_news_windows
+
+from coverage_index import month_periods
+from job_queue import JobQueue, period_month
+from news_planner import NewsPlanner
+from storage import get_db
+from streaming import STREAMING, stream_news_windowed
 
 key_manager = APIKeyManager()
 
-conn = sqlite3.connect('finance_data.db')
+db = get_db()
+conn = db.conn
 
 
 cursor = conn.cursor()
@@ -18,105 +22,95 @@ tickers = [row[0] for row in cursor.fetchall()]
 start_year = 2016
 end_year = 2024
 
-checkpoint_file = "news_sentiment_checkpoint.txt"
-last_ticker = None
-last_year = None
-last_month = None
+# Every ticker-month is a job in job_queue.db, so a crash or kill resumes with
+# the months that were not finished and several processes can share the work.
+# Jobs are queued month by month with the hub tickers first: their articles
+# mention most of the other tickers, whose windows are then skipped below
+current_date = datetime.now()
+job_queue = JobQueue()
+planner = NewsPlanner(db, tickers)
+periods = [period for period in month_periods(range(start_year, end_year + 1))
+           if period_month(period) <= (current_date.year, current_date.month)]
+print(f"Queued {job_queue.enqueue('news', planner.windows(periods))} new news jobs.")
+
+for job in job_queue.jobs('news'):
+    ticker = job.symbol
+    year, month = period_month(job.period)
 
-if os.path.exists(checkpoint_file):
-    with open(checkpoint_file, "r") as f:
-        checkpoint = f.read().strip().split(",")
-        if len(checkpoint) >= 3:
-            last_ticker = checkpoint[0]
-            last_year = int(checkpoint[1])
-            last_month = int(checkpoint[2])
-            print(f"Resuming from checkpoint: {last_ticker}, {last_year}-{last_month}")
+    start_date = datetime(year, month, 1)
+    if month == 12:
+        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
 
-skip_until_checkpoint = last_ticker is not None
+    time_from = start_date.strftime("%Y%m%dT0000")
+    time_to = end_date.strftime("%Y%m%dT2359")
 
-for ticker in tickers:
-    if skip_until_checkpoint and ticker != last_ticker:
+    if not planner.should_fetch(ticker, job.period):
+        print(f"News for {ticker} for {year}-{month:02d} is covered by the articles already stored. Skipping.")
+        job_queue.complete(job, db)
         continue
-    elif skip_until_checkpoint and ticker == last_ticker:
-        skip_until_checkpoint = False
-    
-    print(f"Processing news for ticker: {ticker}")
-    
-    for year in range(start_year, end_year + 1):
-        if last_ticker == ticker and year < last_year:
-            continue
-            
-        for month in range(1, 13):
-            current_date = datetime.now()
-            if year > current_date.year or (year == current_date.year and month > current_date.month):
-                continue
-            
-            if last_ticker == ticker and year == last_year and month < last_month:
-                continue
-            
-            start_date = datetime(year, month, 1)
-            if month == 12:
-                end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+
+    print(f"Fetching news for {ticker} for {year}-{month:02d}")
+
+    success = False
+    attempts = 0
+    max_attempts = len(key_manager.api_keys)
+
+    while not success and attempts < max_attempts:
+        api_key = key_manager.get_current_key()
+        print(f"Using API key: {api_key[:10]}...")
+
+        # AV_STREAMING=1 stores each window's articles while they are read
+        if STREAMING:
+            news_data = stream_news_windowed(ticker, time_from, time_to, api_key, db)
+        else:
+            news_data = fetch_news_windowed(ticker, time_from, time_to, api_key)
+
+        if news_data == "data exists":
+            print(f"News data already exists for {ticker} for {year}-{month:02d}. Skipping.")
+            success = True
+        elif news_data == "limit reached" or news_data == "error":
+            print(f"API limit reached or error for {ticker}. Rotating key.")
+            key_manager.handle_failure_and_continue()
+            attempts += 1
+        elif news_data == "no data":
+            print(f"No news data available for {ticker} for {year}-{month:02d}. Moving to next period.")
+            # Recorded as an empty complete window, as the pipeline does, so the month counts as covered
+            store_news_windows(ticker, empty_result(time_from, time_to), db)
+            success = True
+
+
+        elif isinstance(news_data, dict):
+            if STREAMING or store_news_windows(ticker, news_data, db):
+                success = True
+                print(f"Successfully stored news data for {ticker} for {year}-{month:02d}")
             else:
-                end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-            
-            time_from = start_date.strftime("%Y%m%dT0000")
-            time_to = end_date.strftime("%Y%m%dT2359")
-            
-            existing_data = check_existing_news(ticker, time_from, time_to, conn)
-            if existing_data == "data exists":
-                print(f"News data already exists for {ticker} for {year}-{month:02d}. Skipping.")
-                continue
-            
-            print(f"Fetching news for {ticker} for {year}-{month:02d}")
-            
-            success = False
-            attempts = 0
-            max_attempts = len(key_manager.api_keys)
-            
-            while not success and attempts < max_attempts:
-                api_key = key_manager.get_current_key()
-                print(f"Using API key: {api_key[:10]}...")
-                
-                news_data = fetch_news_sentiment(ticker, time_from, time_to, api_key)
-                
-                if news_data == "data exists":
-                    print(f"News data already exists for {ticker} for {year}-{month:02d}. Skipping.")
-                    success = True
-                elif news_data == "limit reached" or news_data == "error":
-                    print(f"API limit reached or error for {ticker}. Rotating key.")
-                    key_manager.handle_failure_and_continue()
-                    attempts += 1
-                elif news_data == "no data":
-                    print(f"No news data available for {ticker} for {year}-{month:02d}. Moving to next period.")
-                    success = True  
-                elif isinstance(news_data, dict):
-                    if store_news_sentiment(ticker, news_data, conn):
-                        success = True
-                        print(f"Successfully stored news data for {ticker} for {year}-{month:02d}")
-                    else:
-                        print(f"Failed to store data for {ticker} for {year}-{month:02d}")
-                        attempts += 1
-                
-                with open(checkpoint_file, "w") as f:
-                    f.write(f"{ticker},{year},{month}")
-                
-                
-            
-            if not success:
-                print(f"All keys failed for {ticker} for {year}-{month:02d}")
-                new_key = key_manager.fallback_to_new_key()
-                if new_key:
-                    print("Retrying with new key...")
-                    news_data = fetch_news_sentiment(ticker, time_from, time_to, new_key)
-                    if isinstance(news_data, dict):
-                        store_news_sentiment(ticker, news_data, conn)
-                        print(f"Success with new key for {ticker} for {year}-{month:02d}")
-                else:
-                    print(f"Skipping {ticker} for {year}-{month:02d} after exhausting all options.")
-
-conn.close()
-print("News sentiment collection completed.")
+                print(f"Failed to store data for {ticker} for {year}-{month:02d}")
+                attempts += 1
+
+    if not success:
+        print(f"All keys failed for {ticker} for {year}-{month:02d}")
+        new_key = key_manager.fallback_to_new_key()
+        if new_key:
+            print("Retrying with new key...")
+            if STREAMING:
+                news_data = stream_news_windowed(ticker, time_from, time_to, new_key, db)
+            else:
+                news_data = fetch_news_windowed(ticker, time_from, time_to, new_key)
+            if isinstance(news_data, dict) and (STREAMING or store_news_windows(ticker, news_data, db)):
+                print(f"Success with new key for {ticker} for {year}-{month:02d}")
+                success = True
 
-if os.path.exists(checkpoint_file):
-    os.remove(checkpoint_file)
\ No newline at end of file
+        else:
+            print(f"Skipping {ticker} for {year}-{month:02d} after exhausting all options.")
+
+    if success:
+        job_queue.complete(job, db)
+    else:
+        job_queue.fail(job, news_data)
+
+# Each store was committed and its job marked done as it went; only the connections are left
+db.close()
+job_queue.close()
+print("News sentiment collection completed.")
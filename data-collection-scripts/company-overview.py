@@ -5,11 +5,14 @@ import sqlite3
 import os
 import time
 from dotenv import load_dotenv
+from response_cache import replay_mode
 
 
 load_dotenv()
 
 api_keys = os.getenv('API_KEY_ALPHAVANTAGE_sbabel_umass_edu', '').split(',')
+if replay_mode() and api_keys[0] == '':
+    api_keys = ['replay']
 if not api_keys or api_keys[0] == '':
     raise ValueError("No API keys found in the environment variable 'API_KEYS'.")
 
@@ -106,8 +109,9 @@ for ticker in tickers:
             print(f"Failed to fetch overview for {ticker} with API key {current_key}")
             rotate_api_key()
             attempts += 1
-            disconnect_nordvpn()
-            connect_nordvpn()
+            if not replay_mode():
+                disconnect_nordvpn()
+                connect_nordvpn()
 
     if not success:
         print(f"Skipping {ticker} after trying all API keys.")
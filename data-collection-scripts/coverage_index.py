@@ -0,0 +1,192 @@
+# coverage_index.py
+"""
+Coverage manifest for finance_data.db.
+
+The coverage table records how many rows each (symbol, dataset, period) holds
+and when they were fetched. The store functions in fetch_funcs maintain it, and
+CoverageIndex loads it into memory once so "do we already have this?" is a
+dict lookup instead of a COUNT(*) scan per ticker-month. It also lets the
+collectors compute all missing work up front.
+
+Datasets and periods:
+    intraday                                     'YYYY-MM'
+    news                                         'YYYY-MM' (articles mentioning the symbol)
+    income_statement, balance_sheet, cash_flow   'all'
+"""
+
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+from storage import DB_PATH, get_db
+
+ALL_PERIODS = 'all'
+STATEMENT_DATASETS = ('income_statement', 'balance_sheet', 'cash_flow')
+
+# Same threshold check_existing_news has always used for a covered news window
+NEWS_MIN_ARTICLES = 21
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class CoverageIndex:
+    """
+    In-memory copy of the coverage table, shared by every thread using the same
+    database file.
+    """
+
+    def __init__(self, db):
+        self.path = db.path
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.load(db)
+
+    def load(self, db):
+        """
+        Loads the manifest, rebuilding it from the data tables the first time it
+        is used against a database collected before it existed.
+        """
+        cursor = db.cursor()
+        if cursor.execute("SELECT COUNT(*) FROM coverage").fetchone()[0] == 0:
+            self.rebuild(db)
+        rows = cursor.execute("SELECT symbol, dataset, period, row_count FROM coverage").fetchall()
+        with self.lock:
+            self.counts = {(symbol, dataset, period): count for symbol, dataset, period, count in rows}
+
+    def rebuild(self, db):
+        """
+        Recomputes the manifest with one grouped scan per data table.
+        """
+        fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if db.legacy_intraday:
+            intraday_month = "strftime('%Y-%m', datetime)"
+        else:
+            intraday_month = "strftime('%Y-%m', datetime, 'unixepoch')"
+        with db.unit() as cursor:
+            cursor.execute("DELETE FROM coverage")
+            cursor.execute(f'''
+            INSERT INTO coverage (symbol, dataset, period, row_count, fetched_at)
+            SELECT symbol, 'intraday', {intraday_month}, COUNT(*), ?
+            FROM company_intraday_data
+            GROUP BY symbol, 3
+            ''', (fetched_at,))
+            cursor.execute('''
+            INSERT INTO coverage (symbol, dataset, period, row_count, fetched_at)
+            SELECT s.ticker_symbol, 'news',
+                   SUBSTR(a.time_published, 1, 4) || '-' || SUBSTR(a.time_published, 5, 2),
+                   COUNT(*), ?
+            FROM news_articles a
+            JOIN news_ticker_sentiment s ON a.id = s.article_id
+            WHERE s.ticker_symbol IS NOT NULL AND a.time_published IS NOT NULL
+            GROUP BY 1, 3
+            ''', (fetched_at,))
+            for dataset in STATEMENT_DATASETS:
+                cursor.execute(f'''
+                INSERT INTO coverage (symbol, dataset, period, row_count, fetched_at)
+                SELECT symbol, ?, ?, COUNT(*), ? FROM {dataset} GROUP BY symbol
+                ''', (dataset, ALL_PERIODS, fetched_at))
+        db.flush()
+
+    def count(self, symbol, dataset, period=ALL_PERIODS):
+        return self.counts.get((symbol, dataset, period), 0)
+
+    def has(self, symbol, dataset, period=ALL_PERIODS, min_rows=1):
+        return self.count(symbol, dataset, period) >= min_rows
+
+    def record(self, db, cursor, entries, replace=False):
+        """
+        Adds row counts for {(symbol, dataset, period): rows} inside the caller's
+        unit. The in-memory copy is only updated once that unit is released.
+        With replace=True the counts overwrite instead of adding to the
+        existing ones (used when the caller has recounted the period).
+        """
+        entries = {key: rows for key, rows in entries.items() if rows}
+        if not entries:
+            return
+        fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.executemany(f'''
+        INSERT INTO coverage (symbol, dataset, period, row_count, fetched_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (symbol, dataset, period)
+        DO UPDATE SET row_count = {'' if replace else 'row_count + '}excluded.row_count,
+                      fetched_at = excluded.fetched_at
+        ''', [(symbol, dataset, period, rows, fetched_at) for (symbol, dataset, period), rows in entries.items()])
+
+        def apply():
+            with self.lock:
+                for key, rows in entries.items():
+                    self.counts[key] = rows if replace else self.counts.get(key, 0) + rows
+
+        db.after_unit(apply)
+
+    def missing(self, symbols, dataset, periods=(ALL_PERIODS,), min_rows=1):
+        """
+        Returns every (symbol, period) pair that is not covered yet.
+        """
+        return [(symbol, period) for symbol in symbols for period in periods
+                if not self.has(symbol, dataset, period, min_rows)]
+
+
+def get_coverage(db=None):
+    """
+    Returns the process-wide CoverageIndex for db's file, loading it on first use.
+    """
+    db = db or get_db()
+    with _indexes_lock:
+        index = _indexes.get(db.path)
+        if index is None:
+            index = _indexes[db.path] = CoverageIndex(db)
+    return index
+
+
+def month_period(value):
+    """
+    'YYYY-MM' for a datetime, 'YYYY-MM-DD HH:MM:SS' string or 'YYYYMMDDTHHMMSS' string.
+    """
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m')
+    value = str(value)
+    if len(value) >= 6 and value[:6].isdigit():
+        return f"{value[:4]}-{value[4:6]}"
+    return value[:7]
+
+
+def intraday_entries(company_data):
+    """
+    Coverage entries for a list of store_intraday_data row dicts.
+    """
+    counts = Counter((row['symbol'], month_period(row['datetime'])) for row in company_data)
+    return {(symbol, 'intraday', period): rows for (symbol, period), rows in counts.items()}
+
+
+def month_periods(years, months=range(1, 13)):
+    return [f"{year}-{month:02d}" for year in years for month in months]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'summary'
+    db = get_db(DB_PATH)
+    coverage = get_coverage(db)
+
+    if command == 'rebuild':
+        coverage.rebuild(db)
+        coverage.load(db)
+        print(f"Rebuilt coverage with {len(coverage.counts)} entries.")
+    elif command == 'missing':
+        dataset = sys.argv[2] if len(sys.argv) > 2 else 'intraday'
+        conn = sqlite3.connect('company_overview.db')
+        symbols = [row[0] for row in conn.execute('SELECT DISTINCT Symbol FROM company_overview')]
+        conn.close()
+        periods = (ALL_PERIODS,) if dataset in STATEMENT_DATASETS else month_periods(range(2016, 2025))
+        min_rows = NEWS_MIN_ARTICLES if dataset == 'news' else 1
+        todo = coverage.missing(symbols, dataset, periods, min_rows)
+        for symbol, period in todo:
+            print(symbol, period)
+        print(f"{len(todo)} missing {dataset} jobs.")
+    else:
+        by_dataset = Counter(dataset for _, dataset, _ in coverage.counts)
+        for dataset, entries in sorted(by_dataset.items()):
+            print(f"{dataset}: {entries} covered periods")
@@ -1,16 +1,29 @@
-import requests
-from datetime import datetime
+import calendar
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
 import sqlite3
 import pandas as pd
 
+from coverage_index import ALL_PERIODS, NEWS_MIN_ARTICLES, get_coverage, intraday_entries, month_period
+from financial_facts import FACT_INSERT, fact_rows, parse_amount, seed_line_items
+import intraday_pyramid
+import metrics
+import news_search
+from news_windows import NEWS_LIMIT, month_complete
+from news_words import WORD_COUNT_INSERT, word_count_rows
+import ohlcv_store
+from response_cache import av_get
+from sankey_edges import SANKEY_EDGE_INSERT, edge_rows
+from sentiment_rollup import SentimentRollup
+from storage import get_db
+
 from io import StringIO
 
 def fetch_company_overview(ticker, api_key):
 
     print(f"Fetching data for {ticker} using API key {api_key}...")
-    url = f'https://www.alphavantage.co/query?function=OVERVIEW&symbol={ticker}&apikey={api_key}'
-    
-    r = requests.get(url)
+    r = av_get({'function': 'OVERVIEW', 'symbol': ticker, 'apikey': api_key})
     data = r.json()
     if not data or 'Symbol' not in data:
         print(f"Skipped {ticker} (no data returned)")
@@ -75,38 +88,26 @@ def fetch_company_overview(ticker, api_key):
 
 
 
-def fetch_intraday_data(ticker, api_key, interval='60min', year=2016, month=12):
-    base_url = f"https://www.alphavantage.co/query"
-    company_data = []
-
-    # Check if data already exists in the database
-    conn = sqlite3.connect('finance_data.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    SELECT COUNT(*) FROM company_intraday_data
-    WHERE symbol = ? AND strftime('%Y-%m', datetime) = ?
-    ''', (ticker, f"{year}-{month:02d}"))
-    exists = cursor.fetchone()[0] > 0
-
-    conn.close()
-
-    if exists:
-        print(f"Data for {ticker} for {year}-{month:02d} already exists. Skipping fetch.")
-        return 'data exists'
-
-    url = f"{base_url}?function=TIME_SERIES_INTRADAY&symbol={ticker}&interval={interval}&month={year}-{month:02d}&apikey={api_key}"
-    print(f"Fetching data for {ticker} for {year}-{month:02d}...")
-    response = requests.get(url)
-    data = response.json()
+@metrics.timed('probe_seconds')
+def intraday_month_exists(ticker, year, month):
+    """
+    Returns True if intraday bars for ticker in the given year/month are already stored.
+    """
+    return get_coverage().has(ticker, 'intraday', f"{year}-{month:02d}")
 
-    
 
-    if 'Time Series (60min)' not in data:
+@metrics.timed('parse_seconds')
+def parse_intraday_data(ticker, data, interval='60min'):
+    """
+    Converts a TIME_SERIES_INTRADAY JSON response into the list of row dicts
+    expected by store_intraday_data. Returns 'no data' if the series is missing.
+    """
+    series_key = f'Time Series ({interval})'
+    if series_key not in data:
         return 'no data'
 
-    # Parse the data
-    for timestamp, values in data['Time Series (60min)'].items():
+    company_data = []
+    for timestamp, values in data[series_key].items():
         timestamp = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
         company_data.append({
             'symbol': ticker,
@@ -117,18 +118,38 @@ def fetch_intraday_data(ticker, api_key, interval='60min', year=2016, month=12):
             'close': values['4. close'],
             'volume': values['5. volume']
         })
-    
-    month += 1
+    return company_data
 
 
-    return company_data
+def fetch_intraday_data(ticker, api_key, interval='60min', year=2016, month=12, refresh=False):
+    # Check if data already exists in the database (refresh re-fetches a partially stored month)
+    if not refresh and intraday_month_exists(ticker, year, month):
+        print(f"Data for {ticker} for {year}-{month:02d} already exists. Skipping fetch.")
+        return 'data exists'
+
+    print(f"Fetching data for {ticker} for {year}-{month:02d}...")
+    response = av_get({
+        'function': 'TIME_SERIES_INTRADAY',
+        'symbol': ticker,
+        'interval': interval,
+        'month': f"{year}-{month:02d}",
+        'apikey': api_key,
+    }, refresh=refresh)
+    data = response.json()
+
+    return parse_intraday_data(ticker, data, interval)
 
 
 # Function to fetch intraday data for a single ticker
 def fetch_intraday_data_bulk_csv(ticker, api_key, interval='60min'):
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol={ticker}&interval={interval}&apikey={api_key}&datatype=csv&outputsize=full"
-    
-    response = requests.get(url)
+    response = av_get({
+        'function': 'TIME_SERIES_INTRADAY',
+        'symbol': ticker,
+        'interval': interval,
+        'datatype': 'csv',
+        'outputsize': 'full',
+        'apikey': api_key,
+    })
     
     if response.status_code == 200:
         # Read the CSV response into a DataFrame
@@ -153,56 +174,107 @@ def fetch_intraday_data_bulk_csv(ticker, api_key, interval='60min'):
 
 
 
-# Function to store data in the database
-def store_intraday_data(company_data):
-    conn = sqlite3.connect('finance_data.db')  # Connect to your database
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS company_intraday_data (
-        symbol TEXT,
-        datetime DATETIME,
-        open REAL,
-        high REAL,
-        low REAL,
-        close REAL,
-        volume INTEGER
-    )
-    ''')
+INTRADAY_UPSERT = '''
+INSERT INTO company_intraday_data (symbol, datetime, open, high, low, close, volume)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (symbol, datetime) DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low,
+    close = excluded.close, volume = excluded.volume
+'''
 
-    # Insert the data
-    cursor.executemany('''
-    INSERT INTO company_intraday_data (symbol, datetime, open, high, low, close, volume)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', [(data['symbol'], data['datetime'], data['open'], data['high'], data['low'], data['close'], data['volume']) for data in company_data])
 
-    conn.commit()
-    conn.close()
+def to_epoch(value):
+    """
+    Epoch seconds for an intraday timestamp. Alpha Vantage bars are US/Eastern
+    wall-clock times; they are stored as if they were UTC so that
+    datetime(datetime, 'unixepoch') gives back the original timestamp.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.strptime(str(value), '%Y-%m-%d %H:%M:%S')
+    return calendar.timegm(value.timetuple())
 
 
-def base_function_fetch_call(function, ticker, api_key):
-    base_url = f'https://www.alphavantage.co/query?function={function}&symbol={ticker}&apikey={api_key}'
+def month_epoch_bounds(period):
+    """
+    [start, end) epoch seconds for a 'YYYY-MM' period.
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return to_epoch(start), to_epoch(end)
 
-    # Check if data already exists in the database
-    conn = sqlite3.connect('finance_data.db')
-    cursor = conn.cursor()
 
-    cursor.execute(f'''
-    SELECT COUNT(*) FROM {function.lower()}
-    WHERE symbol = ? 
-    ''', (ticker,))
-    exists = cursor.fetchone()[0] > 0
+def recount_intraday_coverage(cursor, entries):
+    """
+    Replaces the row counts of the given intraday coverage entries with the
+    number of stored bars, so re-fetched months are not counted twice.
+    """
+    recounted = {}
+    for symbol, dataset, period in entries:
+        start, end = month_epoch_bounds(period)
+        cursor.execute('''
+        SELECT COUNT(*) FROM company_intraday_data
+        WHERE symbol = ? AND datetime >= ? AND datetime < ?
+        ''', (symbol, start, end))
+        recounted[(symbol, dataset, period)] = cursor.fetchone()[0]
+    return recounted
+
+
+# Function to store data in the database (timed as store_seconds by store_intraday_rows)
+def store_intraday_data(company_data, db=None):
+    rows = [(
+        data['symbol'],
+        to_epoch(data['datetime']),
+        float(data['open']),
+        float(data['high']),
+        float(data['low']),
+        float(data['close']),
+        int(float(data['volume']))
+    ) for data in company_data]
+    store_intraday_rows(rows, intraday_entries(company_data), db)
+
+
+@metrics.timed('store_seconds')
+def store_intraday_rows(rows, entries, db=None):
+    """
+    Upserts (symbol, epoch, open, high, low, close, volume) rows and recounts
+    the coverage of `entries`, the (symbol, 'intraday', period) months they fall in.
+    The rows also go to the per-symbol bar files (ohlcv_store.py) and the
+    chart aggregates (intraday_pyramid.py) once committed.
+    """
+    db = db or get_db()
+    if db.legacy_intraday:
+        raise RuntimeError("company_intraday_data has not been migrated yet, run migrate_intraday.py first.")
+    coverage = get_coverage(db)
+
+    # Upsert the data, committed with the rest of the current batch
+    with db.unit() as cursor:
+        cursor.executemany(INTRADAY_UPSERT, rows)
+        metrics.inc('rows_written_total', len(rows), table='company_intraday_data')
+        entries = recount_intraday_coverage(cursor, entries)
+        coverage.record(db, cursor, entries, replace=True)
+        ohlcv_store.record_rows(db, rows)
+        intraday_pyramid.record_rows(db, rows)
+
+
+@metrics.timed('probe_seconds')
+def statement_exists(function, ticker):
+    """
+    Returns True if rows for ticker are already stored in the table backing the
+    given statement function (INCOME_STATEMENT -> income_statement, ...).
+    """
+    return get_coverage().has(ticker, function.lower(), ALL_PERIODS)
 
-    conn.close()
 
-    if exists:
+def base_function_fetch_call(function, ticker, api_key, refresh=False):
+    # Check if data already exists in the database (refresh looks for newly filed reports)
+    if not refresh and statement_exists(function, ticker):
         print(f"{function} Data for {ticker} already exists. Skipping fetch.")
         return 'data exists'
 
 
     print(f"Fetching data for {ticker} for function {function}...")
-    response = requests.get(base_url)
+    response = av_get({'function': function, 'symbol': ticker, 'apikey': api_key}, refresh=refresh)
     data = response.json()
     if response.status_code == 200:
         if not data or 'symbol' not in data:
@@ -213,102 +285,62 @@ def base_function_fetch_call(function, ticker, api_key):
         print(f"Failed to fetch data for {ticker}. Status code: {response.status_code}")
 
 
-def fetch_income_statement(ticker, api_key):
+@metrics.timed('parse_seconds')
+def parse_statement(data):
     """
-    Fetches the income statement data for a given ticker from Alpha Vantage.
-    Returns the JSON data if successful, otherwise returns 'no data'.
+    Applies the checks shared by the income statement, balance sheet and cash
+    flow fetchers. Returns the JSON data, 'data exists' or 'no data'.
     """
-    print(f"Fetching income statement for {ticker} using API key {api_key}...")
-    data = base_function_fetch_call('INCOME_STATEMENT', ticker, api_key)
-    
-    # Check if the data contains the expected key
     if data == 'data exists':
         return 'data exists'
     if not data or 'annualReports' not in data:
-        print(f"Skipped {ticker} (no income statement data returned)")
         return 'no data'
-    
     return data
 
-def fetch_balance_sheet(ticker, api_key):
+
+def fetch_income_statement(ticker, api_key, refresh=False):
+    """
+    Fetches the income statement data for a given ticker from Alpha Vantage.
+    Returns the JSON data if successful, otherwise returns 'no data'.
+    """
+    print(f"Fetching income statement for {ticker} using API key {api_key}...")
+    data = parse_statement(base_function_fetch_call('INCOME_STATEMENT', ticker, api_key, refresh))
+    if data == 'no data':
+        print(f"Skipped {ticker} (no income statement data returned)")
+    return data
+
+def fetch_balance_sheet(ticker, api_key, refresh=False):
     """
     Fetches the balance sheet data for a given ticker from Alpha Vantage.
     Returns the JSON data if successful, otherwise returns 'no data'.
     """
     print(f"Fetching balance sheet for {ticker} using API key {api_key}...")
-    data = base_function_fetch_call('BALANCE_SHEET', ticker, api_key)
-    
-    # Check if the data contains the expected key
-    if data == 'data exists':
-        return 'data exists'
-    if not data or 'annualReports' not in data:
+    data = parse_statement(base_function_fetch_call('BALANCE_SHEET', ticker, api_key, refresh))
+    if data == 'no data':
         print(f"Skipped {ticker} (no balance sheet data returned)")
-        return 'no data'
-    
     return data
 
-def fetch_cash_flow(ticker, api_key):
+def fetch_cash_flow(ticker, api_key, refresh=False):
     """
     Fetches the cash flow data for a given ticker from Alpha Vantage.
     Returns the JSON data if successful, otherwise returns 'no data'.
     """
     print(f"Fetching cash flow for {ticker} using API key {api_key}...")
-    data = base_function_fetch_call('CASH_FLOW', ticker, api_key)
-    
-    # Check if the data contains the expected key
-    if data == 'data exists':
-        return 'data exists'
-    if not data or 'annualReports' not in data:
+    data = parse_statement(base_function_fetch_call('CASH_FLOW', ticker, api_key, refresh))
+    if data == 'no data':
         print(f"Skipped {ticker} (no cash flow data returned)")
-        return 'no data'
-    
     return data
 
-def store_income_statement(income_data):
+@metrics.timed('store_seconds')
+def store_income_statement(income_data, db=None):
     """
     Stores income statement reports (both annual and quarterly) into the finance_db.
     Expects income_data to be the JSON result from the income statement API.
     """
-    import sqlite3
-
-    # Connect to the finance database
-    conn = sqlite3.connect('finance_data.db')
-    cursor = conn.cursor()
-
-    # Create table with a composite primary key (symbol, fiscalDateEnding, reportType)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS income_statement (
-            symbol TEXT,
-            fiscalDateEnding TEXT,
-            reportType TEXT,
-            reportedCurrency TEXT,
-            grossProfit TEXT,
-            totalRevenue TEXT,
-            costOfRevenue TEXT,
-            costofGoodsAndServicesSold TEXT,
-            operatingIncome TEXT,
-            sellingGeneralAndAdministrative TEXT,
-            researchAndDevelopment TEXT,
-            operatingExpenses TEXT,
-            investmentIncomeNet TEXT,
-            netInterestIncome TEXT,
-            interestIncome TEXT,
-            interestExpense TEXT,
-            nonInterestIncome TEXT,
-            otherNonOperatingIncome TEXT,
-            depreciation TEXT,
-            depreciationAndAmortization TEXT,
-            incomeBeforeTax TEXT,
-            incomeTaxExpense TEXT,
-            interestAndDebtExpense TEXT,
-            netIncomeFromContinuingOperations TEXT,
-            comprehensiveIncomeNetOfTax TEXT,
-            ebit TEXT,
-            ebitda TEXT,
-            netIncome TEXT,
-            PRIMARY KEY (symbol, fiscalDateEnding, reportType)
-        )
-        ''')
+    db = db or get_db()
+    coverage = get_coverage(db)
+    seed_line_items(db)
+    cursor = db.cursor()
     symbol = income_data.get('symbol', '')
 
     # Process both annual and quarterly reports
@@ -328,119 +360,76 @@ def store_income_statement(income_data):
                 print(f"Income statement ({report_type}) for {symbol} on {fiscal_date} already exists. Skipping insert.")
                 continue
 
-            # Prepare a tuple of values, defaulting missing fields to empty strings
+            # Prepare a tuple of values, amounts parsed to whole units or None
             row = (
                 symbol,
                 fiscal_date,
                 report_type,
                 report.get("reportedCurrency", ""),
-                report.get("grossProfit", ""),
-                report.get("totalRevenue", ""),
-                report.get("costOfRevenue", ""),
-                report.get("costofGoodsAndServicesSold", ""),
-                report.get("operatingIncome", ""),
-                report.get("sellingGeneralAndAdministrative", ""),
-                report.get("researchAndDevelopment", ""),
-                report.get("operatingExpenses", ""),
-                report.get("investmentIncomeNet", ""),
-                report.get("netInterestIncome", ""),
-                report.get("interestIncome", ""),
-                report.get("interestExpense", ""),
-                report.get("nonInterestIncome", ""),
-                report.get("otherNonOperatingIncome", ""),
-                report.get("depreciation", ""),
-                report.get("depreciationAndAmortization", ""),
-                report.get("incomeBeforeTax", ""),
-                report.get("incomeTaxExpense", ""),
-                report.get("interestAndDebtExpense", ""),
-                report.get("netIncomeFromContinuingOperations", ""),
-                report.get("comprehensiveIncomeNetOfTax", ""),
-                report.get("ebit", ""),
-                report.get("ebitda", ""),
-                report.get("netIncome", "")
+                parse_amount(report.get("grossProfit")),
+                parse_amount(report.get("totalRevenue")),
+                parse_amount(report.get("costOfRevenue")),
+                parse_amount(report.get("costofGoodsAndServicesSold")),
+                parse_amount(report.get("operatingIncome")),
+                parse_amount(report.get("sellingGeneralAndAdministrative")),
+                parse_amount(report.get("researchAndDevelopment")),
+                parse_amount(report.get("operatingExpenses")),
+                parse_amount(report.get("investmentIncomeNet")),
+                parse_amount(report.get("netInterestIncome")),
+                parse_amount(report.get("interestIncome")),
+                parse_amount(report.get("interestExpense")),
+                parse_amount(report.get("nonInterestIncome")),
+                parse_amount(report.get("otherNonOperatingIncome")),
+                parse_amount(report.get("depreciation")),
+                parse_amount(report.get("depreciationAndAmortization")),
+                parse_amount(report.get("incomeBeforeTax")),
+                parse_amount(report.get("incomeTaxExpense")),
+                parse_amount(report.get("interestAndDebtExpense")),
+                parse_amount(report.get("netIncomeFromContinuingOperations")),
+                parse_amount(report.get("comprehensiveIncomeNetOfTax")),
+                parse_amount(report.get("ebit")),
+                parse_amount(report.get("ebitda")),
+                parse_amount(report.get("netIncome"))
             )
             rows_to_insert.append(row)
 
         if rows_to_insert:
             try:
-                cursor.executemany('''
-                    INSERT INTO income_statement (
-                        symbol, fiscalDateEnding, reportType, reportedCurrency, grossProfit,
-                        totalRevenue, costOfRevenue, costofGoodsAndServicesSold, operatingIncome,
-                        sellingGeneralAndAdministrative, researchAndDevelopment, operatingExpenses,
-                        investmentIncomeNet, netInterestIncome, interestIncome, interestExpense,
-                        nonInterestIncome, otherNonOperatingIncome, depreciation,
-                        depreciationAndAmortization, incomeBeforeTax, incomeTaxExpense,
-                        interestAndDebtExpense, netIncomeFromContinuingOperations,
-                        comprehensiveIncomeNetOfTax, ebit, ebitda, netIncome
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                ''', rows_to_insert)
-                conn.commit()
+                with db.unit() as unit_cursor:
+                    unit_cursor.executemany('''
+                        INSERT INTO income_statement (
+                            symbol, fiscalDateEnding, reportType, reportedCurrency, grossProfit,
+                            totalRevenue, costOfRevenue, costofGoodsAndServicesSold, operatingIncome,
+                            sellingGeneralAndAdministrative, researchAndDevelopment, operatingExpenses,
+                            investmentIncomeNet, netInterestIncome, interestIncome, interestExpense,
+                            nonInterestIncome, otherNonOperatingIncome, depreciation,
+                            depreciationAndAmortization, incomeBeforeTax, incomeTaxExpense,
+                            interestAndDebtExpense, netIncomeFromContinuingOperations,
+                            comprehensiveIncomeNetOfTax, ebit, ebitda, netIncome
+                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    ''', rows_to_insert)
+                    unit_cursor.executemany(FACT_INSERT, [fact for row in rows_to_insert
+                                                          for fact in fact_rows('income_statement', row)])
+                    unit_cursor.executemany(SANKEY_EDGE_INSERT, edge_rows('income_statement', rows_to_insert))
+                    coverage.record(db, unit_cursor, {(symbol, 'income_statement', ALL_PERIODS): len(rows_to_insert)})
+                    metrics.inc('rows_written_total', len(rows_to_insert), table='income_statement')
                 print(f"Inserted {len(rows_to_insert)} new income statement ({report_type}) records for {symbol}.")
             except sqlite3.IntegrityError:
                 print(f"Some income statement records for {symbol} ({report_type}) already exist. Skipping duplicates.")
-                conn.rollback()
         else:
             print(f"No new income statement ({report_type}) records to insert.")
-    
-    conn.close()
 
 
-def store_balance_sheet(balance_data):
+@metrics.timed('store_seconds')
+def store_balance_sheet(balance_data, db=None):
     """
     Stores balance sheet reports (both annual and quarterly) into the finance_db.
     Expects balance_data to be the JSON result from the balance sheet API.
     """
-    import sqlite3
-
-    conn = sqlite3.connect('finance_data.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS balance_sheet (
-        symbol TEXT,
-        fiscalDateEnding TEXT,
-        reportType TEXT,
-        reportedCurrency TEXT,
-        totalAssets TEXT,
-        totalCurrentAssets TEXT,
-        cashAndCashEquivalentsAtCarryingValue TEXT,
-        cashAndShortTermInvestments TEXT,
-        inventory TEXT,
-        currentNetReceivables TEXT,
-        totalNonCurrentAssets TEXT,
-        propertyPlantEquipment TEXT,
-        accumulatedDepreciationAmortizationPPE TEXT,
-        intangibleAssets TEXT,
-        intangibleAssetsExcludingGoodwill TEXT,
-        goodwill TEXT,
-        investments TEXT,
-        longTermInvestments TEXT,
-        shortTermInvestments TEXT,
-        otherCurrentAssets TEXT,
-        otherNonCurrentAssets TEXT,
-        totalLiabilities TEXT,
-        totalCurrentLiabilities TEXT,
-        currentAccountsPayable TEXT,
-        deferredRevenue TEXT,
-        currentDebt TEXT,
-        shortTermDebt TEXT,
-        totalNonCurrentLiabilities TEXT,
-        capitalLeaseObligations TEXT,
-        longTermDebt TEXT,
-        currentLongTermDebt TEXT,
-        longTermDebtNoncurrent TEXT,
-        shortLongTermDebtTotal TEXT,
-        otherCurrentLiabilities TEXT,
-        otherNonCurrentLiabilities TEXT,
-        totalShareholderEquity TEXT,
-        treasuryStock TEXT,
-        retainedEarnings TEXT,
-        commonStock TEXT,
-        commonStockSharesOutstanding TEXT,
-        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
-    )
-    ''')
+    db = db or get_db()
+    coverage = get_coverage(db)
+    seed_line_items(db)
+    cursor = db.cursor()
 
     symbol = balance_data.get('symbol', '')
 
@@ -465,119 +454,85 @@ def store_balance_sheet(balance_data):
                 fiscal_date,
                 report_type,
                 report.get("reportedCurrency", ""),
-                report.get("totalAssets", ""),
-                report.get("totalCurrentAssets", ""),
-                report.get("cashAndCashEquivalentsAtCarryingValue", ""),
-                report.get("cashAndShortTermInvestments", ""),
-                report.get("inventory", ""),
-                report.get("currentNetReceivables", ""),
-                report.get("totalNonCurrentAssets", ""),
-                report.get("propertyPlantEquipment", ""),
-                report.get("accumulatedDepreciationAmortizationPPE", ""),
-                report.get("intangibleAssets", ""),
-                report.get("intangibleAssetsExcludingGoodwill", ""),
-                report.get("goodwill", ""),
-                report.get("investments", ""),
-                report.get("longTermInvestments", ""),
-                report.get("shortTermInvestments", ""),
-                report.get("otherCurrentAssets", ""),
-                report.get("otherNonCurrentAssets", ""),
-                report.get("totalLiabilities", ""),
-                report.get("totalCurrentLiabilities", ""),
-                report.get("currentAccountsPayable", ""),
-                report.get("deferredRevenue", ""),
-                report.get("currentDebt", ""),
-                report.get("shortTermDebt", ""),
-                report.get("totalNonCurrentLiabilities", ""),
-                report.get("capitalLeaseObligations", ""),
-                report.get("longTermDebt", ""),
-                report.get("currentLongTermDebt", ""),
-                report.get("longTermDebtNoncurrent", ""),
-                report.get("shortLongTermDebtTotal", ""),
-                report.get("otherCurrentLiabilities", ""),
-                report.get("otherNonCurrentLiabilities", ""),
-                report.get("totalShareholderEquity", ""),
-                report.get("treasuryStock", ""),
-                report.get("retainedEarnings", ""),
-                report.get("commonStock", ""),
-                report.get("commonStockSharesOutstanding", "")
+                parse_amount(report.get("totalAssets")),
+                parse_amount(report.get("totalCurrentAssets")),
+                parse_amount(report.get("cashAndCashEquivalentsAtCarryingValue")),
+                parse_amount(report.get("cashAndShortTermInvestments")),
+                parse_amount(report.get("inventory")),
+                parse_amount(report.get("currentNetReceivables")),
+                parse_amount(report.get("totalNonCurrentAssets")),
+                parse_amount(report.get("propertyPlantEquipment")),
+                parse_amount(report.get("accumulatedDepreciationAmortizationPPE")),
+                parse_amount(report.get("intangibleAssets")),
+                parse_amount(report.get("intangibleAssetsExcludingGoodwill")),
+                parse_amount(report.get("goodwill")),
+                parse_amount(report.get("investments")),
+                parse_amount(report.get("longTermInvestments")),
+                parse_amount(report.get("shortTermInvestments")),
+                parse_amount(report.get("otherCurrentAssets")),
+                parse_amount(report.get("otherNonCurrentAssets")),
+                parse_amount(report.get("totalLiabilities")),
+                parse_amount(report.get("totalCurrentLiabilities")),
+                parse_amount(report.get("currentAccountsPayable")),
+                parse_amount(report.get("deferredRevenue")),
+                parse_amount(report.get("currentDebt")),
+                parse_amount(report.get("shortTermDebt")),
+                parse_amount(report.get("totalNonCurrentLiabilities")),
+                parse_amount(report.get("capitalLeaseObligations")),
+                parse_amount(report.get("longTermDebt")),
+                parse_amount(report.get("currentLongTermDebt")),
+                parse_amount(report.get("longTermDebtNoncurrent")),
+                parse_amount(report.get("shortLongTermDebtTotal")),
+                parse_amount(report.get("otherCurrentLiabilities")),
+                parse_amount(report.get("otherNonCurrentLiabilities")),
+                parse_amount(report.get("totalShareholderEquity")),
+                parse_amount(report.get("treasuryStock")),
+                parse_amount(report.get("retainedEarnings")),
+                parse_amount(report.get("commonStock")),
+                parse_amount(report.get("commonStockSharesOutstanding"))
             )
             rows_to_insert.append(row)
 
         if rows_to_insert:
             try:
-                cursor.executemany('''
-                    INSERT INTO balance_sheet (
-                        symbol, fiscalDateEnding, reportType, reportedCurrency, totalAssets, totalCurrentAssets,
-                        cashAndCashEquivalentsAtCarryingValue, cashAndShortTermInvestments, inventory,
-                        currentNetReceivables, totalNonCurrentAssets, propertyPlantEquipment,
-                        accumulatedDepreciationAmortizationPPE, intangibleAssets,
-                        intangibleAssetsExcludingGoodwill, goodwill, investments, longTermInvestments,
-                        shortTermInvestments, otherCurrentAssets, otherNonCurrentAssets, totalLiabilities,
-                        totalCurrentLiabilities, currentAccountsPayable, deferredRevenue, currentDebt,
-                        shortTermDebt, totalNonCurrentLiabilities, capitalLeaseObligations, longTermDebt,
-                        currentLongTermDebt, longTermDebtNoncurrent, shortLongTermDebtTotal,
-                        otherCurrentLiabilities, otherNonCurrentLiabilities, totalShareholderEquity,
-                        treasuryStock, retainedEarnings, commonStock, commonStockSharesOutstanding
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                ''', rows_to_insert)
-                conn.commit()
+                with db.unit() as unit_cursor:
+                    unit_cursor.executemany('''
+                        INSERT INTO balance_sheet (
+                            symbol, fiscalDateEnding, reportType, reportedCurrency, totalAssets, totalCurrentAssets,
+                            cashAndCashEquivalentsAtCarryingValue, cashAndShortTermInvestments, inventory,
+                            currentNetReceivables, totalNonCurrentAssets, propertyPlantEquipment,
+                            accumulatedDepreciationAmortizationPPE, intangibleAssets,
+                            intangibleAssetsExcludingGoodwill, goodwill, investments, longTermInvestments,
+                            shortTermInvestments, otherCurrentAssets, otherNonCurrentAssets, totalLiabilities,
+                            totalCurrentLiabilities, currentAccountsPayable, deferredRevenue, currentDebt,
+                            shortTermDebt, totalNonCurrentLiabilities, capitalLeaseObligations, longTermDebt,
+                            currentLongTermDebt, longTermDebtNoncurrent, shortLongTermDebtTotal,
+                            otherCurrentLiabilities, otherNonCurrentLiabilities, totalShareholderEquity,
+                            treasuryStock, retainedEarnings, commonStock, commonStockSharesOutstanding
+                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    ''', rows_to_insert)
+                    unit_cursor.executemany(FACT_INSERT, [fact for row in rows_to_insert
+                                                          for fact in fact_rows('balance_sheet', row)])
+                    unit_cursor.executemany(SANKEY_EDGE_INSERT, edge_rows('balance_sheet', rows_to_insert))
+                    coverage.record(db, unit_cursor, {(symbol, 'balance_sheet', ALL_PERIODS): len(rows_to_insert)})
+                    metrics.inc('rows_written_total', len(rows_to_insert), table='balance_sheet')
                 print(f"Inserted {len(rows_to_insert)} new balance sheet ({report_type}) records for {symbol}.")
             except sqlite3.IntegrityError:
                 print(f"Some balance sheet records for {symbol} ({report_type}) already exist. Skipping duplicates.")
-                conn.rollback()
         else:
             print(f"No new balance sheet ({report_type}) records to insert.")
 
-    conn.close()
-
 
-def store_cash_flow(cash_flow_data):
+@metrics.timed('store_seconds')
+def store_cash_flow(cash_flow_data, db=None):
     """
     Stores cash flow reports (both annual and quarterly) into the finance_db.
     Expects cash_flow_data to be the JSON result from the cash flow API.
     """
-    import sqlite3
-
-    conn = sqlite3.connect('finance_data.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS cash_flow (
-        symbol TEXT,
-        fiscalDateEnding TEXT,
-        reportType TEXT,
-        reportedCurrency TEXT,
-        operatingCashflow TEXT,
-        paymentsForOperatingActivities TEXT,
-        proceedsFromOperatingActivities TEXT,
-        changeInOperatingLiabilities TEXT,
-        changeInOperatingAssets TEXT,
-        depreciationDepletionAndAmortization TEXT,
-        capitalExpenditures TEXT,
-        changeInReceivables TEXT,
-        changeInInventory TEXT,
-        profitLoss TEXT,
-        cashflowFromInvestment TEXT,
-        cashflowFromFinancing TEXT,
-        proceedsFromRepaymentsOfShortTermDebt TEXT,
-        paymentsForRepurchaseOfCommonStock TEXT,
-        paymentsForRepurchaseOfEquity TEXT,
-        paymentsForRepurchaseOfPreferredStock TEXT,
-        dividendPayout TEXT,
-        dividendPayoutCommonStock TEXT,
-        dividendPayoutPreferredStock TEXT,
-        proceedsFromIssuanceOfCommonStock TEXT,
-        proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet TEXT,
-        proceedsFromIssuanceOfPreferredStock TEXT,
-        proceedsFromRepurchaseOfEquity TEXT,
-        proceedsFromSaleOfTreasuryStock TEXT,
-        changeInCashAndCashEquivalents TEXT,
-        changeInExchangeRate TEXT,
-        netIncome TEXT,
-        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
-    )
-    ''')
+    db = db or get_db()
+    coverage = get_coverage(db)
+    seed_line_items(db)
+    cursor = db.cursor()
 
     symbol = cash_flow_data.get('symbol', '')
 
@@ -602,68 +557,70 @@ def store_cash_flow(cash_flow_data):
                 fiscal_date,
                 report_type,
                 report.get("reportedCurrency", ""),
-                report.get("operatingCashflow", ""),
-                report.get("paymentsForOperatingActivities", ""),
-                report.get("proceedsFromOperatingActivities", ""),
-                report.get("changeInOperatingLiabilities", ""),
-                report.get("changeInOperatingAssets", ""),
-                report.get("depreciationDepletionAndAmortization", ""),
-                report.get("capitalExpenditures", ""),
-                report.get("changeInReceivables", ""),
-                report.get("changeInInventory", ""),
-                report.get("profitLoss", ""),
-                report.get("cashflowFromInvestment", ""),
-                report.get("cashflowFromFinancing", ""),
-                report.get("proceedsFromRepaymentsOfShortTermDebt", ""),
-                report.get("paymentsForRepurchaseOfCommonStock", ""),
-                report.get("paymentsForRepurchaseOfEquity", ""),
-                report.get("paymentsForRepurchaseOfPreferredStock", ""),
-                report.get("dividendPayout", ""),
-                report.get("dividendPayoutCommonStock", ""),
-                report.get("dividendPayoutPreferredStock", ""),
-                report.get("proceedsFromIssuanceOfCommonStock", ""),
-                report.get("proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet", ""),
-                report.get("proceedsFromIssuanceOfPreferredStock", ""),
-                report.get("proceedsFromRepurchaseOfEquity", ""),
-                report.get("proceedsFromSaleOfTreasuryStock", ""),
-                report.get("changeInCashAndCashEquivalents", ""),
-                report.get("changeInExchangeRate", ""),
-                report.get("netIncome", "")
+                parse_amount(report.get("operatingCashflow")),
+                parse_amount(report.get("paymentsForOperatingActivities")),
+                parse_amount(report.get("proceedsFromOperatingActivities")),
+                parse_amount(report.get("changeInOperatingLiabilities")),
+                parse_amount(report.get("changeInOperatingAssets")),
+                parse_amount(report.get("depreciationDepletionAndAmortization")),
+                parse_amount(report.get("capitalExpenditures")),
+                parse_amount(report.get("changeInReceivables")),
+                parse_amount(report.get("changeInInventory")),
+                parse_amount(report.get("profitLoss")),
+                parse_amount(report.get("cashflowFromInvestment")),
+                parse_amount(report.get("cashflowFromFinancing")),
+                parse_amount(report.get("proceedsFromRepaymentsOfShortTermDebt")),
+                parse_amount(report.get("paymentsForRepurchaseOfCommonStock")),
+                parse_amount(report.get("paymentsForRepurchaseOfEquity")),
+                parse_amount(report.get("paymentsForRepurchaseOfPreferredStock")),
+                parse_amount(report.get("dividendPayout")),
+                parse_amount(report.get("dividendPayoutCommonStock")),
+                parse_amount(report.get("dividendPayoutPreferredStock")),
+                parse_amount(report.get("proceedsFromIssuanceOfCommonStock")),
+                parse_amount(report.get("proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet")),
+                parse_amount(report.get("proceedsFromIssuanceOfPreferredStock")),
+                parse_amount(report.get("proceedsFromRepurchaseOfEquity")),
+                parse_amount(report.get("proceedsFromSaleOfTreasuryStock")),
+                parse_amount(report.get("changeInCashAndCashEquivalents")),
+                parse_amount(report.get("changeInExchangeRate")),
+                parse_amount(report.get("netIncome"))
             )
             rows_to_insert.append(row)
 
         if rows_to_insert:
             try:
-                cursor.executemany('''
-                    INSERT INTO cash_flow (
-                        symbol, fiscalDateEnding, reportType, reportedCurrency, operatingCashflow,
-                        paymentsForOperatingActivities, proceedsFromOperatingActivities,
-                        changeInOperatingLiabilities, changeInOperatingAssets,
-                        depreciationDepletionAndAmortization, capitalExpenditures,
-                        changeInReceivables, changeInInventory, profitLoss,
-                        cashflowFromInvestment, cashflowFromFinancing,
-                        proceedsFromRepaymentsOfShortTermDebt,
-                        paymentsForRepurchaseOfCommonStock, paymentsForRepurchaseOfEquity,
-                        paymentsForRepurchaseOfPreferredStock, dividendPayout,
-                        dividendPayoutCommonStock, dividendPayoutPreferredStock,
-                        proceedsFromIssuanceOfCommonStock,
-                        proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet,
-                        proceedsFromIssuanceOfPreferredStock, proceedsFromRepurchaseOfEquity,
-                        proceedsFromSaleOfTreasuryStock, changeInCashAndCashEquivalents,
-                        changeInExchangeRate, netIncome
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                ''', rows_to_insert)
-                conn.commit()
+                with db.unit() as unit_cursor:
+                    unit_cursor.executemany('''
+                        INSERT INTO cash_flow (
+                            symbol, fiscalDateEnding, reportType, reportedCurrency, operatingCashflow,
+                            paymentsForOperatingActivities, proceedsFromOperatingActivities,
+                            changeInOperatingLiabilities, changeInOperatingAssets,
+                            depreciationDepletionAndAmortization, capitalExpenditures,
+                            changeInReceivables, changeInInventory, profitLoss,
+                            cashflowFromInvestment, cashflowFromFinancing,
+                            proceedsFromRepaymentsOfShortTermDebt,
+                            paymentsForRepurchaseOfCommonStock, paymentsForRepurchaseOfEquity,
+                            paymentsForRepurchaseOfPreferredStock, dividendPayout,
+                            dividendPayoutCommonStock, dividendPayoutPreferredStock,
+                            proceedsFromIssuanceOfCommonStock,
+                            proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet,
+                            proceedsFromIssuanceOfPreferredStock, proceedsFromRepurchaseOfEquity,
+                            proceedsFromSaleOfTreasuryStock, changeInCashAndCashEquivalents,
+                            changeInExchangeRate, netIncome
+                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    ''', rows_to_insert)
+                    unit_cursor.executemany(FACT_INSERT, [fact for row in rows_to_insert
+                                                          for fact in fact_rows('cash_flow', row)])
+                    unit_cursor.executemany(SANKEY_EDGE_INSERT, edge_rows('cash_flow', rows_to_insert))
+                    coverage.record(db, unit_cursor, {(symbol, 'cash_flow', ALL_PERIODS): len(rows_to_insert)})
+                    metrics.inc('rows_written_total', len(rows_to_insert), table='cash_flow')
                 print(f"Inserted {len(rows_to_insert)} new cash flow ({report_type}) records for {symbol}.")
             except sqlite3.IntegrityError:
                 print(f"Some cash flow records for {symbol} ({report_type}) already exist. Skipping duplicates.")
-                conn.rollback()
         else:
             print(f"No new cash flow ({report_type}) records to insert.")
-    
-    conn.close()
 
-def store_financial_data(ticker, income_statement, balance_sheet, cash_flow):
+def store_financial_data(ticker, income_statement, balance_sheet, cash_flow, db=None):
     print("Storing all financial data for", ticker)
     # Check if data already exists in the database
     if income_statement == 'data exists' and balance_sheet == 'data exists' and cash_flow == 'data exists':
@@ -671,21 +628,15 @@ def store_financial_data(ticker, income_statement, balance_sheet, cash_flow):
     if income_statement == 'no data' or balance_sheet == 'no data' or cash_flow == 'no data':
         return 'no data'
     if income_statement != 'data exists':
-        store_income_statement(income_statement)
+        store_income_statement(income_statement, db)
     if balance_sheet != 'data exists':
-        store_balance_sheet(balance_sheet)
+        store_balance_sheet(balance_sheet, db)
     if cash_flow != 'data exists':
-        store_cash_flow(cash_flow)
+        store_cash_flow(cash_flow, db)
 
 # Function to fetch news sentiment data from Alpha Vantage
-def fetch_news_sentiment(ticker, time_from, time_to, api_key):
-    """
-    Fetch news sentiment data from Alpha Vantage API
-    """
-    url = "https://www.alphavantage.co/query"
-    
-    # Build parameters
-    params = {
+def news_params(ticker, time_from, time_to, api_key):
+    return {
         "function": "NEWS_SENTIMENT",
         "tickers": ticker,
         "time_from": time_from,
@@ -694,44 +645,73 @@ def fetch_news_sentiment(ticker, time_from, time_to, api_key):
         "limit": 1000,  # Maximum allowed by API
         "apikey": api_key
     }
+
+
+def fetch_news_sentiment(ticker, time_from, time_to, api_key):
+    """
+    Fetch news sentiment data from Alpha Vantage API
+    """
+    params = news_params(ticker, time_from, time_to, api_key)
     
     try:
-        built_url = f"{url}?{'&'.join([f'{key}={value}' for key, value in params.items()])}"
-        # print(f"Making request to URL: {built_url}")
-        response = requests.get(url, params=params)
+        response = av_get(params)
         data = response.json()
-        
-        # Check if response contains error message
-        if "Error Message" in data:
-            print(f"API Error: {data['Error Message']}")
-            return "no data"
-        if "Information" in data:
-            print(f"API Information: {data['Information']}")
-            # Check if data is actually present
-            if "feed" not in data or len(data["feed"]) == 0:
-                return "no data"
-        if "Note" in data:
-            print(f"API Note: {data['Note']}")
-            return "limit reached"
-            
-        if "feed" in data and len(data["feed"]) > 0:
-            # Check if we have valid data
-            return data
-        else:
-            print(f"No news data found for {ticker} in specified time range")
-            return "no data"
-            
+        return parse_news_sentiment(ticker, data)
+
     except Exception as e:
         print(f"Error fetching news sentiment data: {str(e)}")
         return "error"
-    
+
+
+@metrics.timed('parse_seconds')
+def parse_news_sentiment(ticker, data):
+    """
+    Classifies a NEWS_SENTIMENT JSON response. Returns the data if it contains
+    articles, otherwise "no data" or "limit reached".
+    """
+    # Check if response contains error message
+    if "Error Message" in data:
+        print(f"API Error: {data['Error Message']}")
+        return "no data"
+    if "Information" in data:
+        print(f"API Information: {data['Information']}")
+        # Check if data is actually present
+        if "feed" not in data or len(data["feed"]) == 0:
+            return "no data"
+    if "Note" in data:
+        print(f"API Note: {data['Note']}")
+        return "limit reached"
+
+    if "feed" in data and len(data["feed"]) > 0:
+        # Check if we have valid data
+        return data
+    else:
+        print(f"No news data found for {ticker} in specified time range")
+        return "no data"
+
 # Function to check if data already exists
-def check_existing_news(ticker, start_date, end_date, conn):
-    cursor = conn.cursor()
-    
+@metrics.timed('probe_seconds')
+def check_existing_news(ticker, start_date, end_date, conn=None):
     # Convert dates to match the format stored in database
     start_date_obj = datetime.strptime(start_date, "%Y%m%dT%H%M")
     end_date_obj = datetime.strptime(end_date, "%Y%m%dT%H%M")
+
+    # Whole calendar month windows are answered from the coverage index
+    if start_date_obj.day == 1 and (end_date_obj + timedelta(days=1)).day == 1:
+        coverage = get_coverage()
+        count = 0
+        truncated = False
+        month = start_date_obj
+        while month <= end_date_obj:
+            period = month.strftime('%Y-%m')
+            count += coverage.count(ticker, 'news', period)
+            # A month at the article limit was cut short unless its split windows say otherwise
+            if coverage.count(ticker, 'news', period) >= NEWS_LIMIT:
+                truncated = truncated or not month_complete((conn or get_db()).cursor(), ticker, period)
+            month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        return "data exists" if count >= NEWS_MIN_ARTICLES and not truncated else "needs data"
+
+    cursor = (conn or get_db()).cursor()
     
     # Format for SQL query
     start_date_str = start_date_obj.strftime("%Y%m%d")
@@ -754,8 +734,71 @@ def check_existing_news(ticker, start_date, end_date, conn):
         return "data exists"
     return "needs data"
     
+NEWS_ARTICLE_INSERT = '''
+INSERT INTO news_articles (
+    id, title, url, time_published, authors, summary, banner_image, source,
+    category_within_source, source_domain, topics,
+    overall_sentiment_score, overall_sentiment_label, fetch_date
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+NEWS_TICKER_SENTIMENT_INSERT = '''
+INSERT INTO news_ticker_sentiment (
+    article_id, ticker_symbol, relevance_score,
+    ticker_sentiment_score, ticker_sentiment_label
+) VALUES (?, ?, ?, ?, ?)
+'''
+
+# Stays well under SQLITE_MAX_VARIABLE_NUMBER on older builds
+URL_LOOKUP_CHUNK = 500
+
+# Articles parsed into rows before they are inserted
+NEWS_STORE_CHUNK = 250
+
+
+def known_urls(cursor, urls):
+    """
+    The subset of urls already stored, looked up through the UNIQUE index on
+    news_articles.url.
+    """
+    urls = list(urls)
+    found = set()
+    for start in range(0, len(urls), URL_LOOKUP_CHUNK):
+        chunk = urls[start:start + URL_LOOKUP_CHUNK]
+        placeholders = ', '.join('?' for _ in chunk)
+        found.update(row[0] for row in cursor.execute(
+            f"SELECT url FROM news_articles WHERE url IN ({placeholders})", chunk))
+    return found
+
+
+def feed_chunks(feed, size=NEWS_STORE_CHUNK):
+    """
+    Yields lists of up to size articles from a list or any iterable of them.
+    """
+    feed = iter(feed)
+    while True:
+        chunk = list(islice(feed, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def next_article_id(cursor):
+    """
+    The id AUTOINCREMENT would hand out next. Must be called inside a unit:
+    FinanceDB.unit starts its transaction with BEGIN IMMEDIATE, so the write
+    lock is already held and no other connection can insert articles until
+    the unit commits.
+    """
+    return cursor.execute('''
+    SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'news_articles'), 0),
+               COALESCE((SELECT MAX(id) FROM news_articles), 0)) + 1
+    ''').fetchone()[0]
+
+
 # Function to store news sentiment data in the database
-def store_news_sentiment(ticker, data, conn):
+@metrics.timed('store_seconds')
+def store_news_sentiment(ticker, data, db=None):
     """
     Store news sentiment data in the SQLite database
     """
@@ -763,94 +806,113 @@ def store_news_sentiment(ticker, data, conn):
         print("No valid data to store")
         return False
     
-    cursor = conn.cursor()
-    articles_stored = 0
-    articles_already_exist = 0
+    db = db or get_db()
+    coverage = get_coverage(db)
+    coverage_entries = Counter()
+    rollup = SentimentRollup()
     
     try:
         fetch_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        for article in data["feed"]:
-            # Prepare article data
-            title = article.get("title")
-            url = article.get("url")
-            time_published = article.get("time_published")
+        # The whole feed is one unit: a failure rolls back just this feed
+        with db.unit() as cursor:
+            seen_urls = set()
+            article_id = next_article_id(cursor)
+            articles_seen = 0
+            articles_stored = 0
+
+            # Feeds may be generators (streaming.py), so they are stored a chunk at a time
+            for chunk in feed_chunks(data["feed"]):
+                articles_seen += len(chunk)
+                # Articles whose URL is already stored, or repeated within this feed, are skipped
+                seen_urls |= known_urls(cursor, {article.get("url") for article in chunk
+                                                 if article.get("url") is not None} - seen_urls)
+                article_rows = []
+                sentiment_rows = []
+                word_rows = []
+                search_rows = []
+
+                for article in chunk:
+                    # Prepare article data
+                    title = article.get("title")
+                    url = article.get("url")
+                    if url is not None:
+                        if url in seen_urls:
+                            continue
+                        seen_urls.add(url)
+                    time_published = article.get("time_published")
             
-            # Handle authors - can be a list or already a string
-            authors_data = article.get("authors", [])
-            if isinstance(authors_data, list):
-                authors = ",".join(authors_data)
-            else:
-                authors = str(authors_data)
+                    # Handle authors - can be a list or already a string
+                    authors_data = article.get("authors", [])
+                    if isinstance(authors_data, list):
+                        authors = ",".join(authors_data)
+                    else:
+                        authors = str(authors_data)
                 
-            summary = article.get("summary")
-            banner_image = article.get("banner_image")
-            source = article.get("source")
-            category_within_source = article.get("category_within_source")
-            source_domain = article.get("source_domain")
+                    summary = article.get("summary")
+                    banner_image = article.get("banner_image")
+                    source = article.get("source")
+                    category_within_source = article.get("category_within_source")
+                    source_domain = article.get("source_domain")
             
-            # Handle topics properly - extract just the topic names from the objects
-            topics_data = article.get("topics", [])
-            if isinstance(topics_data, list):
-                # Extract just the topic name from each dictionary
-                topic_names = []
-                for topic_item in topics_data:
-                    if isinstance(topic_item, dict) and "topic" in topic_item:
-                        topic_names.append(topic_item["topic"])
-                topics = ",".join(topic_names)
-            else:
-                topics = str(topics_data)
+                    # Handle topics properly - extract just the topic names from the objects
+                    topics_data = article.get("topics", [])
+                    if isinstance(topics_data, list):
+                        # Extract just the topic name from each dictionary
+                        topic_names = []
+                        for topic_item in topics_data:
+                            if isinstance(topic_item, dict) and "topic" in topic_item:
+                                topic_names.append(topic_item["topic"])
+                        topics = ",".join(topic_names)
+                    else:
+                        topics = str(topics_data)
                 
-            overall_sentiment_score = article.get("overall_sentiment_score")
-            overall_sentiment_label = article.get("overall_sentiment_label")
+                    overall_sentiment_score = article.get("overall_sentiment_score")
+                    overall_sentiment_label = article.get("overall_sentiment_label")
             
-            # Insert article data and get the article_id
-            try:
-                cursor.execute('''
-                INSERT INTO news_articles (
-                    title, url, time_published, authors, summary, banner_image, source, 
-                    category_within_source, source_domain, topics, 
-                    overall_sentiment_score, overall_sentiment_label, fetch_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    title, url, time_published, authors, summary, banner_image, source,
-                    category_within_source, source_domain, topics,
-                    overall_sentiment_score, overall_sentiment_label, fetch_date
-                ))
+                    article_rows.append((
+                        article_id, title, url, time_published, authors, summary, banner_image, source,
+                        category_within_source, source_domain, topics,
+                        overall_sentiment_score, overall_sentiment_label, fetch_date
+                    ))
+                    word_rows.extend(word_count_rows(article_id, summary))
+                    search_rows.append((article_id, title, summary, source, topics))
                 
-                article_id = cursor.lastrowid
-                articles_stored += 1
-                
-                # Insert ticker sentiment data if available
-                if "ticker_sentiment" in article:
-                    for ticker_data in article["ticker_sentiment"]:
+                    # Ticker sentiment data if available
+                    for ticker_data in article.get("ticker_sentiment", []):
                         ticker_symbol = ticker_data.get("ticker")
                         relevance_score = ticker_data.get("relevance_score")
                         ticker_sentiment_score = ticker_data.get("ticker_sentiment_score")
                         ticker_sentiment_label = ticker_data.get("ticker_sentiment_label")
-                        
-                        cursor.execute('''
-                        INSERT INTO news_ticker_sentiment (
-                            article_id, ticker_symbol, relevance_score, 
-                            ticker_sentiment_score, ticker_sentiment_label
-                        ) VALUES (?, ?, ?, ?, ?)
-                        ''', (
+
+                        sentiment_rows.append((
                             article_id, ticker_symbol, relevance_score,
                             ticker_sentiment_score, ticker_sentiment_label
                         ))
-                
-            except sqlite3.IntegrityError:
-                # URL already exists in database
-                articles_already_exist += 1
-                continue
-                
-        conn.commit()
+                        coverage_entries[(ticker_symbol, 'news', month_period(time_published))] += 1
+                        rollup.add(ticker_symbol, time_published, ticker_sentiment_score,
+                                   relevance_score, ticker_sentiment_label)
+
+                    article_id += 1
+
+                cursor.executemany(NEWS_ARTICLE_INSERT, article_rows)
+                cursor.executemany(NEWS_TICKER_SENTIMENT_INSERT, sentiment_rows)
+                cursor.executemany(WORD_COUNT_INSERT, word_rows)
+                news_search.index_rows(db, cursor, search_rows)
+                metrics.inc('rows_written_total', len(article_rows), table='news_articles')
+                metrics.inc('rows_written_total', len(sentiment_rows), table='news_ticker_sentiment')
+                metrics.inc('rows_written_total', len(word_rows), table='news_word_counts')
+                articles_stored += len(article_rows)
+
+            rollup.store(cursor)
+            coverage.record(db, cursor, coverage_entries)
+
+        articles_already_exist = articles_seen - articles_stored
         print(f"Stored {articles_stored} new articles, {articles_already_exist} already existed for {ticker}")
         return articles_stored > 0 or articles_already_exist > 0
         
     except Exception as e:
         print(f"Error storing news sentiment data: {str(e)}")
-        conn.rollback()
         return False
 # Get all tickers from database
 def get_tickers_from_db(conn):
@@ -0,0 +1,110 @@
+# financial_facts.py
+"""
+Numeric statement storage.
+
+Alpha Vantage reports every statement figure as a string, with "None" for
+missing values. The store functions parse them with parse_amount into whole
+currency units (INTEGER) or NULL, and also write each non-null figure to the
+long-format financial_facts table:
+
+    financial_facts (symbol, reportType, fiscalDateEnding, line_item_id, value)
+    line_items      (id, statement, name)
+
+Existing databases are converted, and financial_facts rebuilt, with
+migrate_statements.py.
+"""
+
+# Amount columns of each statement table, in table and insert order
+STATEMENT_LINE_ITEMS = {
+    'income_statement': (
+        'grossProfit', 'totalRevenue', 'costOfRevenue', 'costofGoodsAndServicesSold',
+        'operatingIncome', 'sellingGeneralAndAdministrative', 'researchAndDevelopment',
+        'operatingExpenses', 'investmentIncomeNet', 'netInterestIncome', 'interestIncome',
+        'interestExpense', 'nonInterestIncome', 'otherNonOperatingIncome', 'depreciation',
+        'depreciationAndAmortization', 'incomeBeforeTax', 'incomeTaxExpense',
+        'interestAndDebtExpense', 'netIncomeFromContinuingOperations',
+        'comprehensiveIncomeNetOfTax', 'ebit', 'ebitda', 'netIncome',
+    ),
+    'balance_sheet': (
+        'totalAssets', 'totalCurrentAssets', 'cashAndCashEquivalentsAtCarryingValue',
+        'cashAndShortTermInvestments', 'inventory', 'currentNetReceivables',
+        'totalNonCurrentAssets', 'propertyPlantEquipment', 'accumulatedDepreciationAmortizationPPE',
+        'intangibleAssets', 'intangibleAssetsExcludingGoodwill', 'goodwill', 'investments',
+        'longTermInvestments', 'shortTermInvestments', 'otherCurrentAssets', 'otherNonCurrentAssets',
+        'totalLiabilities', 'totalCurrentLiabilities', 'currentAccountsPayable', 'deferredRevenue',
+        'currentDebt', 'shortTermDebt', 'totalNonCurrentLiabilities', 'capitalLeaseObligations',
+        'longTermDebt', 'currentLongTermDebt', 'longTermDebtNoncurrent', 'shortLongTermDebtTotal',
+        'otherCurrentLiabilities', 'otherNonCurrentLiabilities', 'totalShareholderEquity',
+        'treasuryStock', 'retainedEarnings', 'commonStock', 'commonStockSharesOutstanding',
+    ),
+    'cash_flow': (
+        'operatingCashflow', 'paymentsForOperatingActivities', 'proceedsFromOperatingActivities',
+        'changeInOperatingLiabilities', 'changeInOperatingAssets',
+        'depreciationDepletionAndAmortization', 'capitalExpenditures', 'changeInReceivables',
+        'changeInInventory', 'profitLoss', 'cashflowFromInvestment', 'cashflowFromFinancing',
+        'proceedsFromRepaymentsOfShortTermDebt', 'paymentsForRepurchaseOfCommonStock',
+        'paymentsForRepurchaseOfEquity', 'paymentsForRepurchaseOfPreferredStock', 'dividendPayout',
+        'dividendPayoutCommonStock', 'dividendPayoutPreferredStock',
+        'proceedsFromIssuanceOfCommonStock',
+        'proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet',
+        'proceedsFromIssuanceOfPreferredStock', 'proceedsFromRepurchaseOfEquity',
+        'proceedsFromSaleOfTreasuryStock', 'changeInCashAndCashEquivalents', 'changeInExchangeRate',
+        'netIncome',
+    ),
+}
+
+# Stable ids: new line items must only ever be appended to the lists above
+LINE_ITEM_IDS = {}
+for statement, names in STATEMENT_LINE_ITEMS.items():
+    for name in names:
+        LINE_ITEM_IDS[(statement, name)] = len(LINE_ITEM_IDS) + 1
+
+FACT_INSERT = '''
+INSERT OR REPLACE INTO financial_facts (symbol, reportType, fiscalDateEnding, line_item_id, value)
+VALUES (?, ?, ?, ?, ?)
+'''
+
+_seeded = set()
+
+
+def parse_amount(value):
+    """
+    Whole currency units as an int, or None for "None", empty and unparsable values.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if text in ('', 'None', 'null', '-'):
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return int(round(float(text)))
+        except (ValueError, OverflowError):
+            return None
+
+
+def seed_line_items(db):
+    """
+    Writes the line_items dimension once per database file and process.
+    """
+    if db.path in _seeded:
+        return
+    with db.unit() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO line_items (id, statement, name) VALUES (?, ?, ?)",
+            [(item_id, statement, name) for (statement, name), item_id in LINE_ITEM_IDS.items()])
+    _seeded.add(db.path)
+
+
+def fact_rows(statement, row):
+    """
+    financial_facts rows for one statement row laid out as
+    (symbol, fiscalDateEnding, reportType, reportedCurrency, *amounts).
+    """
+    symbol, fiscal_date, report_type = row[0], row[1], row[2]
+    return [(symbol, report_type, fiscal_date, LINE_ITEM_IDS[(statement, name)], value)
+            for name, value in zip(STATEMENT_LINE_ITEMS[statement], row[4:])
+            if value is not None]
+
@@ -0,0 +1,359 @@
+# intraday_pyramid.py
+"""
+Daily, weekly and monthly aggregates of company_intraday_data for the
+/intraday chart.
+
+intraday.sql returns every hourly close in the requested range, tens of
+thousands of points for a multi-year chart a few hundred pixels wide. The
+build below aggregates each symbol's bars into
+
+    intraday_daily     one row per trading day
+    intraday_weekly    weeks starting on Monday
+    intraday_monthly   calendar months
+
+(open of the first bar, max high, min low, close of the last bar, summed
+volume). A request with a point budget is answered from the coarsest
+resolution that still has at least that many points in the range, reduced to
+the budget with largest-triangle-three-buckets (LTTB). The route in
+app/backend/dataRoute.js does the same in JavaScript; series() is the Python
+version.
+
+store_intraday_rows and bulk_loader.store_intraday_frame hand the time span of
+the bars they store to record_rows/record_frame inside their unit. Once the
+batch is committed, only the days, weeks and months overlapping that span are
+re-aggregated; a symbol that was never built is built in full. `build` redoes
+whole symbols, by default those whose coverage was fetched after their last
+full build.
+
+Usage:
+    python intraday_pyramid.py build [path/to/finance_data.db] [--full] [--benchmark]
+"""
+
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+import numpy as np
+
+from ohlcv_store import BAR_DTYPE
+from storage import DB_PATH, get_db
+
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'backend', 'sql_queries')
+
+DAY = 86400
+
+# Coarsest first, the order resolutions are tried in
+RESOLUTIONS = ('monthly', 'weekly', 'daily')
+TABLES = {resolution: f"intraday_{resolution}" for resolution in RESOLUTIONS}
+
+# LTTB buckets wider than this are scanned with NumPy
+LTTB_NUMPY_BUCKET = 64
+
+AGGREGATE_INSERT = '''
+INSERT INTO {table} (symbol, datetime, period_start, open, high, low, close, volume, bars)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# {FinanceDB: {symbol: (first epoch, last epoch)}} waiting for that connection's commit
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def period_starts(times, resolution):
+    """
+    Epoch seconds of the day, week (Monday) or month each epoch falls in.
+    """
+    days = times // DAY
+    if resolution == 'daily':
+        return days * DAY
+    if resolution == 'weekly':
+        # Day 0 (1970-01-01) was a Thursday
+        return (days - (days + 3) % 7) * DAY
+    return times.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+
+
+def period_end(start, resolution):
+    """
+    Epoch seconds of the period after the one starting at `start`.
+    """
+    if resolution == 'daily':
+        return start + DAY
+    if resolution == 'weekly':
+        return start + 7 * DAY
+    return int((np.datetime64(start, 's').astype('datetime64[M]') + 1).astype('datetime64[s]').astype(np.int64))
+
+
+def aggregate_rows(symbol, bars, resolution):
+    """
+    AGGREGATE_INSERT rows for a symbol's bars (sorted by datetime).
+    """
+    if len(bars) == 0:
+        return []
+    starts = period_starts(bars['datetime'], resolution)
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    last = np.r_[first[1:] - 1, len(bars) - 1]
+    columns = (
+        bars['datetime'][last].tolist(),
+        starts[first].tolist(),
+        bars['open'][first].tolist(),
+        np.fmax.reduceat(bars['high'], first).tolist(),
+        np.fmin.reduceat(bars['low'], first).tolist(),
+        bars['close'][last].tolist(),
+        np.add.reduceat(bars['volume'], first).tolist(),
+        (last - first + 1).tolist(),
+    )
+    return [(symbol, *row) for row in zip(*columns)]
+
+
+def stale_symbols(cursor):
+    """
+    Symbols with intraday coverage fetched since their last build (or never built).
+    """
+    return [symbol for symbol, in cursor.execute('''
+    SELECT c.symbol
+    FROM coverage c
+    LEFT JOIN intraday_pyramid_built b ON b.symbol = c.symbol
+    WHERE c.dataset = 'intraday'
+    GROUP BY c.symbol
+    HAVING MAX(b.fetched_at) IS NULL OR MAX(c.fetched_at) > MAX(b.fetched_at)
+    ''')]
+
+
+def build(db=None, symbols=None, full=False):
+    """
+    Rebuilds the aggregates of symbols; by default of every symbol stored
+    since its last build, with full=True of every symbol. Returns
+    (symbols rebuilt, aggregate rows written).
+    """
+    db = db or get_db()
+    db.flush()
+    cursor = db.cursor()
+    if symbols is None:
+        if full:
+            symbols = [row[0] for row in cursor.execute("SELECT DISTINCT symbol FROM company_intraday_data")]
+        else:
+            symbols = stale_symbols(cursor)
+    written = 0
+    for symbol in symbols:
+        fetched_at, = cursor.execute(
+            "SELECT COALESCE(MAX(fetched_at), '') FROM coverage WHERE symbol = ? AND dataset = 'intraday'",
+            (symbol,)).fetchone()
+        bars = np.array(cursor.execute('''
+        SELECT datetime, open, high, low, close, volume FROM company_intraday_data
+        WHERE symbol = ? ORDER BY datetime
+        ''', (symbol,)).fetchall(), dtype=BAR_DTYPE)
+        # One unit per symbol: a failure leaves the other symbols built
+        with db.unit() as unit_cursor:
+            for resolution, table in TABLES.items():
+                rows = aggregate_rows(symbol, bars, resolution)
+                unit_cursor.execute(f"DELETE FROM {table} WHERE symbol = ?", (symbol,))
+                unit_cursor.executemany(AGGREGATE_INSERT.format(table=table), rows)
+                written += len(rows)
+            unit_cursor.execute("INSERT OR REPLACE INTO intraday_pyramid_built (symbol, fetched_at) VALUES (?, ?)",
+                                (symbol, fetched_at))
+    db.flush()
+    return len(symbols), written
+
+
+def update(db, spans):
+    """
+    Re-aggregates the periods overlapping {symbol: (first epoch, last epoch)}
+    of newly stored bars. Symbols without a full build are built instead.
+    Returns aggregate rows written.
+    """
+    cursor = db.cursor()
+    built = {symbol for symbol, in cursor.execute("SELECT symbol FROM intraday_pyramid_built")}
+    written = build(db, [symbol for symbol in spans if symbol not in built])[1]
+    for symbol, (first, last) in spans.items():
+        if symbol not in built:
+            continue
+        periods = {resolution: period_starts(np.array([first, last], dtype=np.int64), resolution).tolist()
+                   for resolution in RESOLUTIONS}
+        start = min(low for low, high in periods.values())
+        end = max(period_end(high, resolution) for resolution, (low, high) in periods.items())
+        bars = np.array(cursor.execute('''
+        SELECT datetime, open, high, low, close, volume FROM company_intraday_data
+        WHERE symbol = ? AND datetime >= ? AND datetime < ? ORDER BY datetime
+        ''', (symbol, start, end)).fetchall(), dtype=BAR_DTYPE)
+        with db.unit() as unit_cursor:
+            for resolution, table in TABLES.items():
+                low, high = periods[resolution]
+                # The bars reach into neighbouring periods of the other resolutions; those stay as built
+                rows = [row for row in aggregate_rows(symbol, bars, resolution) if low <= row[2] <= high]
+                unit_cursor.execute(f"DELETE FROM {table} WHERE symbol = ? AND period_start BETWEEN ? AND ?",
+                                    (symbol, low, high))
+                unit_cursor.executemany(AGGREGATE_INSERT.format(table=table), rows)
+                written += len(rows)
+    db.flush()
+    return written
+
+
+def queue(db, spans):
+    """
+    Updates the aggregates for {symbol: (first epoch, last epoch)} once the
+    caller's unit is released and db's batch committed. Spans of a unit that
+    rolls back are dropped.
+    """
+    if not spans:
+        return
+
+    def stage():
+        with _pending_lock:
+            pending = _pending.get(db)
+            first = pending is None
+            if first:
+                pending = _pending[db] = {}
+            for symbol, (low, high) in spans.items():
+                known = pending.get(symbol)
+                pending[symbol] = (low, high) if known is None else (min(known[0], low), max(known[1], high))
+        if first:
+            db.after_commit(lambda: flush(db))
+
+    db.after_unit(stage)
+
+
+def flush(db):
+    with _pending_lock:
+        pending = _pending.pop(db, None)
+    if pending:
+        update(db, pending)
+
+
+def record_rows(db, rows):
+    """
+    Queues the span of store_intraday_rows' (symbol, epoch, ...) rows, inside its unit.
+    """
+    spans = {}
+    for symbol, epoch, *_ in rows:
+        known = spans.get(symbol)
+        spans[symbol] = (epoch, epoch) if known is None else (min(known[0], epoch), max(known[1], epoch))
+    queue(db, spans)
+
+
+def record_frame(db, frame):
+    """
+    Queues the span of a bulk_loader canonical frame, inside its unit.
+    """
+    spans = frame.groupby('symbol', sort=False)['datetime'].agg(['min', 'max'])
+    queue(db, {symbol: (int(low), int(high)) for symbol, low, high in spans.itertuples()})
+
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the `threshold` points of (x, y) kept by largest-triangle-
+    three-buckets: the first and last point, and from each of threshold - 2
+    equal buckets in between the point forming the largest triangle with the
+    point kept before it and the average of the next bucket.
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.floor(np.linspace(1, count - 1, threshold - 1)).astype(np.int64)
+    # Average of every bucket, and of the last point for the last bucket
+    widths = np.diff(edges)
+    next_x = np.r_[np.add.reduceat(x[:-1], edges[:-1])[1:] / widths[1:], x[-1]].tolist()
+    next_y = np.r_[np.add.reduceat(y[:-1], edges[:-1])[1:] / widths[1:], y[-1]].tolist()
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    # Narrow buckets are cheaper in plain Python than as NumPy slices
+    xs, ys = x.tolist(), y.tolist()
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(edges[:-1].tolist(), edges[1:].tolist())):
+        # Twice the triangle areas; the factor does not change the arg max
+        px, py = xs[previous], ys[previous]
+        dx, dy = px - next_x[bucket], next_y[bucket] - py
+        if end - start > LTTB_NUMPY_BUCKET:
+            areas = np.abs(dx * (y[start:end] - py) - (px - x[start:end]) * dy)
+            previous = start + int(areas.argmax())
+        else:
+            areas = [abs(dx * (ys[i] - py) - (px - xs[i]) * dy) for i in range(start, end)]
+            previous = start + areas.index(max(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def pick_resolution(counts, points):
+    """
+    The coarsest of RESOLUTIONS with at least `points` points, from
+    {'monthly': n, 'weekly': n, 'daily': n}, else 'hourly'.
+    """
+    return next((resolution for resolution in RESOLUTIONS if counts[resolution] >= points), 'hourly')
+
+
+def read_query(name):
+    with open(os.path.join(QUERY_DIR, name)) as f:
+        return f.read()
+
+
+def series(cursor, symbol, start, end, points):
+    """
+    What /intraday returns for a point budget: (resolution, [(datetime, close)]).
+    start and end are the route's 'YYYY-MM-DD HH:MM:SS' bounds.
+    """
+    counts = dict(zip(RESOLUTIONS, cursor.execute(read_query('intraday_resolution.sql'), (symbol, start, end)).fetchone()))
+    resolution = pick_resolution(counts, points)
+    if resolution == 'hourly':
+        rows = cursor.execute(read_query('intraday.sql'), (symbol, start, end)).fetchall()
+    else:
+        rows = cursor.execute(read_query('intraday_pyramid.sql'), (resolution, symbol, start, end)).fetchall()
+    if len(rows) <= points:
+        return resolution, rows
+    times = np.array([row[0] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    kept = lttb(times, [row[1] for row in rows], points)
+    return resolution, [rows[index] for index in kept]
+
+
+def benchmark(path, symbols, ranges, points, repeats=3):
+    """
+    Per-request milliseconds and JSON payload bytes of intraday.sql against
+    series() for each range. Returns {range: {...}}.
+    """
+    cursor = sqlite3.connect(path, cached_statements=0).cursor()
+    hourly_query = read_query('intraday.sql')
+    results = {}
+    for start, end in ranges:
+        raw_ms, pyramid_ms, raw_bytes, pyramid_bytes, resolutions = [], [], [], [], set()
+        for attempt in range(repeats):
+            for symbol in symbols:
+                started = time.perf_counter()
+                rows = cursor.execute(hourly_query, (symbol, start, end)).fetchall()
+                raw_ms.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                resolution, reduced = series(cursor, symbol, start, end, points)
+                pyramid_ms.append((time.perf_counter() - started) * 1000)
+                if attempt == 0:
+                    raw_bytes.append(len(json.dumps([{'datetime': d, 'close': c} for d, c in rows])))
+                    pyramid_bytes.append(len(json.dumps([{'datetime': d, 'close': c} for d, c in reduced])))
+                    resolutions.add(resolution)
+        results[f"{start[:10]}..{end[:10]}"] = {
+            'hourly_ms': statistics.median(raw_ms), 'pyramid_ms': statistics.median(pyramid_ms),
+            'hourly_bytes': statistics.median(raw_bytes), 'pyramid_bytes': statistics.median(pyramid_bytes),
+            'resolutions': sorted(resolutions),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args or args[0] != 'build':
+        raise SystemExit("Usage: python intraday_pyramid.py build [path/to/finance_data.db] [--full] [--benchmark]")
+    path = args[1] if len(args) > 1 else DB_PATH
+    started = time.perf_counter()
+    symbols, written = build(get_db(path), full='--full' in sys.argv)
+    print(f"Built {written} aggregate rows for {symbols} symbols in {time.perf_counter() - started:.1f}s")
+    if '--benchmark' in sys.argv:
+        sample = [row[0] for row in sqlite3.connect(path).execute(
+            "SELECT DISTINCT symbol FROM intraday_daily LIMIT 10")]
+        ranges = [('2016-01-01 00:00:00', '2024-12-31 23:59:59'), ('2020-01-01 00:00:00', '2020-12-31 23:59:59'),
+                  ('2020-01-01 00:00:00', '2020-03-31 23:59:59')]
+        for name, result in benchmark(path, sample, ranges, points=800).items():
+            print(f"  {name}: {result['hourly_ms']:.2f} ms / {result['hourly_bytes'] / 1024:.0f} KB hourly -> "
+                  f"{result['pyramid_ms']:.2f} ms / {result['pyramid_bytes'] / 1024:.0f} KB "
+                  f"({', '.join(result['resolutions'])}) at 800 points")
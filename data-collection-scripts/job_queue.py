@@ -0,0 +1,220 @@
+# job_queue.py
+"""
+Durable work queue shared by the collectors.
+
+Every unit of collection work is one row of job_queue.db:
+
+    jobs (dataset, symbol, period, state, attempts, last_error, worker, lease_until)
+
+with state pending -> in_flight -> done, or back to pending after a failure
+until MAX_ATTEMPTS is reached (then failed). Collectors enqueue their whole grid
+(INSERT OR IGNORE, so finished work is never redone), then claim jobs one at a
+time. A claim is a lease: the jobs of a worker that crashed or was killed become
+claimable again once it expires, and claims happen under BEGIN IMMEDIATE so any
+number of worker processes can share one queue without taking the same job.
+
+A job is marked done only after the rows it stored are committed
+(FinanceDB.after_commit), so a crash never loses work that was reported done.
+
+Periods: 'YYYY-MM' for intraday and news, 'all' for the statements.
+
+Usage:
+    python job_queue.py [status|reset|retry-failed] [dataset]
+"""
+
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import metrics
+
+QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'job_queue.db')
+LEASE_SECONDS = 30 * 60
+MAX_ATTEMPTS = 5
+
+STATES = ('pending', 'in_flight', 'done', 'failed')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        dataset TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        period TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        worker TEXT,
+        lease_until REAL,
+        updated_at REAL,
+        UNIQUE (dataset, symbol, period)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (dataset, state, id);
+'''
+
+Job = namedtuple('Job', ['id', 'dataset', 'symbol', 'period', 'attempts'])
+
+
+def default_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    One connection to the queue file. Safe to share between threads; open one
+    JobQueue per process.
+    """
+
+    def __init__(self, path=QUEUE_PATH, worker=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.worker = worker or default_worker()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def enqueue(self, dataset, items):
+        """
+        Adds (symbol, period) jobs that are not queued yet. Returns how many
+        were added.
+        """
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (dataset, symbol, period, updated_at) VALUES (?, ?, ?, ?)",
+                [(dataset, symbol, period, now) for symbol, period in items])
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def claim(self, dataset, limit=1):
+        """
+        Leases up to `limit` pending jobs (or jobs whose lease has expired) to
+        this worker, oldest first. Returns a list of Job.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute('''
+                SELECT id, dataset, symbol, period, attempts FROM jobs
+                WHERE dataset = ?
+                  AND (state = 'pending' OR (state = 'in_flight' AND lease_until < ?))
+                ORDER BY id
+                LIMIT ?
+                ''', (dataset, now, limit)).fetchall()
+                self.conn.executemany('''
+                UPDATE jobs SET state = 'in_flight', attempts = attempts + 1, worker = ?,
+                                lease_until = ?, updated_at = ?
+                WHERE id = ?
+                ''', [(self.worker, now + self.lease_seconds, now, row[0]) for row in rows])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [Job(job_id, dataset, symbol, period, attempts + 1) for job_id, dataset, symbol, period, attempts in rows]
+
+    def jobs(self, dataset):
+        """
+        Claims and yields jobs one at a time until none are left.
+        """
+        while True:
+            claimed = self.claim(dataset)
+            if not claimed:
+                return
+            yield claimed[0]
+
+    def done(self, job):
+        self._set(job, 'done', None)
+
+    def fail(self, job, error):
+        """
+        Records a failed attempt. The job is retried by a later claim until it
+        has been attempted max_attempts times.
+        """
+        state = 'failed' if job.attempts >= self.max_attempts else 'pending'
+        metrics.inc('retries_total' if state == 'pending' else 'jobs_failed_total', reason='job_attempt', dataset=job.dataset)
+        self._set(job, state, str(error))
+
+    def complete(self, job, db):
+        """
+        Marks job done once everything db has stored so far is committed.
+        """
+        db.after_commit(lambda: self.done(job))
+
+    def _set(self, job, state, error):
+        with self.lock:
+            self.conn.execute('''
+            UPDATE jobs SET state = ?, last_error = COALESCE(?, last_error), lease_until = NULL, updated_at = ?
+            WHERE id = ? AND worker = ?
+            ''', (state, error, time.time(), job.id, self.worker))
+
+    def reset(self, dataset=None):
+        """
+        Returns every in-flight job to pending. Only for when no worker is running.
+        """
+        return self._update("UPDATE jobs SET state = 'pending', lease_until = NULL WHERE state = 'in_flight'", dataset)
+
+    def retry_failed(self, dataset=None):
+        return self._update("UPDATE jobs SET state = 'pending', attempts = 0 WHERE state = 'failed'", dataset)
+
+    def _update(self, query, dataset):
+        with self.lock:
+            if dataset is None:
+                return self.conn.execute(query).rowcount
+            return self.conn.execute(f"{query} AND dataset = ?", (dataset,)).rowcount
+
+    def stats(self):
+        """
+        {dataset: {state: jobs}}.
+        """
+        counts = {}
+        with self.lock:
+            for dataset, state, jobs in self.conn.execute(
+                    "SELECT dataset, state, COUNT(*) FROM jobs GROUP BY dataset, state"):
+                counts.setdefault(dataset, dict.fromkeys(STATES, 0))[state] = jobs
+        return counts
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def month_jobs(tickers, years, months=range(1, 13)):
+    """
+    (symbol, 'YYYY-MM') jobs for every ticker and month.
+    """
+    return [(ticker, f"{year}-{month:02d}") for ticker in tickers for year in years for month in months]
+
+
+def period_month(period):
+    """
+    (year, month) for a 'YYYY-MM' period.
+    """
+    return int(period[:4]), int(period[5:7])
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    dataset = sys.argv[2] if len(sys.argv) > 2 else None
+    job_queue = JobQueue()
+    if command == 'status':
+        for name, states in sorted(job_queue.stats().items()):
+            if dataset in (None, name):
+                print(f"{name}: " + ", ".join(f"{states[state]} {state}" for state in STATES))
+    elif command == 'reset':
+        print(f"Returned {job_queue.reset(dataset)} in-flight jobs to pending.")
+    elif command == 'retry-failed':
+        print(f"Returned {job_queue.retry_failed(dataset)} failed jobs to pending.")
+    else:
+        raise SystemExit("Usage: python job_queue.py [status|reset|retry-failed] [dataset]")
+    job_queue.close()
@@ -0,0 +1,293 @@
+# metrics.py
+"""
+Counters, timers and histograms for the collectors.
+
+Off unless COLLECTOR_METRICS names an output file:
+
+    COLLECTOR_METRICS=metrics.prom python company-news.py     Prometheus text format
+    COLLECTOR_METRICS=metrics.json python pipeline.py news    JSON
+
+Every COLLECTOR_METRICS_INTERVAL seconds (default 60), and once more at exit,
+a summary is printed and the file is rewritten. Worker processes write
+`<name>-<pid>.<ext>` next to it.
+
+Metrics recorded across the collectors:
+
+    av_requests_total{function,source}   calls by source: network, cache, replay_miss
+    av_request_seconds{function}         network latency
+    av_response_bytes{function}          response body size
+    av_rate_limited_total{function}      quota notices received
+    json_decode_seconds{function}        decoding response bodies (av_get responses)
+    parse_seconds{function}              parse_* functions
+    probe_seconds{function}              existence checks (intraday_month_exists, ...)
+    store_seconds{function}              store_* functions
+    rows_written_total{table}            rows handed to INSERT/UPSERT
+    db_commit_seconds, db_commits_total, db_units_committed_total
+    retries_total{reason}                key rotations, async retries and job attempts to retry
+    jobs_failed_total{dataset}           jobs out of attempts
+
+Disabled, timed() returns the function undecorated and the other helpers
+return at once, so instrumentation can stay on the hot paths.
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+OUTPUT_PATH = os.getenv('COLLECTOR_METRICS', '')
+INTERVAL = float(os.getenv('COLLECTOR_METRICS_INTERVAL', '60'))
+ENABLED = bool(OUTPUT_PATH)
+
+# Upper bounds per unit, chosen by the metric name's suffix
+BUCKETS = {
+    '_seconds': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    '_bytes': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+}
+DEFAULT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def buckets_for(name):
+    return next((bounds for suffix, bounds in BUCKETS.items() if name.endswith(suffix)), DEFAULT_BUCKETS)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout.
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (the largest bound if
+        it is past the last one).
+        """
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets_for(name))
+            histogram.observe(value)
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_label_text(labels)} {value:g}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip((*(f"{bound:g}" for bound in histogram.bounds), '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def as_json(self):
+        with self.lock:
+            counters, histograms = {}, {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, []).append({
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'buckets': dict(zip((*(f"{bound:g}" for bound in histogram.bounds), '+Inf'), histogram.counts)),
+                })
+        return {'generated_at': time.time(), 'uptime_s': time.time() - self.started,
+                'counters': counters, 'histograms': histograms}
+
+    def summary(self):
+        """
+        One line per metric series, for the periodic progress print.
+        """
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{_label_text(labels)} = {value:g}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                mean = histogram.sum / histogram.count if histogram.count else 0.0
+                if name.endswith('_seconds'):
+                    lines.append(f"{name}{_label_text(labels)}: {histogram.count} x {mean * 1000:.1f} ms, "
+                                 f"p95 <= {histogram.quantile(0.95) * 1000:g} ms, total {histogram.sum:.1f}s")
+                else:
+                    lines.append(f"{name}{_label_text(labels)}: {histogram.count} x {mean:.0f}, "
+                                 f"p95 <= {histogram.quantile(0.95):g}, total {histogram.sum:g}")
+        return lines
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        registry.inc(name, value, _labels(labels))
+
+
+def observe(name, value, **labels):
+    if ENABLED:
+        registry.observe(name, value, _labels(labels))
+
+
+class _Timer:
+
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.name, time.perf_counter() - self.started, self.labels)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """
+    Context manager observing the seconds its block takes.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, _labels(labels))
+
+
+def timed(name, **labels):
+    """
+    Decorator observing each call's seconds in histogram `name`, labelled with
+    function=<the function's name> unless labels are given.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        key = _labels(labels or {'function': fn.__name__})
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - started, key)
+        return wrapper
+    return decorate
+
+
+def output_path(path=OUTPUT_PATH):
+    """
+    The file this process writes: worker processes get their pid appended.
+    """
+    if multiprocessing.parent_process() is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{os.getpid()}{ext}"
+
+
+def write(path=None):
+    """
+    Writes every metric to path, as JSON for .json files and in the
+    Prometheus text format otherwise.
+    """
+    path = path or output_path()
+    text = json.dumps(registry.as_json(), indent=2) if path.endswith('.json') else registry.prometheus()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def report():
+    lines = registry.summary()
+    if lines:
+        print(f"[metrics] after {time.time() - registry.started:.0f}s:")
+        for line in lines:
+            print(f"[metrics]   {line}")
+    write()
+
+
+def _report_loop():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            report()
+        except Exception as e:
+            print(f"[metrics] report failed: {e}")
+
+
+if ENABLED:
+    threading.Thread(target=_report_loop, name='metrics-report', daemon=True).start()
+    # Registered before storage's close_all, so it runs after the final commit
+    atexit.register(report)
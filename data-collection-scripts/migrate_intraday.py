@@ -0,0 +1,132 @@
+# migrate_intraday.py
+"""
+Rebuilds company_intraday_data in the keyed layout used by store_intraday_data:
+
+    symbol TEXT, datetime INTEGER (epoch seconds), open/high/low/close REAL,
+    volume INTEGER, PRIMARY KEY (symbol, datetime), WITHOUT ROWID
+
+Duplicate bars left behind by reruns of the old plain INSERT are dropped (the
+first stored copy wins). With --benchmark the served intraday range query is
+timed against the old and the new table.
+
+Usage:
+    python migrate_intraday.py [path/to/finance_data.db] [--benchmark]
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+from storage import DB_PATH
+
+SERVED_QUERY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'app', 'backend', 'sql_queries', 'intraday.sql')
+
+# intraday.sql as served before the migration
+LEGACY_QUERY = '''
+SELECT
+  datetime,
+  close
+FROM company_intraday_data
+WHERE symbol    = ?
+  AND datetime >= ?
+  AND datetime <= ?
+ORDER BY datetime ASC;
+'''
+
+# (start, end) ranges the frontend requests: one quarter and one year
+BENCHMARK_RANGES = [('2020-04-01', '2020-06-30'), ('2022-01-01', '2022-12-31')]
+
+
+def is_migrated(conn):
+    column = conn.execute(
+        "SELECT type FROM pragma_table_info('company_intraday_data') WHERE name = 'datetime'"
+    ).fetchone()
+    return column is not None and column[0].upper() == 'INTEGER'
+
+
+def benchmark(conn, query, symbols, repeats=5):
+    """
+    Runs query for every symbol and range `repeats` times. Returns the median
+    per-call time in milliseconds and the number of rows returned per pass.
+    """
+    timings = []
+    rows = 0
+    for attempt in range(repeats):
+        for symbol in symbols:
+            for start, end in BENCHMARK_RANGES:
+                started = time.perf_counter()
+                result = conn.execute(query, (symbol, start, end)).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+                if attempt == 0:
+                    rows += len(result)
+    return statistics.median(timings), rows
+
+
+def migrate(conn):
+    before = conn.execute("SELECT COUNT(*) FROM company_intraday_data").fetchone()[0]
+    conn.execute("BEGIN")
+    conn.execute("DROP TABLE IF EXISTS company_intraday_data_keyed")
+    conn.execute('''
+    CREATE TABLE company_intraday_data_keyed (
+        symbol TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        PRIMARY KEY (symbol, datetime)
+    ) WITHOUT ROWID
+    ''')
+    # Insert in key order so the b-tree is built append-only
+    conn.execute('''
+    INSERT OR IGNORE INTO company_intraday_data_keyed (symbol, datetime, open, high, low, close, volume)
+    SELECT symbol, CAST(strftime('%s', datetime) AS INTEGER),
+           CAST(open AS REAL), CAST(high AS REAL), CAST(low AS REAL), CAST(close AS REAL),
+           CAST(volume AS INTEGER)
+    FROM company_intraday_data
+    WHERE symbol IS NOT NULL AND strftime('%s', datetime) IS NOT NULL
+    ORDER BY symbol, 2, rowid
+    ''')
+    conn.execute("DROP TABLE company_intraday_data")
+    conn.execute("ALTER TABLE company_intraday_data_keyed RENAME TO company_intraday_data")
+    # Empty the manifest so CoverageIndex rebuilds it against the new layout
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'coverage'").fetchone():
+        conn.execute("DELETE FROM coverage")
+    conn.execute("COMMIT")
+    after = conn.execute("SELECT COUNT(*) FROM company_intraday_data").fetchone()[0]
+    print(f"Migrated company_intraday_data: {before} rows -> {after} rows ({before - after} duplicates dropped).")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    run_benchmark = '--benchmark' in sys.argv
+    path = args[0] if args else DB_PATH
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    if is_migrated(conn):
+        print(f"{path}: company_intraday_data is already migrated.")
+        sys.exit(0)
+
+    with open(SERVED_QUERY_PATH) as f:
+        served_query = f.read()
+    symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM company_intraday_data LIMIT 10")]
+
+    if run_benchmark:
+        before_ms, before_rows = benchmark(conn, LEGACY_QUERY, symbols)
+
+    started = time.perf_counter()
+    migrate(conn)
+    print(f"Migration took {time.perf_counter() - started:.1f}s")
+
+    if run_benchmark:
+        after_ms, after_rows = benchmark(conn, served_query, symbols)
+        print(f"intraday range query over {len(symbols)} symbols x {len(BENCHMARK_RANGES)} ranges:")
+        print(f"  before: {before_ms:8.2f} ms median per request, {before_rows} rows")
+        print(f"  after:  {after_ms:8.2f} ms median per request, {after_rows} rows")
+
+    conn.execute("VACUUM")
+    conn.close()
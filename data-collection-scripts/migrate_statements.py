@@ -0,0 +1,160 @@
+# migrate_statements.py
+"""
+Rebuilds income_statement, balance_sheet and cash_flow with INTEGER amount
+columns and fills the long-format financial_facts table.
+
+Amounts stored as text by earlier versions of the store functions are parsed
+with parse_amount: "None" and empty strings become NULL, everything else a
+whole number. financial_facts is recomputed from the typed tables on every run,
+so the script also repairs the facts of an already migrated database. With
+--benchmark the served Sankey queries are timed before and after.
+
+Usage:
+    python migrate_statements.py [path/to/finance_data.db] [--benchmark]
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+from financial_facts import FACT_INSERT, LINE_ITEM_IDS, STATEMENT_LINE_ITEMS, fact_rows, parse_amount
+from storage import DB_PATH, SCHEMA
+
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'backend', 'sql_queries')
+
+# Queries behind the /*_senkey routes, all called with (symbol, start, end, report_type)
+SANKEY_QUERIES = {
+    'balance_sheet': 'balance_sheet_senkey2.sql',
+    'cash_flow': 'cash_flow_senkey.sql',
+    'income_statement': 'income_statement_senkey.sql',
+}
+
+BENCHMARK_RANGES = [('2020-01-01', '2020-12-31'), ('2022-01-01', '2022-12-31')]
+REPORT_TYPES = ('annual', 'quarterly')
+
+
+def is_migrated(conn):
+    column = conn.execute(
+        "SELECT type FROM pragma_table_info('income_statement') WHERE name = 'totalRevenue'"
+    ).fetchone()
+    return column is not None and column[0].upper() == 'INTEGER'
+
+
+def typed_table_ddl(table, name):
+    amounts = ',\n'.join(f'        {column} INTEGER' for column in STATEMENT_LINE_ITEMS[table])
+    return f'''
+    CREATE TABLE {name} (
+        symbol TEXT,
+        fiscalDateEnding TEXT,
+        reportType TEXT,
+        reportedCurrency TEXT,
+{amounts},
+        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
+    )
+    '''
+
+
+def benchmark(conn, symbols, repeats=5):
+    """
+    Runs every Sankey query for each symbol, report type and range `repeats`
+    times. Returns {table: (median ms per call, rows per pass)}.
+    """
+    results = {}
+    for table, filename in SANKEY_QUERIES.items():
+        with open(os.path.join(QUERY_DIR, filename)) as f:
+            query = f.read()
+        timings = []
+        rows = 0
+        for attempt in range(repeats):
+            for symbol in symbols:
+                for report_type in REPORT_TYPES:
+                    for start, end in BENCHMARK_RANGES:
+                        started = time.perf_counter()
+                        result = conn.execute(query, (symbol, start, end, report_type)).fetchall()
+                        timings.append((time.perf_counter() - started) * 1000)
+                        if attempt == 0:
+                            rows += len(result)
+        results[table] = (statistics.median(timings), rows)
+    return results
+
+
+def convert(conn, table):
+    """
+    Copies table into a typed replacement with every amount parsed. Returns the
+    number of amounts that were not numbers (now NULL).
+    """
+    columns = ('symbol', 'fiscalDateEnding', 'reportType', 'reportedCurrency', *STATEMENT_LINE_ITEMS[table])
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY symbol, fiscalDateEnding, reportType")
+    converted = []
+    nulled = 0
+    for row in rows:
+        amounts = tuple(parse_amount(value) for value in row[4:])
+        nulled += sum(1 for value, amount in zip(row[4:], amounts) if amount is None and value is not None)
+        converted.append(row[:4] + amounts)
+    conn.execute(f"DROP TABLE IF EXISTS {table}_typed")
+    conn.execute(typed_table_ddl(table, f"{table}_typed"))
+    conn.executemany(
+        f"INSERT INTO {table}_typed ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", converted)
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_typed RENAME TO {table}")
+    return nulled
+
+
+def rebuild_facts(conn):
+    conn.executemany("INSERT OR IGNORE INTO line_items (id, statement, name) VALUES (?, ?, ?)",
+                     [(item_id, statement, name) for (statement, name), item_id in LINE_ITEM_IDS.items()])
+    conn.execute("DELETE FROM financial_facts")
+    written = 0
+    for table, names in STATEMENT_LINE_ITEMS.items():
+        rows = conn.execute(
+            f"SELECT symbol, fiscalDateEnding, reportType, reportedCurrency, {', '.join(names)} FROM {table}")
+        facts = [fact for row in rows for fact in fact_rows(table, row)]
+        conn.executemany(FACT_INSERT, facts)
+        written += len(facts)
+    return written
+
+
+def migrate(conn):
+    # Creates line_items / financial_facts on databases that predate them
+    conn.executescript(SCHEMA)
+    migrated = is_migrated(conn)
+    conn.execute("BEGIN")
+    if not migrated:
+        for table in STATEMENT_LINE_ITEMS:
+            nulled = convert(conn, table)
+            print(f"Migrated {table}: {nulled} non-numeric amounts stored as NULL.")
+    facts = rebuild_facts(conn)
+    conn.execute("COMMIT")
+    print(f"Stored {facts} rows in financial_facts.")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    run_benchmark = '--benchmark' in sys.argv
+    path = args[0] if args else DB_PATH
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    if is_migrated(conn):
+        print(f"{path}: statement tables are already migrated, rebuilding financial_facts only.")
+    symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM income_statement LIMIT 10")]
+
+    if run_benchmark:
+        before = benchmark(conn, symbols)
+
+    started = time.perf_counter()
+    migrate(conn)
+    print(f"Migration took {time.perf_counter() - started:.1f}s")
+
+    if run_benchmark:
+        after = benchmark(conn, symbols)
+        print(f"Sankey queries over {len(symbols)} symbols x {len(REPORT_TYPES)} report types "
+              f"x {len(BENCHMARK_RANGES)} ranges:")
+        for table in SANKEY_QUERIES:
+            print(f"  {table}:")
+            print(f"    before: {before[table][0]:8.3f} ms median per request, {before[table][1]} rows")
+            print(f"    after:  {after[table][0]:8.3f} ms median per request, {after[table][1]} rows")
+
+    conn.execute("VACUUM")
+    conn.close()
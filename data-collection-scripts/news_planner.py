@@ -0,0 +1,209 @@
+# news_planner.py
+"""
+Request coalescing for the NEWS_SENTIMENT collectors.
+
+store_news_sentiment keeps every ticker_sentiment entry of an article, and the
+coverage index counts them per (ticker, month). A month's window for one ticker
+is therefore covered (NEWS_MIN_ARTICLES mentions) as soon as enough articles
+fetched for *other* tickers mention it. The 60 large caps are mentioned
+together constantly, so most windows never need their own request.
+
+NewsPlanner learns from the stored articles how many mentions of each tracked
+ticker a request for another ticker brings back in a typical month. It orders
+the windows month by month with the "hub" tickers first, and answers, right
+before each request, whether the window is still worth fetching:
+
+    - its ticker is not covered yet, or
+    - its feed is expected to cover at least one ticker that is not covered yet
+
+The second rule fetches a few hubs even when they are covered themselves,
+because their feeds cover the rarely mentioned tickers that would otherwise
+each cost a request.
+
+NEWS_SENTIMENT's `tickers` filter is an AND (only articles mentioning every
+listed ticker), so a multi-ticker request returns a subset of each
+single-ticker window and cannot replace them. Requests stay single-ticker.
+
+Usage:
+    python news_planner.py [plan|simulate]
+
+`simulate` replays the stored articles as if they were the API's answers and
+compares the calls each strategy needs.
+"""
+
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from coverage_index import NEWS_MIN_ARTICLES, get_coverage, month_periods
+from news_windows import news_month_covered
+from storage import get_db
+
+YEARS = range(2016, 2025)
+
+
+def tracked_mentions(db, tickers):
+    """
+    {'YYYY-MM': {article_id: [tracked tickers it mentions]}} of the stored articles.
+    """
+    placeholders = ', '.join('?' for _ in tickers)
+    rows = db.cursor().execute(f'''
+    SELECT SUBSTR(a.time_published, 1, 4) || '-' || SUBSTR(a.time_published, 5, 2), a.id, s.ticker_symbol
+    FROM news_ticker_sentiment s
+    JOIN news_articles a ON a.id = s.article_id
+    WHERE s.ticker_symbol IN ({placeholders}) AND a.time_published IS NOT NULL
+    ''', list(tickers))
+    mentions = {}
+    for period, article_id, ticker in rows:
+        mentions.setdefault(period, {}).setdefault(article_id, []).append(ticker)
+    return mentions
+
+
+def expected_mentions(mentions):
+    """
+    {ticker: {other: mentions of other per month in the articles mentioning
+    ticker}}, i.e. what a month's request for ticker is expected to add to
+    each ticker's coverage (itself included).
+    """
+    expected = {}
+    months = max(len(mentions), 1)
+    for articles in mentions.values():
+        for mentioned in articles.values():
+            for ticker in set(mentioned):
+                row = expected.setdefault(ticker, Counter())
+                for other in mentioned:
+                    row[other] += 1 / months
+    return expected
+
+
+def hub_order(tickers, expected):
+    """
+    tickers sorted by the mentions of other tickers their feeds are expected
+    to carry, most first. Ties (e.g. nothing stored yet) keep the given order.
+    """
+    def spillover(ticker):
+        return sum(rows for other, rows in expected.get(ticker, {}).items() if other != ticker)
+    return sorted(tickers, key=lambda ticker: -spillover(ticker))
+
+
+def period_window(period):
+    """
+    (time_from, time_to) of the whole-month NEWS_SENTIMENT window for 'YYYY-MM'.
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    end_date = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return f"{year}{month:02d}01T0000", end_date.strftime("%Y%m%dT2359")
+
+
+class NewsPlanner:
+    """
+    Usage:
+
+        planner = NewsPlanner(db, tickers)
+        for ticker, period in planner.windows(periods):
+            if planner.should_fetch(ticker, period):
+                ...fetch and store ticker's window for period
+
+    should_fetch reads the live coverage index, so it sees every feed stored
+    since, and re-learns the expected mentions whenever a later month comes
+    up. Safe to share between threads.
+
+    With nothing stored yet the hubs are unknown and the tickers keep the given
+    order; company_overview lists them by market cap, the best guess there is.
+    """
+
+    def __init__(self, db, tickers, min_articles=NEWS_MIN_ARTICLES):
+        self.path = db.path
+        self.tickers = list(tickers)
+        self.min_articles = min_articles
+        self.coverage = get_coverage(db)
+        self.lock = threading.Lock()
+        self.latest_period = None
+        self.refresh()
+
+    def refresh(self):
+        expected = expected_mentions(tracked_mentions(get_db(self.path), self.tickers))
+        self.expected, self.order = expected, hub_order(self.tickers, expected)
+
+    def uncovered(self, period):
+        cursor = get_db(self.path).cursor()
+        return [ticker for ticker in self.tickers
+                if not news_month_covered(self.coverage, cursor, ticker, period, self.min_articles)]
+
+    def windows(self, periods):
+        """
+        Every (ticker, period) window of the months that are not fully
+        covered, month by month with the hubs first.
+        """
+        return [(ticker, period) for period in periods if self.uncovered(period) for ticker in self.order]
+
+    def should_fetch(self, ticker, period):
+        with self.lock:
+            # Learn from the months stored so far before planning a new one
+            if self.latest_period is not None and period > self.latest_period:
+                self.refresh()
+            self.latest_period = max(period, self.latest_period or period)
+        uncovered = self.uncovered(period)
+        if ticker in uncovered:
+            return True
+        # Tickers short of mentions; a truncated month needs its own split request anyway
+        expected = self.expected.get(ticker, {})
+        return any(count < self.min_articles <= count + expected.get(other, 0)
+                   for other, count in ((other, self.coverage.count(other, 'news', period)) for other in uncovered))
+
+
+def simulate(mentions, order, expected=None, min_articles=NEWS_MIN_ARTICLES):
+    """
+    Calls needed to cover every month if each request for a ticker returned
+    the stored articles mentioning it. Windows are visited in `order` and
+    skipped once covered; with `expected` they are fetched by the
+    NewsPlanner.should_fetch rule instead. Ignores the API's 1000 article limit.
+    """
+    calls = 0
+    for articles in mentions.values():
+        feeds = {}
+        for article_id, mentioned in articles.items():
+            for ticker in set(mentioned):
+                feeds.setdefault(ticker, []).append(article_id)
+        counts = Counter()
+        seen = set()
+        for ticker in order:
+            uncovered = [other for other in order if counts[other] < min_articles]
+            if ticker not in uncovered:
+                rows = (expected or {}).get(ticker, {})
+                if not any(counts[other] + rows.get(other, 0) >= min_articles for other in uncovered):
+                    continue
+            calls += 1
+            for article_id in feeds.get(ticker, ()):
+                if article_id not in seen:
+                    seen.add(article_id)
+                    counts.update(articles[article_id])
+    return calls
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'plan'
+    conn = sqlite3.connect('company_overview.db')
+    tickers = [row[0] for row in conn.execute('SELECT DISTINCT Symbol FROM company_overview') if row[0] != 'PLTR']
+    conn.close()
+    db = get_db()
+
+    if command == 'plan':
+        planner = NewsPlanner(db, tickers)
+        periods = month_periods(YEARS)
+        windows = planner.windows(periods)
+        print(f"{len(windows) // max(len(tickers), 1)} of {len(periods)} months not fully covered, "
+              f"hubs first: {', '.join(planner.order[:10])}")
+    elif command == 'simulate':
+        mentions = tracked_mentions(db, tickers)
+        expected = expected_mentions(mentions)
+        windows = len(tickers) * len(mentions)
+        checked = simulate(mentions, tickers)
+        planned = simulate(mentions, hub_order(tickers, expected), expected)
+        print(f"{len(mentions)} months, {windows} ticker windows (one call each without coverage checks)")
+        print(f"  coverage check only: {checked} calls")
+        print(f"  news planner:        {planned} calls ({1 - planned / max(checked, 1):.0%} fewer)")
+    else:
+        raise SystemExit("Usage: python news_planner.py [plan|simulate]")
@@ -0,0 +1,178 @@
+# news_search.py
+"""
+Full-text search over news_articles.
+
+news_fts (storage.NEWS_FTS_SCHEMA) is an FTS5 index of each article's title,
+summary, source and topics, stemmed with the porter tokenizer. The text stays
+in news_articles; the index only holds terms. store_news_sentiment indexes
+every chunk of new articles with one executemany in the same unit as the
+articles, so a rolled back feed leaves no index entries behind.
+
+search() takes an FTS5 query ('fed AND rate*', '"supply chain"', 'title:merger')
+and ranks matches by BM25 with title matches weighted highest. Free text such
+as 'S&P 500' or 'year-over-year' is not valid query syntax; pass it through
+plain_query() first, as the command line does unless given --raw. A ticker
+filter joins news_ticker_sentiment and returns that ticker's sentiment and
+relevance for each article; start and end limit time_published.
+
+Articles stored before the index existed, or while NEWS_FTS=0, are indexed with:
+
+    python news_search.py backfill [--rebuild] [--optimize]
+
+Usage:
+    python news_search.py search "<text>" [ticker] [start] [end] [--raw]
+"""
+
+import os
+import re
+import sys
+
+from storage import get_db
+
+ENABLED = os.getenv('NEWS_FTS', '1') != '0'
+
+BACKFILL_CHUNK = 50000
+
+# bm25() column weights, in news_fts column order: title, summary, source, topics
+BM25_WEIGHTS = (10.0, 1.0, 0.5, 2.0)
+
+NEWS_FTS_INSERT = "INSERT INTO news_fts (rowid, title, summary, source, topics) VALUES (?, ?, ?, ?, ?)"
+
+SEARCH_COLUMNS = ('id', 'title', 'url', 'time_published', 'source', 'summary', 'overall_sentiment_score',
+                  'overall_sentiment_label', 'score')
+TICKER_COLUMNS = ('ticker_symbol', 'ticker_sentiment_score', 'ticker_sentiment_label', 'relevance_score')
+
+WORD_RE = re.compile(r"\w+")
+
+
+def index_rows(db, cursor, rows):
+    """
+    Indexes (article_id, title, summary, source, topics) rows of newly stored
+    articles, inside the unit that stores them.
+    """
+    if ENABLED and db.news_fts and rows:
+        cursor.executemany(NEWS_FTS_INSERT, rows)
+
+
+def plain_query(text):
+    """
+    An FTS5 query matching every word of free text, so input such as
+    'S&P 500' or 'AT&T' is not read as query syntax.
+    """
+    return ' '.join(f'"{word}"' for word in WORD_RE.findall(text))
+
+
+def av_time(value):
+    """
+    A 'YYYY-MM-DD[ HH:MM[:SS]]' or Alpha Vantage 'YYYYMMDDTHHMM' bound in the
+    time_published format, which compares as text.
+    """
+    return value.replace('-', '').replace(':', '').replace(' ', 'T')
+
+
+def search(query, ticker=None, start=None, end=None, limit=50, db=None):
+    """
+    Articles matching the FTS5 query, best first, as dicts of SEARCH_COLUMNS
+    (plus TICKER_COLUMNS with a ticker). score is the weighted BM25 rank,
+    lower is better. start is inclusive and end exclusive; either may be None.
+    """
+    db = db or get_db()
+    if not db.news_fts:
+        raise RuntimeError("news_fts is not available: this SQLite build has no FTS5.")
+    columns = list(SEARCH_COLUMNS)
+    ranked = ["news_fts.rowid AS id", f"bm25(news_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS score"]
+    joins = []
+    conditions = ["news_fts MATCH ?"]
+    params = [query]
+    if ticker is not None:
+        columns += TICKER_COLUMNS
+        ranked += [f"t.{column}" for column in TICKER_COLUMNS]
+        joins.append("JOIN news_ticker_sentiment t ON t.article_id = news_fts.rowid AND t.ticker_symbol = ?")
+        params.insert(0, ticker)
+    if start is not None or end is not None:
+        joins.append("JOIN news_articles a ON a.id = news_fts.rowid")
+    if start is not None:
+        conditions.append("a.time_published >= ?")
+        params.append(av_time(start))
+    if end is not None:
+        conditions.append("a.time_published < ?")
+        params.append(av_time(end))
+    # Ranked on ids alone: columns selected next to bm25() would be read for
+    # every match, not just the `limit` returned
+    rows = db.cursor().execute(f'''
+    SELECT a.id, a.title, a.url, a.time_published, a.source, a.summary, a.overall_sentiment_score,
+           a.overall_sentiment_label, r.score{''.join(f", r.{column}" for column in TICKER_COLUMNS if column in columns)}
+    FROM (
+        SELECT {', '.join(ranked)}
+        FROM news_fts
+        {' '.join(joins)}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY score
+        LIMIT ?
+    ) r
+    JOIN news_articles a ON a.id = r.id
+    ORDER BY r.score
+    ''', (*params, limit)).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def backfill(db=None, rebuild=False, optimize=False):
+    """
+    Indexes every article not in news_fts yet (with rebuild=True, clears the
+    index and reindexes all of news_articles), a chunk per commit. optimize
+    merges the index into one segment afterwards. Returns the number of
+    articles indexed.
+    """
+    db = db or get_db()
+    if not db.news_fts:
+        raise RuntimeError("news_fts is not available: this SQLite build has no FTS5.")
+    db.flush()
+    if rebuild:
+        # FTS5's own 'rebuild' is one transaction and slows down as the index
+        # outgrows the page cache; committed chunks merge as they go
+        with db.unit() as cursor:
+            cursor.execute("INSERT INTO news_fts (news_fts) VALUES ('delete-all')")
+        db.flush()
+    indexed = 0
+    last_id = -1
+    cursor = db.cursor()
+    while True:
+        bound = cursor.execute("SELECT MAX(id) FROM (SELECT id FROM news_articles WHERE id > ? ORDER BY id LIMIT ?)",
+                               (last_id, BACKFILL_CHUNK)).fetchone()[0]
+        if bound is None:
+            break
+        with db.unit() as unit_cursor:
+            # news_fts_docsize holds one row per indexed article
+            unit_cursor.execute('''
+            INSERT INTO news_fts (rowid, title, summary, source, topics)
+            SELECT id, title, summary, source, topics FROM news_articles
+            WHERE id > ? AND id <= ? AND id NOT IN (SELECT id FROM news_fts_docsize)
+            ''', (last_id, bound))
+            indexed += unit_cursor.rowcount
+        db.flush()
+        last_id = bound
+    if optimize:
+        # Rewrites the whole index in one transaction; FTS5 already merges
+        # segments incrementally as chunks are committed
+        with db.unit() as unit_cursor:
+            unit_cursor.execute("INSERT INTO news_fts (news_fts) VALUES ('optimize')")
+        db.flush()
+    return indexed
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    command = args[0] if args else 'backfill'
+    if command == 'backfill':
+        processed = backfill(rebuild='--rebuild' in sys.argv, optimize='--optimize' in sys.argv)
+        print(f"Indexed {processed} articles.")
+    elif command == 'search' and len(args) > 1:
+        query = args[1] if '--raw' in sys.argv else plain_query(args[1])
+        ticker, start, end = (args[2:5] + [None] * 3)[:3]
+        for result in search(query, ticker, start, end, limit=20):
+            sentiment = f" {result['ticker_symbol']} {result['ticker_sentiment_score']}" if ticker else ''
+            print(f"{result['score']:8.2f}  {result['time_published'][:8]}  {result['title']}{sentiment}")
+            print(f"          {(result['summary'] or '')[:100]}")
+    else:
+        raise SystemExit("Usage: python news_search.py backfill [--rebuild] [--optimize]\n"
+                         "       python news_search.py search \"<text>\" [ticker] [start] [end] [--raw]")
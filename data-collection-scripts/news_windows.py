@@ -0,0 +1,232 @@
+# news_windows.py
+"""
+Complete NEWS_SENTIMENT windows despite the 1000 article limit.
+
+A request returns at most NEWS_LIMIT articles, so a full response for a
+heavily covered ticker silently drops the rest of the window. WindowSplit
+re-requests every saturated window as smaller windows (month -> weeks -> days)
+until each one is under the limit, fetching each level's windows in parallel.
+The saturated parent responses are dropped, since their children return the
+same articles and more.
+
+Every window whose articles were kept is recorded in news_windows with its
+article count and whether it was complete (under the limit). A day that is
+still saturated cannot be split further and is recorded incomplete. If any
+window fails, the whole split reports that window's status instead, so
+"limit reached" still rotates keys and the month is requested again.
+
+A ticker-month with an incomplete news_windows record is never covered. One
+with complete records spanning the month is once the month has ended, even if
+it was empty.
+
+Otherwise it needs NEWS_MIN_ARTICLES mentions and fewer than NEWS_LIMIT (its
+own request cannot have been truncated).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import metrics
+
+NEWS_LIMIT = 1000
+SPLIT_WORKERS = 4
+
+WINDOW_FORMAT = "%Y%m%dT%H%M"
+
+NEWS_WINDOW_INSERT = '''
+INSERT OR REPLACE INTO news_windows (ticker, time_from, time_to, articles, complete, fetched_at)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+def split_window(time_from, time_to):
+    """
+    Sub-windows of [time_from, time_to]: weeks for windows longer than a week,
+    days for windows longer than a day, None for a day or less.
+    """
+    start = datetime.strptime(time_from, WINDOW_FORMAT)
+    end = datetime.strptime(time_to, WINDOW_FORMAT)
+    if end - start > timedelta(days=7):
+        step = timedelta(days=7)
+    elif end - start > timedelta(days=1):
+        step = timedelta(days=1)
+    else:
+        return None
+    windows = []
+    while start <= end:
+        # Windows are inclusive to the minute, like the whole-month ones
+        windows.append((start.strftime(WINDOW_FORMAT), min(start + step - timedelta(minutes=1), end).strftime(WINDOW_FORMAT)))
+        start += step
+    return windows
+
+
+class WindowSplit:
+    """
+    Split state for one (ticker, time_from, time_to) request. The caller
+    fetches every window of `level` (in parallel if it likes) and hands the
+    results to add() until `level` is empty:
+
+        split = WindowSplit(ticker, time_from, time_to)
+        while split.level:
+            split.add([fetch(ticker, *window) for window in split.level])
+        result = split.result()
+
+    Results follow fetch_news_sentiment: the data dict or a status string.
+    An empty sub-window ("no data") is complete; any other status ends the
+    split and becomes its result.
+    """
+
+    def __init__(self, ticker, time_from, time_to):
+        self.ticker = ticker
+        self.level = [(time_from, time_to)]
+        self.feed = []
+        self.windows = []
+        self.status = None
+        self.requests = 0
+
+    def add(self, results):
+        first = self.requests == 0
+        self.requests += len(self.level)
+        next_level = []
+        for (time_from, time_to), data in zip(self.level, results):
+            if not isinstance(data, dict):
+                if data == "no data" and not first:
+                    self.windows.append((time_from, time_to, 0, True))
+                    continue
+                # The status is the caller's ("limit reached" rotates keys), the
+                # month is requested again as a whole
+                self.status = data
+                next_level = []
+                break
+            articles = data.get("feed", [])
+            children = split_window(time_from, time_to) if len(articles) >= NEWS_LIMIT else None
+            if children:
+                next_level.extend(children)
+            else:
+                self.feed.extend(articles)
+                self.windows.append((time_from, time_to, len(articles), len(articles) < NEWS_LIMIT))
+        self.level = next_level
+
+    def result(self):
+        """
+        {'feed': [...], 'windows': [(time_from, time_to, articles, complete), ...]},
+        or the status string of the first request or of a failed window.
+        """
+        if self.status is not None:
+            return self.status
+        return {"feed": self.feed, "windows": self.windows}
+
+
+def fetch_news_windowed(ticker, time_from, time_to, api_key, workers=SPLIT_WORKERS):
+    """
+    fetch_news_sentiment for a whole window, split until every part is under
+    the article limit. Each level of sub-windows is fetched on `workers` threads.
+    """
+    from fetch_funcs import fetch_news_sentiment
+
+    split = WindowSplit(ticker, time_from, time_to)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while split.level:
+            split.add(list(pool.map(lambda window: fetch_news_sentiment(ticker, *window, api_key), split.level)))
+    return split.result()
+
+
+def empty_result(time_from, time_to):
+    """
+    The fetch_news_windowed result for a window that returned "no data": no
+    articles, and the window recorded as complete so it is not fetched again.
+    """
+    return {"feed": [], "windows": [(time_from, time_to, 0, True)]}
+
+
+def request_windows(time_from, time_to, articles):
+
+    """
+    The news_windows record for a single request of `articles` articles, as
+    WindowSplit would keep it: none for a window that is saturated and would be
+    split (its children carry the records), otherwise the window itself.
+    """
+    if time_from is None or time_to is None:
+        return []
+    if articles >= NEWS_LIMIT and split_window(time_from, time_to):
+        return []
+    return [(time_from, time_to, articles, articles < NEWS_LIMIT)]
+
+
+@metrics.timed('store_seconds')
+def store_news_windows(ticker, data, db=None):
+    """
+    store_news_sentiment for a fetch_news_windowed result, recording its
+    windows in the same unit. Returns False, recording nothing, if the feed
+    could not be stored, so the windows are fetched again.
+    """
+    from fetch_funcs import store_news_sentiment
+    from storage import get_db
+
+    db = db or get_db()
+    fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    windows = data.get("windows", [])
+    with db.unit() as cursor:
+        stored = store_news_sentiment(ticker, data, db) if data.get("feed") else False
+        if data.get("feed") and not stored:
+            # The feed was rolled back; complete windows without it would hide the gap
+            return False
+        if windows:
+
+            # Replaces the records of an earlier, differently split fetch of the same span
+            cursor.execute("DELETE FROM news_windows WHERE ticker = ? AND time_from >= ? AND time_to <= ?",
+                           (ticker, min(window[0] for window in windows), max(window[1] for window in windows)))
+        cursor.executemany(NEWS_WINDOW_INSERT, [
+            (ticker, time_from, time_to, articles, int(complete), fetched_at)
+            for time_from, time_to, articles, complete in windows])
+        metrics.inc('rows_written_total', len(windows), table='news_windows')
+    return stored
+
+
+def month_bounds(period):
+    """
+    The first and last minute of a 'YYYY-MM' month as window times.
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    start = f"{year}{month:02d}01T0000"
+    end = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(minutes=1)).strftime(WINDOW_FORMAT)
+    return start, end
+
+
+def month_windows(cursor, ticker, period):
+    """
+    (first time_from, last time_to, lowest complete flag) of the recorded
+    windows of ticker in the 'YYYY-MM' month, all None without records.
+    """
+    start, end = month_bounds(period)
+    return cursor.execute('''
+    SELECT MIN(time_from), MAX(time_to), MIN(complete) FROM news_windows
+    WHERE ticker = ? AND time_from >= ? AND time_from <= ?
+    ''', (ticker, start, end)).fetchone()
+
+
+def month_complete(cursor, ticker, period):
+    """
+    True if the recorded windows of ticker span the whole 'YYYY-MM' month and
+    are all complete.
+    """
+    start, end = month_bounds(period)
+    first, last, complete = month_windows(cursor, ticker, period)
+    return complete == 1 and first == start and last >= end
+
+
+def news_month_covered(coverage, cursor, ticker, period, min_articles):
+    """
+    Whether the ticker-month needs no further NEWS_SENTIMENT request.
+    """
+    start, end = month_bounds(period)
+    first, last, complete = month_windows(cursor, ticker, period)
+    # A window that came back saturated or failed leaves the month open, whatever the count
+    if complete == 0:
+        return False
+    # Everything the API has for an ended month is stored, even if that is nothing
+    if complete == 1 and first == start and last >= end and period < datetime.now().strftime("%Y-%m"):
+        return True
+    count = coverage.count(ticker, 'news', period)
+    # Only a request returning the limit can have been truncated
+    return min_articles <= count < NEWS_LIMIT
@@ -0,0 +1,97 @@
+# news_words.py
+"""
+Word counts behind the /wordcloud endpoint.
+
+store_news_sentiment tokenizes each new article summary once and writes its
+word counts to news_word_counts (article_id, word, count), so wordcloud.sql is
+an indexed aggregate instead of splitting every summary at request time.
+
+Articles stored before the table existed are filled in with:
+
+    python news_words.py backfill [--rebuild]
+"""
+
+import re
+import sys
+from collections import Counter
+
+from storage import get_db
+
+# Same stop words the request-time wordcloud query filtered out
+STOPWORDS = frozenset((
+    'the', 'and', 'for', 'with', 'that', 'are', 'was', 'but', 'not', 'you',
+    'all', 'can', 'has', 'have', 'had', 'this', 'from', 'they', 'will', 'his',
+    'her', 'she', 'him', 'our', 'out', 'who', 'their', 'about', 'which', 'one',
+    'when', 'were', 'there', 'been', 'more', 'would', 'what', 'your', 'than',
+    'how', 'its', 'may', 'also', 'into', 'other', 'some', 'any', 'new', 'use',
+    'used', 'using', 'such', 'these', 'those', 'over', 'most', 'after', 'before',
+    'where', 'while', 'each', 'many', 'much', 'very', 'just', 'like', 'get', 'got',
+    'see', 'did', 'does', 'then', 'now', 'off', 'per', 'via', 'etc',
+))
+
+MIN_WORD_LENGTH = 3
+
+# Words start with a letter and may contain inner dots, hyphens or apostrophes
+# ("u.s", "year-over-year", "don't"). A possessive 's is left out of the match,
+# so "company's" counts as "company".
+TOKEN_RE = re.compile(r"[a-z][a-z0-9]*(?:[.\-][a-z0-9]+|['’](?!s\b)[a-z0-9]+)*")
+
+BACKFILL_CHUNK = 5000
+
+WORD_COUNT_INSERT = "INSERT OR REPLACE INTO news_word_counts (article_id, word, count) VALUES (?, ?, ?)"
+
+
+def tokenize(text):
+    """
+    Lowercased words of text, possessives stripped.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def word_counts(text):
+    """
+    {word: count} for the words of text that belong in the word cloud.
+    """
+    if not text:
+        return {}
+    return Counter(word for word in tokenize(text)
+                   if len(word) >= MIN_WORD_LENGTH and word not in STOPWORDS)
+
+
+def word_count_rows(article_id, summary):
+    return [(article_id, word, count) for word, count in word_counts(summary).items()]
+
+
+def store_word_counts(cursor, article_id, summary):
+    cursor.executemany(WORD_COUNT_INSERT, word_count_rows(article_id, summary))
+
+
+def backfill(db=None, rebuild=False):
+    """
+    Tokenizes the summary of every article without word counts yet (all
+    articles with rebuild=True). Returns the number of articles processed.
+    """
+    db = db or get_db()
+    if rebuild:
+        with db.unit() as cursor:
+            cursor.execute("DELETE FROM news_word_counts")
+        db.flush()
+    articles = db.cursor().execute('''
+    SELECT id, summary FROM news_articles
+    WHERE summary IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM news_word_counts w WHERE w.article_id = news_articles.id)
+    ''').fetchall()
+    for start in range(0, len(articles), BACKFILL_CHUNK):
+        with db.unit() as cursor:
+            for article_id, summary in articles[start:start + BACKFILL_CHUNK]:
+                store_word_counts(cursor, article_id, summary)
+        db.flush()
+    return len(articles)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'backfill'
+    if command != 'backfill':
+        raise SystemExit("Usage: python news_words.py backfill [--rebuild]")
+    processed = backfill(rebuild='--rebuild' in sys.argv)
+    print(f"Stored word counts for {processed} articles.")
@@ -0,0 +1,323 @@
+# ohlcv_store.py
+"""
+Memory-mapped per-symbol copies of company_intraday_data.
+
+Loading a symbol's history from SQLite means a range scan and a Python tuple
+per bar. Next to finance_data.db, every symbol also gets one flat file of
+BAR_DTYPE records sorted by datetime:
+
+    ohlcv/AAPL.ohlcv    int64 epoch, float64 open/high/low/close, int64 volume
+
+bars() memory-maps the file and returns a zero-copy slice of it for a time
+range, found with searchsorted on the datetime field.
+
+store_intraday_rows and bulk_loader.store_intraday_frame hand their bars to
+the store inside their unit; they are written once the batch is committed, so
+the files never hold bars SQLite does not. Per symbol that is an append when
+the bars are newer than the file, an in-place overwrite when every bar is
+already in it (a re-fetched month), and otherwise an atomic rewrite. Bars
+committed by a process that dies before writing them are restored by
+`rebuild`. Readers reopen a file once it has been replaced or grown.
+
+OHLCV_STORE=0 turns the copies off.
+
+Usage:
+    python ohlcv_store.py rebuild [symbol ...]
+    python ohlcv_store.py read <symbol> [start] [end]
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from storage import DB_PATH, get_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single writer process is assumed
+    fcntl = None
+
+ENABLED = os.getenv('OHLCV_STORE', '1') != '0'
+STORE_DIR = 'ohlcv'
+
+BAR_DTYPE = np.dtype([
+    ('datetime', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+])
+
+EMPTY = np.empty(0, dtype=BAR_DTYPE)
+MIN_EPOCH = np.iinfo(np.int64).min
+MAX_EPOCH = np.iinfo(np.int64).max
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def to_epoch_seconds(value):
+    """
+    Epoch seconds for an int, a datetime or a 'YYYY-MM-DD[ HH:MM:SS]' string,
+    read as UTC like fetch_funcs.to_epoch.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(np.datetime64(value, 's').astype(np.int64))
+
+
+def sorted_unique(bars):
+    """
+    bars sorted by datetime, keeping the last of any repeated datetime.
+    """
+    bars = bars[np.argsort(bars['datetime'], kind='stable')]
+    keep = np.ones(len(bars), dtype=bool)
+    keep[:-1] = bars['datetime'][1:] != bars['datetime'][:-1]
+    return bars[keep]
+
+
+def bars_from_rows(rows):
+    """
+    {symbol: bars} from store_intraday_rows' (symbol, epoch, o, h, l, c, volume) rows.
+    """
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row[0], []).append(row[1:])
+    return {symbol: np.array(values, dtype=BAR_DTYPE) for symbol, values in grouped.items()}
+
+
+def bars_from_frame(frame):
+    """
+    {symbol: bars} from a bulk_loader canonical frame.
+    """
+    grouped = {}
+    for symbol, group in frame.groupby('symbol', sort=False):
+        bars = np.empty(len(group), dtype=BAR_DTYPE)
+        for field in BAR_DTYPE.names:
+            bars[field] = group[field].to_numpy()
+        grouped[symbol] = bars
+    return grouped
+
+
+class OHLCVStore:
+    """
+    The per-symbol bar files of one database, shared by every thread using it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.maps = {}
+        # {FinanceDB: {symbol: [bars, ...]}} waiting for that connection's commit
+        self.pending = {}
+
+    def path(self, symbol):
+        return os.path.join(self.root, f"{symbol}.ohlcv")
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-6] for name in os.listdir(self.root) if name.endswith('.ohlcv'))
+
+    def open(self, symbol):
+        """
+        Read-only memory map of a symbol's bars (empty if there are none). The
+        map is reused until the file is replaced or grows.
+        """
+        return self.mapped(symbol)[0]
+
+    def mapped(self, symbol):
+        """
+        (bars, their datetime field) of a symbol, mapped once per file version.
+        """
+        try:
+            stat = os.stat(self.path(symbol))
+        except FileNotFoundError:
+            return EMPTY, EMPTY['datetime']
+        key = (stat.st_ino, stat.st_size)
+        cached = self.maps.get(symbol)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        count = stat.st_size // BAR_DTYPE.itemsize
+        if count == 0:
+            bars = EMPTY
+        else:
+            # A plain ndarray view slices without np.memmap's per-call overhead
+            bars = np.memmap(self.path(symbol), dtype=BAR_DTYPE, mode='r', shape=(count,)).view(np.ndarray)
+        self.maps[symbol] = (key, (bars, bars['datetime']))
+        return self.maps[symbol][1]
+
+    def bars(self, symbol, start=None, end=None):
+        """
+        Bars of symbol with start <= datetime < end, as a view into the file.
+        start and end are epoch seconds, datetimes or date strings; either may
+        be None for an open end.
+        """
+        bars, times = self.mapped(symbol)
+        lo, hi = np.searchsorted(times, (
+            MIN_EPOCH if start is None else to_epoch_seconds(start),
+            MAX_EPOCH if end is None else to_epoch_seconds(end)))
+        return bars[lo:max(lo, hi)]
+
+    def queue(self, db, grouped):
+        """
+        Writes {symbol: bars} once the caller's unit is released and db's batch
+        committed. Bars of a unit that rolls back are dropped.
+        """
+        if not grouped:
+            return
+
+        def stage():
+            with self.lock:
+                pending = self.pending.get(db)
+                first = pending is None
+                if first:
+                    pending = self.pending[db] = {}
+                for symbol, bars in grouped.items():
+                    pending.setdefault(symbol, []).append(bars)
+            if first:
+                db.after_commit(lambda: self.flush(db))
+
+        db.after_unit(stage)
+
+    def flush(self, db):
+        with self.lock:
+            pending = self.pending.pop(db, None)
+            if not pending:
+                return
+            with self.writer_lock():
+                for symbol, parts in pending.items():
+                    self.write(symbol, np.concatenate(parts))
+
+    def writer_lock(self):
+        """
+        Exclusive lock on the directory, held by whichever process writes.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        return _FileLock(os.path.join(self.root, '.lock'))
+
+    def write(self, symbol, bars):
+        """
+        Merges bars into the symbol's file; later bars replace earlier ones
+        with the same datetime.
+        """
+        bars = sorted_unique(bars)
+        path = self.path(symbol)
+        existing = self.open(symbol)
+        if len(existing) == 0 or bars['datetime'][0] > existing['datetime'][-1]:
+            with open(path, 'ab') as f:
+                f.write(bars.tobytes())
+            return
+        times = existing['datetime']
+        positions = np.searchsorted(times, bars['datetime'])
+        if positions[-1] < len(existing) and np.array_equal(times[positions], bars['datetime']):
+            writable = np.memmap(path, dtype=BAR_DTYPE, mode='r+', shape=(len(existing),))
+            writable[positions] = bars
+            writable.flush()
+            del writable
+            return
+        self.replace(symbol, sorted_unique(np.concatenate([existing, bars])))
+
+    def replace(self, symbol, bars):
+        tmp = f"{self.path(symbol)}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(bars.tobytes())
+        os.replace(tmp, self.path(symbol))
+
+    def rebuild(self, db, symbols=None):
+        """
+        Rewrites the files of symbols (every symbol with bars by default) from
+        company_intraday_data. A full rebuild also drops files of symbols that
+        have no bars. Returns bars written.
+        """
+        if db.legacy_intraday:
+            raise RuntimeError("company_intraday_data has not been migrated yet, run migrate_intraday.py first.")
+        db.flush()
+        cursor = db.cursor()
+        full = symbols is None
+        if full:
+            symbols = [row[0] for row in cursor.execute("SELECT DISTINCT symbol FROM company_intraday_data")]
+        written = 0
+        with self.lock, self.writer_lock():
+            for symbol in symbols:
+                rows = cursor.execute('''
+                SELECT datetime, open, high, low, close, volume FROM company_intraday_data
+                WHERE symbol = ? ORDER BY datetime
+                ''', (symbol,)).fetchall()
+                self.replace(symbol, np.array(rows, dtype=BAR_DTYPE))
+                written += len(rows)
+            if full:
+                for symbol in set(self.symbols()) - set(symbols):
+                    os.remove(self.path(symbol))
+        return written
+
+
+class _FileLock:
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+def get_ohlcv_store(path=DB_PATH):
+    """
+    Returns the process-wide OHLCVStore next to the database file at path.
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = OHLCVStore(os.path.join(os.path.dirname(path), STORE_DIR))
+    return store
+
+
+def read_bars(symbol, start=None, end=None, path=DB_PATH):
+    return get_ohlcv_store(path).bars(symbol, start, end)
+
+
+def record_rows(db, rows):
+    """
+    Queues store_intraday_rows' rows for the bar files, inside its unit.
+    """
+    if ENABLED:
+        get_ohlcv_store(db.path).queue(db, bars_from_rows(rows))
+
+
+def record_frame(db, frame):
+    """
+    Queues a bulk_loader frame for the bar files, inside its unit.
+    """
+    if ENABLED:
+        get_ohlcv_store(db.path).queue(db, bars_from_frame(frame))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'rebuild'
+    db = get_db(DB_PATH)
+    store = get_ohlcv_store(DB_PATH)
+    if command == 'rebuild':
+        started = time.perf_counter()
+        written = store.rebuild(db, sys.argv[2:] or None)
+        print(f"Wrote {written} bars to {store.root} in {time.perf_counter() - started:.1f}s")
+    elif command == 'read' and len(sys.argv) > 2:
+        started = time.perf_counter()
+        bars = store.bars(sys.argv[2], *(sys.argv[3:5]))
+        elapsed = time.perf_counter() - started
+        print(f"{len(bars)} bars in {elapsed * 1e6:.0f} us")
+        if len(bars):
+            first, last = bars['datetime'][[0, -1]].astype('datetime64[s]')
+            print(f"{first} .. {last}, last close {bars['close'][-1]}")
+    else:
+        raise SystemExit("Usage: python ohlcv_store.py rebuild [symbol ...]\n"
+                         "       python ohlcv_store.py read <symbol> [start] [end]")
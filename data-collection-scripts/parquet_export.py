@@ -0,0 +1,275 @@
+# parquet_export.py
+"""
+Columnar export of finance_data.db for analytics.
+
+Writes company_intraday_data, news_articles, news_ticker_sentiment and the three
+statement tables as hive-partitioned, zstd-compressed Parquet datasets with
+real numeric and timestamp types:
+
+    <root>/company_intraday_data/symbol=AAPL/year=2020/part-0.parquet
+    <root>/news_ticker_sentiment/ticker_symbol=AAPL/year=2020/part-0.parquet
+    <root>/news_articles/year=2020/part-0.parquet
+    <root>/income_statement/symbol=AAPL/year=2020/part-0.parquet
+
+load() opens a dataset through a memory-mapped filesystem and only reads the
+requested columns and partitions, so a backtest over a few symbols never
+touches the rest of the data.
+
+Usage:
+    python parquet_export.py export [finance_data.db] [parquet]
+    python parquet_export.py load <table> [symbol] [parquet]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from migrate_intraday import is_migrated
+from storage import DB_PATH
+
+EXPORT_DIR = 'parquet'
+STATEMENT_TABLES = ('income_statement', 'balance_sheet', 'cash_flow')
+STATEMENT_TEXT_COLUMNS = ('symbol', 'fiscalDateEnding', 'reportType', 'reportedCurrency')
+
+# Hive partition keys per exported table
+PARTITIONS = {
+    'company_intraday_data': ('symbol', 'year'),
+    'news_articles': ('year',),
+    'news_ticker_sentiment': ('ticker_symbol', 'year'),
+    **{table: ('symbol', 'year') for table in STATEMENT_TABLES},
+}
+
+INTRADAY_SCHEMA = pa.schema([
+    ('symbol', pa.string()),
+    ('datetime', pa.timestamp('s')),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.int64()),
+    ('year', pa.int16()),
+])
+
+NEWS_ARTICLES_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('title', pa.string()),
+    ('url', pa.string()),
+    ('time_published', pa.timestamp('s')),
+    ('authors', pa.string()),
+    ('summary', pa.string()),
+    ('banner_image', pa.string()),
+    ('source', pa.string()),
+    ('category_within_source', pa.string()),
+    ('source_domain', pa.string()),
+    ('topics', pa.string()),
+    ('overall_sentiment_score', pa.float64()),
+    ('overall_sentiment_label', pa.string()),
+    ('fetch_date', pa.string()),
+    ('year', pa.int16()),
+])
+
+# time_published is copied from the article so sentiment can be scanned alone
+NEWS_TICKER_SENTIMENT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('article_id', pa.int64()),
+    ('ticker_symbol', pa.string()),
+    ('time_published', pa.timestamp('s')),
+    ('relevance_score', pa.float64()),
+    ('ticker_sentiment_score', pa.float64()),
+    ('ticker_sentiment_label', pa.string()),
+    ('year', pa.int16()),
+])
+
+NEWS_CHUNK_ROWS = 100_000
+
+
+def partitioning(table):
+    fields = [('year', pa.int16()) if key == 'year' else (key, pa.string()) for key in PARTITIONS[table]]
+    return ds.partitioning(pa.schema(fields), flavor='hive')
+
+
+def write_table(batches, schema, table, root):
+    """
+    Replaces <root>/<table> with the given record batches.
+    """
+    base_dir = os.path.join(root, table)
+    shutil.rmtree(base_dir, ignore_errors=True)
+    ds.write_dataset(
+        batches,
+        base_dir,
+        schema=schema,
+        format='parquet',
+        partitioning=partitioning(table),
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def news_timestamps(values):
+    return pd.to_datetime(values, format='%Y%m%dT%H%M%S', errors='coerce')
+
+
+def to_batch(frame, schema):
+    return pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+def intraday_batches(conn):
+    """
+    One batch per symbol, read in primary key order.
+    """
+    legacy = not is_migrated(conn)
+    symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM company_intraday_data ORDER BY symbol")]
+    for symbol in symbols:
+        frame = pd.read_sql_query(
+            "SELECT symbol, datetime, open, high, low, close, volume FROM company_intraday_data "
+            "WHERE symbol = ? ORDER BY datetime", conn, params=(symbol,))
+        if legacy:
+            frame['datetime'] = pd.to_datetime(frame['datetime']).astype('datetime64[s]')
+        else:
+            frame['datetime'] = frame['datetime'].to_numpy(dtype=np.int64).astype('datetime64[s]')
+        for column in ('open', 'high', 'low', 'close'):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+        frame['volume'] = pd.to_numeric(frame['volume'], errors='coerce').fillna(0).astype(np.int64)
+        frame['year'] = frame['datetime'].dt.year.astype(np.int16)
+        yield to_batch(frame, INTRADAY_SCHEMA)
+
+
+def news_article_batches(conn):
+    columns = [name for name in NEWS_ARTICLES_SCHEMA.names if name != 'year']
+    query = f"SELECT {', '.join(columns)} FROM news_articles ORDER BY id"
+    for frame in pd.read_sql_query(query, conn, chunksize=NEWS_CHUNK_ROWS):
+        frame['time_published'] = news_timestamps(frame['time_published'])
+        frame['overall_sentiment_score'] = pd.to_numeric(frame['overall_sentiment_score'], errors='coerce')
+        frame = frame[frame['time_published'].notna()]
+        frame['year'] = frame['time_published'].dt.year.astype(np.int16)
+        yield to_batch(frame, NEWS_ARTICLES_SCHEMA)
+
+
+def news_sentiment_batches(conn):
+    query = '''
+    SELECT s.id, s.article_id, s.ticker_symbol, a.time_published,
+           s.relevance_score, s.ticker_sentiment_score, s.ticker_sentiment_label
+    FROM news_ticker_sentiment s
+    JOIN news_articles a ON a.id = s.article_id
+    WHERE s.ticker_symbol IS NOT NULL
+    ORDER BY s.id
+    '''
+    for frame in pd.read_sql_query(query, conn, chunksize=NEWS_CHUNK_ROWS):
+        frame['time_published'] = news_timestamps(frame['time_published'])
+        for column in ('relevance_score', 'ticker_sentiment_score'):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+        frame = frame[frame['time_published'].notna()]
+        frame['year'] = frame['time_published'].dt.year.astype(np.int16)
+        yield to_batch(frame, NEWS_TICKER_SENTIMENT_SCHEMA)
+
+
+def numeric_column(values):
+    """
+    Alpha Vantage reports amounts as strings with 'None' for missing values.
+    Whole-number columns become nullable Int64, anything else float64.
+    """
+    numbers = pd.to_numeric(values, errors='coerce')
+    present = numbers.dropna()
+    if (present == present.round()).all() and (present.abs() < 2 ** 63).all():
+        return numbers.astype('Int64')
+    return numbers.astype(np.float64)
+
+
+def statement_table(conn, table):
+    frame = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+    for column in frame.columns:
+        if column not in STATEMENT_TEXT_COLUMNS:
+            frame[column] = numeric_column(frame[column])
+    frame['fiscalDateEnding'] = pd.to_datetime(frame['fiscalDateEnding'], errors='coerce').astype('datetime64[s]')
+    frame = frame[frame['fiscalDateEnding'].notna()]
+    frame['year'] = frame['fiscalDateEnding'].dt.year.astype(np.int16)
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def export(db_path=DB_PATH, root=EXPORT_DIR):
+    """
+    Exports every table to <root>. Returns {table: rows written}.
+    """
+    # write_dataset pulls the batch generators from its own thread
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    written = {}
+    try:
+        for table, batches, schema in (
+            ('company_intraday_data', intraday_batches(conn), INTRADAY_SCHEMA),
+            ('news_articles', news_article_batches(conn), NEWS_ARTICLES_SCHEMA),
+            ('news_ticker_sentiment', news_sentiment_batches(conn), NEWS_TICKER_SENTIMENT_SCHEMA),
+        ):
+            started = time.perf_counter()
+            counted = count_rows(batches, written, table)
+            write_table(counted, schema, table, root)
+            print(f"Exported {written[table]} rows of {table} in {time.perf_counter() - started:.1f}s")
+        for table in STATEMENT_TABLES:
+            data = statement_table(conn, table)
+            write_table(data.to_batches(), data.schema, table, root)
+            written[table] = data.num_rows
+            print(f"Exported {data.num_rows} rows of {table}")
+    finally:
+        conn.close()
+    return written
+
+
+def count_rows(batches, written, table):
+    written[table] = 0
+    for batch in batches:
+        written[table] += batch.num_rows
+        yield batch
+
+
+def open_dataset(table, root=EXPORT_DIR):
+    """
+    Opens an exported table. Files are memory-mapped rather than read into
+    Arrow buffers.
+    """
+    return ds.dataset(
+        os.path.join(root, table),
+        format='parquet',
+        partitioning=partitioning(table),
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def load(table, root=EXPORT_DIR, columns=None, symbols=None, years=None, as_pandas=True):
+    """
+    Reads an exported table, pruned to `columns` and to the partitions for
+    `symbols` / `years`. Returns a pandas DataFrame, or a pyarrow Table with
+    as_pandas=False.
+    """
+    dataset = open_dataset(table, root)
+    condition = None
+    if symbols is not None and PARTITIONS[table][0] != 'year':
+        condition = ds.field(PARTITIONS[table][0]).isin(list(symbols))
+    if years is not None:
+        year_condition = ds.field('year').isin([int(year) for year in years])
+        condition = year_condition if condition is None else condition & year_condition
+    data = dataset.to_table(columns=columns, filter=condition)
+    return data.to_pandas() if as_pandas else data
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    if command == 'export':
+        export(sys.argv[2] if len(sys.argv) > 2 else DB_PATH, sys.argv[3] if len(sys.argv) > 3 else EXPORT_DIR)
+    elif command == 'load':
+        if len(sys.argv) < 3:
+            raise SystemExit("Usage: python parquet_export.py load <table> [symbol] [parquet]")
+        table = sys.argv[2]
+        symbols = [sys.argv[3]] if len(sys.argv) > 3 else None
+        started = time.perf_counter()
+        frame = load(table, sys.argv[4] if len(sys.argv) > 4 else EXPORT_DIR, symbols=symbols)
+        print(f"Loaded {len(frame)} rows of {table} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        print(frame.dtypes)
+    else:
+        raise SystemExit(f"Unknown command '{command}', expected 'export' or 'load'")
@@ -0,0 +1,344 @@
+# pipeline.py
+"""
+Producer/consumer ingestion pipeline.
+
+Fetch workers run the blocking fetch functions and push parsed payloads onto a
+bounded queue; a single writer thread drains it into finance_data.db through
+its own FinanceDB connection. A full queue blocks the fetch workers
+(backpressure), close() drains and flushes everything, and each stage keeps
+throughput counters.
+
+With a JobQueue the pipeline is fed from job_queue.db (feed()): each payload
+carries its job, which is marked done once the writer has committed it, or
+failed if the fetch or the write failed.
+"""
+
+import queue
+import sys
+import threading
+import time
+
+from fetch_funcs import (
+    fetch_balance_sheet,
+    fetch_cash_flow,
+    fetch_income_statement,
+    fetch_intraday_data,
+    store_financial_data,
+    store_intraday_data,
+)
+from news_windows import empty_result, fetch_news_windowed, store_news_windows
+
+from storage import BATCH_SIZE, DB_PATH, get_db
+
+_STOP = object()
+
+
+class StageStats:
+    """
+    Counters for one pipeline stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.skipped = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, seconds, rows=0, skipped=False, failed=False):
+        with self.lock:
+            self.items += 1
+            self.rows += rows
+            self.skipped += skipped
+            self.failed += failed
+            self.busy_seconds += seconds
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (f"[{self.name}] {self.items} items ({self.skipped} skipped, {self.failed} failed), "
+                f"{self.rows} rows, {self.items / elapsed:.2f} items/s, {self.rows / elapsed:.1f} rows/s, "
+                f"busy {self.busy_seconds:.1f}s of {elapsed:.1f}s")
+
+
+def payload_rows(kind, payload):
+    """
+    Number of rows a payload will write, used for the throughput counters.
+    """
+    if kind == 'intraday':
+        return len(payload)
+    if kind == 'news':
+        return len(payload[1].get('feed', []))
+    if kind == 'statements':
+        return sum(len(p.get('annualReports', [])) + len(p.get('quarterlyReports', []))
+                   for p in payload[1:] if isinstance(p, dict))
+    return 0
+
+
+def write_payload(kind, payload, db):
+    if kind == 'intraday':
+        store_intraday_data(payload, db)
+    elif kind == 'news':
+        ticker, data = payload
+        # A feed that failed to store fails its job, which is then retried
+        if not store_news_windows(ticker, data, db) and data.get('feed'):
+            raise RuntimeError(f"news feed for {ticker} was not stored")
+
+    elif kind == 'statements':
+        ticker, income_statement, balance_sheet, cash_flow = payload
+        store_financial_data(ticker, income_statement, balance_sheet, cash_flow, db)
+    else:
+        raise ValueError(f"Unknown payload kind '{kind}'")
+
+
+class IngestPipeline:
+    """
+    Usage:
+
+        with IngestPipeline(fetch_workers=4) as pipeline:
+            pipeline.submit('intraday', fetch_fn, ticker, year, month)
+
+    fetch_fn(*args) must return the payload for the writer, or one of the
+    status strings ('data exists', 'no data', ...) which are counted and dropped.
+
+    Fed from a job queue instead:
+
+        with IngestPipeline(fetch_workers=4, job_queue=JobQueue()) as pipeline:
+            pipeline.feed('intraday', 'intraday', fetch_fn, lambda job: (job.symbol, *period_month(job.period)))
+    """
+
+    def __init__(self, fetch_workers=4, queue_size=64, db_path=DB_PATH, batch_size=BATCH_SIZE, report_every=60,
+                 job_queue=None):
+        self.job_queue = job_queue
+        # Bounded so claimed jobs wait in memory for a worker only briefly
+        self.jobs = queue.Queue(maxsize=fetch_workers * 2 if job_queue else 0)
+        self.payloads = queue.Queue(maxsize=queue_size)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.fetch_stats = StageStats('fetch')
+        self.write_stats = StageStats('write')
+        self.queue_high_water = 0
+        self.fetchers = [threading.Thread(target=self._fetch_loop, name=f"fetch-{i}", daemon=True)
+                         for i in range(fetch_workers)]
+        self.writer = threading.Thread(target=self._write_loop, name="writer", daemon=True)
+        self.closed = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self.writer.start()
+        for thread in self.fetchers:
+            thread.start()
+
+    def submit(self, kind, fetch_fn, *args, job=None):
+        self.jobs.put((kind, fetch_fn, args, job))
+
+    def feed(self, dataset, kind, fetch_fn, job_args):
+        """
+        Claims the pending `dataset` jobs of the job queue and submits
+        fetch_fn(*job_args(job)) for each until none are left. Returns how many
+        jobs were submitted.
+        """
+        submitted = 0
+        while True:
+            claimed = self.job_queue.claim(dataset, limit=len(self.fetchers))
+            if not claimed:
+                return submitted
+            for job in claimed:
+                self.submit(kind, fetch_fn, *job_args(job), job=job)
+                submitted += 1
+
+    def _fetch_loop(self):
+        while True:
+            item = self.jobs.get()
+            if item is _STOP:
+                return
+            kind, fetch_fn, args, job = item
+            started = time.monotonic()
+            try:
+                payload = fetch_fn(*args)
+            except Exception as e:
+                print(f"[pipeline] fetch {kind} {args} failed: {e}")
+                self.fetch_stats.record(time.monotonic() - started, failed=True)
+                self._fail(job, e)
+                continue
+            if isinstance(payload, str) or payload is None:
+                self.fetch_stats.record(time.monotonic() - started, skipped=True)
+                # Nothing to write for 'data exists'; anything else is retried later
+                if payload == 'data exists':
+                    self._done(job)
+                else:
+                    self._fail(job, payload)
+                continue
+            self.fetch_stats.record(time.monotonic() - started)
+            # Blocks while the writer is behind
+            self.payloads.put((kind, payload, job))
+            self.queue_high_water = max(self.queue_high_water, self.payloads.qsize())
+
+    def _write_loop(self):
+        db = get_db(self.db_path, self.batch_size)
+        last_report = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self.payloads.get_nowait()
+                except queue.Empty:
+                    # Commit before waiting on the fetchers, so the write lock
+                    # is never held across their HTTP calls
+                    db.flush()
+                    item = self.payloads.get()
+                if item is _STOP:
+                    return
+                kind, payload, job = item
+                started = time.monotonic()
+                try:
+                    write_payload(kind, payload, db)
+                    self.write_stats.record(time.monotonic() - started, rows=payload_rows(kind, payload))
+                    if job is not None:
+                        self.job_queue.complete(job, db)
+                except Exception as e:
+                    print(f"[pipeline] write {kind} failed: {e}")
+                    self.write_stats.record(time.monotonic() - started, failed=True)
+                    self._fail(job, e)
+                if time.monotonic() - last_report >= self.report_every:
+                    self.report()
+                    last_report = time.monotonic()
+        finally:
+            db.close()
+
+    def _done(self, job):
+        if job is not None:
+            self.job_queue.done(job)
+
+    def _fail(self, job, error):
+        if job is not None:
+            self.job_queue.fail(job, error)
+
+    def report(self):
+        print(self.fetch_stats.summary())
+        print(self.write_stats.summary())
+        print(f"[queue] {self.payloads.qsize()}/{self.payloads.maxsize} queued, high water {self.queue_high_water}")
+
+    def close(self):
+        """
+        Lets the fetch workers finish every submitted job, then drains the
+        payload queue and commits the writer's last batch.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.fetchers:
+            self.jobs.put(_STOP)
+        for thread in self.fetchers:
+            thread.join()
+        self.payloads.put(_STOP)
+        self.writer.join()
+        self.report()
+
+
+class RotatingFetch:
+    """
+    Wraps a fetch function with the collectors' key rotation: on one of the
+    rotate_on statuses the key is rotated (and the VPN reconnected) up to once
+    per known key.
+    """
+
+    def __init__(self, key_manager, fetch_fn, rotate_on=('no data',)):
+        self.key_manager = key_manager
+        self.fetch_fn = fetch_fn
+        self.rotate_on = rotate_on
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        result = self.rotate_on[0]
+        for _ in range(len(self.key_manager.api_keys)):
+            result = self.fetch_fn(*args, self.key_manager.get_current_key())
+            if result not in self.rotate_on:
+                return result
+            with self.lock:
+                self.key_manager.handle_failure_and_continue()
+        return result
+
+
+def fetch_statements(ticker, api_key, refresh=False):
+    """
+    Fetches all three statements for ticker as one 'statements' payload.
+    With refresh=True they are fetched even if the ticker is already covered.
+    """
+    income_statement = fetch_income_statement(ticker, api_key, refresh)
+    balance_sheet = fetch_balance_sheet(ticker, api_key, refresh)
+    cash_flow = fetch_cash_flow(ticker, api_key, refresh)
+    if 'no data' in (income_statement, balance_sheet, cash_flow):
+        return 'no data'
+    if income_statement == balance_sheet == cash_flow == 'data exists':
+        return 'data exists'
+    return ticker, income_statement, balance_sheet, cash_flow
+
+
+# NEWS_SENTIMENT reports an empty window as "no data", so only these rotate keys
+NEWS_ROTATE = ("limit reached", "error")
+
+
+def fetch_news_payload(ticker, time_from, time_to, api_key):
+    """
+    A 'news' payload for the window, or the status string to rotate on. A
+    window without articles is a payload too: its job is done, with the empty
+    window recorded as complete.
+    """
+    news_data = fetch_news_windowed(ticker, time_from, time_to, api_key)
+    if isinstance(news_data, dict):
+        return ticker, news_data
+    if news_data == "no data":
+        return ticker, empty_result(time_from, time_to)
+    return news_data
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from datetime import datetime
+    from api_key_manager import APIKeyManager
+    from coverage_index import ALL_PERIODS, month_periods
+    from job_queue import JobQueue, month_jobs, period_month
+    from news_planner import NewsPlanner, period_window
+
+    dataset = sys.argv[1] if len(sys.argv) > 1 else 'intraday'
+    key_manager = APIKeyManager()
+
+    conn = sqlite3.connect('company_overview.db')
+    tickers = [row[0] for row in conn.execute('SELECT DISTINCT Symbol FROM company_overview') if row[0] != 'PLTR']
+    conn.close()
+
+    def fetch_news_month(ticker, period, api_key):
+        if not planner.should_fetch(ticker, period):
+            return "data exists"
+        return fetch_news_payload(ticker, *period_window(period), api_key)
+
+    job_queue = JobQueue()
+    with IngestPipeline(fetch_workers=len(key_manager.api_keys), job_queue=job_queue) as pipeline:
+        if dataset == 'intraday':
+            job_queue.enqueue('intraday', month_jobs(tickers, range(2016, 2025)))
+            fetch = RotatingFetch(key_manager, lambda t, y, m, key: fetch_intraday_data(t, key, year=y, month=m))
+            pipeline.feed('intraday', 'intraday', fetch, lambda job: (job.symbol, *period_month(job.period)))
+        elif dataset == 'news':
+            # Month by month, hub tickers first, so their feeds cover the later windows
+            planner = NewsPlanner(get_db(), tickers)
+            now = datetime.now()
+            periods = [period for period in month_periods(range(2016, 2025)) if period_month(period) <= (now.year, now.month)]
+            job_queue.enqueue('news', planner.windows(periods))
+            fetch = RotatingFetch(key_manager, fetch_news_month, rotate_on=NEWS_ROTATE)
+            pipeline.feed('news', 'news', fetch, lambda job: (job.symbol, job.period))
+        elif dataset == 'statements':
+            job_queue.enqueue('statements', [(ticker, ALL_PERIODS) for ticker in tickers])
+            fetch = RotatingFetch(key_manager, fetch_statements)
+            pipeline.feed('statements', 'statements', fetch, lambda job: (job.symbol,))
+        else:
+            raise SystemExit(f"Unknown dataset '{dataset}', expected 'intraday', 'news' or 'statements'")
+    job_queue.close()
@@ -0,0 +1,200 @@
+# refresh.py
+"""
+Incremental "since last run" refresh for the collectors.
+
+Instead of walking the full 2016-2024 grid, the refresh reads what is already
+stored and only requests the delta:
+
+    intraday     the month of each symbol's newest bar (it may be partial) and
+                 every month after it
+    news         from each ticker's newest time_published to now, one window
+                 per calendar month
+    statements   only symbols whose LatestQuarter in company_overview.db is
+                 newer than the latest stored quarterly report
+
+Symbols with nothing stored yet start at START_YEAR. Run company-overview.py
+first so LatestQuarter is current. After intraday jobs, the symbols they
+touched are re-aggregated by intraday_pyramid.py. Intraday and statement
+requests bypass the response cache, whose earlier answers would be stale.
+
+Usage:
+    python refresh.py [plan|run] [intraday|news|statements|all]
+"""
+
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+from coverage_index import STATEMENT_DATASETS
+from storage import get_db
+
+START_YEAR = 2016
+OVERVIEW_DB = 'company_overview.db'
+DATASETS = ('intraday', 'news', 'statements')
+
+
+def months_between(start, end):
+    """
+    (year, month) pairs from start's month through end's month.
+    """
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = year + month // 12, month % 12 + 1
+
+
+def latest_intraday(db):
+    """
+    {symbol: datetime of the newest stored bar}.
+    """
+    if db.legacy_intraday:
+        raise RuntimeError("company_intraday_data has not been migrated yet, run migrate_intraday.py first.")
+    rows = db.cursor().execute("SELECT symbol, MAX(datetime) FROM company_intraday_data GROUP BY symbol")
+    return {symbol: datetime(1970, 1, 1) + timedelta(seconds=epoch) for symbol, epoch in rows}
+
+
+def latest_news(db):
+    """
+    {ticker: newest time_published ('YYYYMMDDTHHMMSS') of an article mentioning it}.
+    """
+    rows = db.cursor().execute('''
+    SELECT s.ticker_symbol, MAX(a.time_published)
+    FROM news_ticker_sentiment s
+    JOIN news_articles a ON a.id = s.article_id
+    WHERE s.ticker_symbol IS NOT NULL
+    GROUP BY s.ticker_symbol
+    ''')
+    return dict(rows)
+
+
+def latest_statements(db):
+    """
+    {statement table: {symbol: newest quarterly fiscalDateEnding}}.
+    """
+    cursor = db.cursor()
+    return {table: dict(cursor.execute(
+        f"SELECT symbol, MAX(fiscalDateEnding) FROM {table} WHERE reportType = 'quarterly' GROUP BY symbol"))
+        for table in STATEMENT_DATASETS}
+
+
+def latest_quarters(path=OVERVIEW_DB):
+    """
+    {symbol: LatestQuarter} as last fetched by company-overview.py.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        return {symbol: quarter for symbol, quarter in conn.execute("SELECT Symbol, LatestQuarter FROM company_overview")}
+    finally:
+        conn.close()
+
+
+def intraday_jobs(db, tickers, now):
+    """
+    (ticker, year, month) TIME_SERIES_INTRADAY calls still needed.
+    """
+    latest = latest_intraday(db)
+    jobs = []
+    for ticker in tickers:
+        start = latest.get(ticker, datetime(START_YEAR, 1, 1))
+        jobs.extend((ticker, year, month) for year, month in months_between(start, now))
+    return jobs
+
+
+def news_windows(db, tickers, now):
+    """
+    (ticker, time_from, time_to) NEWS_SENTIMENT windows covering everything
+    published since each ticker's newest stored article. Articles on the
+    boundary minute are fetched again and dropped by store_news_sentiment.
+    """
+    latest = latest_news(db)
+    windows = []
+    for ticker in tickers:
+        if ticker in latest:
+            start = datetime.strptime(latest[ticker][:13], "%Y%m%dT%H%M")
+        else:
+            start = datetime(START_YEAR, 1, 1)
+        for year, month in months_between(start, now):
+            window_start = max(start, datetime(year, month, 1))
+            window_end = min(now, datetime(year + month // 12, month % 12 + 1, 1) - timedelta(minutes=1))
+            if window_start > window_end:
+                continue
+            windows.append((ticker, window_start.strftime("%Y%m%dT%H%M"), window_end.strftime("%Y%m%dT%H%M")))
+    return windows
+
+
+def statement_jobs(db, tickers, quarters):
+    """
+    Tickers whose statements are missing from any table, or whose latest
+    reported quarter is newer than the newest stored quarterly report.
+    """
+    latest = latest_statements(db)
+    jobs = []
+    for ticker in tickers:
+        stored = [latest[table].get(ticker) for table in STATEMENT_DATASETS]
+        if None in stored or (quarters.get(ticker) and quarters[ticker] > min(stored)):
+            jobs.append(ticker)
+    return jobs
+
+
+def plan(db, tickers, quarters, datasets=DATASETS, now=None):
+    """
+    {dataset: jobs} for the requested datasets.
+    """
+    now = now or datetime.now()
+    jobs = {}
+    if 'intraday' in datasets:
+        jobs['intraday'] = intraday_jobs(db, tickers, now)
+    if 'news' in datasets:
+        jobs['news'] = news_windows(db, tickers, now)
+    if 'statements' in datasets:
+        jobs['statements'] = statement_jobs(db, tickers, quarters)
+    return jobs
+
+
+def api_calls(jobs):
+    # Each statements job is three calls (income statement, balance sheet, cash flow)
+    return sum(len(items) * (3 if dataset == 'statements' else 1) for dataset, items in jobs.items())
+
+
+def run(jobs, key_manager):
+    """
+    Fetches and stores the planned jobs through the ingestion pipeline.
+    """
+    from fetch_funcs import fetch_intraday_data
+    from pipeline import NEWS_ROTATE, IngestPipeline, RotatingFetch, fetch_news_payload, fetch_statements
+
+    with IngestPipeline(fetch_workers=len(key_manager.api_keys)) as pipeline:
+        fetch = RotatingFetch(key_manager, lambda t, y, m, key: fetch_intraday_data(t, key, year=y, month=m, refresh=True))
+        for job in jobs.get('intraday', []):
+            pipeline.submit('intraday', fetch, *job)
+        fetch = RotatingFetch(key_manager, fetch_news_payload, rotate_on=NEWS_ROTATE)
+        for window in jobs.get('news', []):
+            pipeline.submit('news', fetch, *window)
+        fetch = RotatingFetch(key_manager, lambda t, key: fetch_statements(t, key, refresh=True))
+        for ticker in jobs.get('statements', []):
+            pipeline.submit('statements', fetch, ticker)
+
+    if jobs.get('intraday'):
+        import intraday_pyramid
+        symbols, written = intraday_pyramid.build()
+        print(f"Rebuilt the intraday pyramid of {symbols} symbols ({written} rows).")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'plan'
+    dataset = sys.argv[2] if len(sys.argv) > 2 else 'all'
+    if command not in ('plan', 'run') or dataset not in (*DATASETS, 'all'):
+        raise SystemExit("Usage: python refresh.py [plan|run] [intraday|news|statements|all]")
+
+    quarters = latest_quarters()
+    tickers = [ticker for ticker in quarters if ticker != 'PLTR']
+    db = get_db()
+    jobs = plan(db, tickers, quarters, DATASETS if dataset == 'all' else (dataset,))
+    for name, items in jobs.items():
+        print(f"{name}: {len(items)} jobs")
+    print(f"{api_calls(jobs)} API calls planned for {len(tickers)} tickers.")
+
+    if command == 'run':
+        from api_key_manager import APIKeyManager
+        run(jobs, APIKeyManager())
+    db.close()
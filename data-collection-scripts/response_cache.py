@@ -0,0 +1,461 @@
+# response_cache.py
+"""
+Content-addressed on-disk cache of raw Alpha Vantage responses.
+
+Every call made through av_get (and AsyncFetcher) is keyed by its function and
+parameters, without the API key:
+
+    <root>/requests/<FUNCTION>/<request sha256>.json   params, blob hash, fetched_at
+    <root>/blobs/<ab>/<content sha256>.gz              gzip-compressed response body
+
+Identical bodies are stored once. Rate limit notices are never cached, and
+neither are answers that can still grow: an intraday month that has not ended
+yet, or a news window reaching into the present. Snapshots of the latest state
+(OVERVIEW, the statements and the month-less bulk intraday CSV) are cached but
+expire after AV_CACHE_TTL_HOURS in record mode; replay serves them at any age.
+
+AV_CACHE_MODE selects the behaviour:
+    record  (default) serve hits from disk, fetch and store misses
+    replay  serve only from disk; misses behave like an empty response
+    off     always go to the network
+
+av_stream is av_get for bodies too large to hold in memory (see streaming.py):
+the body is read as it arrives and cached from a temporary spool file.
+
+`python response_cache.py rebuild` replays every cached response straight into
+the store functions, rebuilding finance_data.db offline. News windows are
+recorded as they were fetched, so rebuilt months are not fetched again.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+import metrics
+
+BASE_URL = "https://www.alphavantage.co/query"
+CACHE_DIR = os.getenv('AV_CACHE_DIR', 'response_cache')
+CACHE_MODE = os.getenv('AV_CACHE_MODE', 'record')
+CACHE_TTL_HOURS = float(os.getenv('AV_CACHE_TTL_HOURS', '24'))
+
+REPLAY_MISS_STATUS = 504
+
+# Quota notices are a few hundred bytes; larger bodies are never parsed to check
+RATE_LIMIT_NOTICE_BYTES = 2048
+
+STREAM_CHUNK_BYTES = 1 << 16
+
+SNAPSHOT_FUNCTIONS = ('OVERVIEW', 'INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW')
+
+FETCHED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def is_rate_limited(data):
+    """
+    Returns True if an Alpha Vantage JSON response is a quota message rather than data.
+    """
+    if not isinstance(data, dict):
+        return False
+    if "Note" in data:
+        return True
+    info = data.get("Information", "")
+    return "rate limit" in info.lower() or "requests per day" in info.lower()
+
+
+def is_cacheable(body):
+    """
+    Everything except quota notices is a deterministic answer worth keeping.
+    """
+    if body[:1] != b'{':
+        return bool(body)
+    try:
+        return not is_rate_limited(json.loads(body))
+    except ValueError:
+        return False
+
+
+def is_snapshot(params):
+    """
+    True for requests answered with the latest state of something that keeps
+    changing without a period in the request: the overview, the statements and
+    TIME_SERIES_INTRADAY without a month (the bulk history).
+    """
+    function = params.get('function')
+    return function in SNAPSHOT_FUNCTIONS or (function == 'TIME_SERIES_INTRADAY' and 'month' not in params)
+
+
+def is_final(params, now=None):
+    """
+    False for requests whose answer can still change: snapshots, and requests
+    about a period that is not over yet, TIME_SERIES_INTRADAY for the current
+    month and NEWS_SENTIMENT up to the present.
+    """
+    now = now or datetime.now()
+    if is_snapshot(params):
+        return False
+    if params.get('function') == 'TIME_SERIES_INTRADAY':
+        return str(params['month']) < now.strftime("%Y-%m")
+    if params.get('function') == 'NEWS_SENTIMENT':
+        time_to = params.get('time_to')
+        return time_to is not None and str(time_to) < now.strftime("%Y%m%dT%H%M")
+    return True
+
+
+class CachedResponse:
+    """
+    The subset of requests.Response the fetch functions use.
+    """
+
+    def __init__(self, status_code, content, from_cache=False, function=None):
+        self.status_code = status_code
+        self.content = content
+        self.from_cache = from_cache
+        self.function = function
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        with metrics.timer('json_decode_seconds', function=self.function):
+            return json.loads(self.content)
+
+
+class ResponseCache:
+
+    def __init__(self, root=CACHE_DIR, mode=CACHE_MODE, ttl_hours=CACHE_TTL_HOURS):
+        if mode not in ('record', 'replay', 'off'):
+            raise ValueError(f"Unknown AV_CACHE_MODE '{mode}', expected record, replay or off")
+        self.root = root
+        self.mode = mode
+        self.ttl_hours = ttl_hours
+
+    @staticmethod
+    def request_params(params):
+        return {key: str(value) for key, value in params.items() if key != 'apikey'}
+
+    def request_path(self, params):
+        params = self.request_params(params)
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.root, 'requests', params.get('function', 'UNKNOWN'), f"{digest}.json")
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], f"{digest}.gz")
+
+    def get_ref(self, params, now=None):
+        """
+        Returns the cache entry for params, or None. In record mode a snapshot
+        older than ttl_hours is a miss, so it gets fetched again.
+        """
+        if self.mode == 'off':
+            return None
+        with open(self.request_path(params)) as f:
+            ref = json.load(f)
+        if self.mode == 'record' and is_snapshot(params):
+            age = (now or datetime.now()) - datetime.strptime(ref['fetched_at'], FETCHED_AT_FORMAT)
+            if age.total_seconds() >= self.ttl_hours * 3600:
+                return None
+        return ref
+
+    def get(self, params):
+        """
+        Returns the cached body for params, or None.
+        """
+        try:
+            ref = self.get_ref(params)
+            if ref is None:
+                return None
+            with gzip.open(self.blob_path(ref['blob'])) as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def open(self, params):
+        """
+        Returns the cached body for params as an open binary file, or None.
+        """
+        try:
+            ref = self.get_ref(params)
+            if ref is None:
+                return None
+            return gzip.open(self.blob_path(ref['blob']))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def keeps(params):
+        """
+        Final answers are kept for good, snapshots until they expire.
+        """
+        return is_final(params) or is_snapshot(params)
+
+    def put(self, params, body):
+        if self.mode != 'record' or not self.keeps(params) or not is_cacheable(body):
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            _atomic_write(blob, gzip.compress(body))
+        self.put_ref(params, digest)
+
+    def put_file(self, params, f):
+        """
+        put() for a body in a binary file, which is read in chunks from the start.
+        """
+        if self.mode != 'record' or not self.keeps(params):
+            return
+        f.seek(0)
+        head = f.read(RATE_LIMIT_NOTICE_BYTES)
+        if len(head) < RATE_LIMIT_NOTICE_BYTES:
+            self.put(params, head)
+            return
+        digest = hashlib.sha256(head)
+        f.seek(RATE_LIMIT_NOTICE_BYTES)
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b''):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f"{blob}.{os.getpid()}.tmp"
+            f.seek(0)
+            with gzip.open(tmp, 'wb') as out:
+                shutil.copyfileobj(f, out, STREAM_CHUNK_BYTES)
+            os.replace(tmp, blob)
+        self.put_ref(params, digest)
+
+    def put_ref(self, params, digest):
+        ref = {
+            'params': self.request_params(params),
+            'blob': digest,
+            'fetched_at': datetime.now().strftime(FETCHED_AT_FORMAT),
+        }
+        _atomic_write(self.request_path(params), json.dumps(ref, sort_keys=True).encode())
+
+    def entries(self, function=None):
+        """
+        Yields (params, body) for every cached request, optionally for one function.
+        """
+        base = os.path.join(self.root, 'requests')
+        functions = [function] if function else sorted(os.listdir(base)) if os.path.isdir(base) else []
+        for name in functions:
+            folder = os.path.join(base, name)
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                with open(os.path.join(folder, filename)) as f:
+                    ref = json.load(f)
+                with gzip.open(self.blob_path(ref['blob'])) as f:
+                    yield ref['params'], f.read()
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+def replay_mode():
+    return get_cache().mode == 'replay'
+
+
+def av_get(params, timeout=120, refresh=False):
+    """
+    Single entry point for blocking Alpha Vantage calls, served from the cache
+    when possible. refresh=True asks the API again in record mode (the new
+    answer replaces the cached one), for data that changes after it is first
+    fetched, such as statements gaining a quarter.
+    """
+    cache = get_cache()
+    function = params.get('function')
+    body = None if refresh and cache.mode == 'record' else cache.get(params)
+    if body is not None:
+        metrics.inc('av_requests_total', function=function, source='cache')
+        return CachedResponse(200, body, from_cache=True, function=function)
+    if cache.mode == 'replay':
+        print(f"[ResponseCache] Replay miss for {cache.request_params(params)}")
+        metrics.inc('av_requests_total', function=function, source='replay_miss')
+        return CachedResponse(REPLAY_MISS_STATUS, b'{}', function=function)
+
+    with metrics.timer('av_request_seconds', function=function):
+        response = requests.get(BASE_URL, params=params, timeout=timeout)
+    record_response(function, response.content)
+    if response.status_code == 200:
+        cache.put(params, response.content)
+    return CachedResponse(response.status_code, response.content, function=function)
+
+
+class TeeReader(io.RawIOBase):
+    """
+    Reads a streamed response body, copying it into `spool` (if given) and
+    keeping its first RATE_LIMIT_NOTICE_BYTES bytes.
+    """
+
+    def __init__(self, raw, spool=None):
+        self.raw = raw
+        self.spool = spool
+        self.head = b''
+        self.bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        if self.spool is not None:
+            self.spool.write(data)
+        if self.bytes < RATE_LIMIT_NOTICE_BYTES:
+            self.head += data[:RATE_LIMIT_NOTICE_BYTES - self.bytes]
+        self.bytes += size
+        return size
+
+    def drain(self):
+        """
+        Reads whatever the consumer left unread.
+        """
+        buffer = bytearray(STREAM_CHUNK_BYTES)
+        while self.readinto(buffer):
+            pass
+
+
+@contextmanager
+def av_stream(params, timeout=120):
+    """
+    av_get for large bodies: yields (status_code, binary file) without reading
+    the body into memory. Hits are decompressed from their blob as they are
+    read. Network bodies are read as they arrive; in record mode they are
+    spooled to a temporary file and cached when the block exits, after reading
+    whatever the block left unread. A block that raises caches nothing.
+    """
+    cache = get_cache()
+    function = params.get('function')
+    cached = cache.open(params)
+    if cached is not None:
+        metrics.inc('av_requests_total', function=function, source='cache')
+        with cached:
+            yield 200, cached
+        return
+    if cache.mode == 'replay':
+        print(f"[ResponseCache] Replay miss for {cache.request_params(params)}")
+        metrics.inc('av_requests_total', function=function, source='replay_miss')
+        yield REPLAY_MISS_STATUS, io.BytesIO(b'{}')
+        return
+
+    # Latency is the time to the response headers, the body is read by the block
+    with metrics.timer('av_request_seconds', function=function):
+        response = requests.get(BASE_URL, params=params, timeout=timeout, stream=True)
+    with response, tempfile.TemporaryFile() as spool:
+        response.raw.decode_content = True
+        record = cache.mode == 'record' and response.status_code == 200
+        reader = TeeReader(response.raw, spool if record else None)
+        yield response.status_code, io.BufferedReader(reader, STREAM_CHUNK_BYTES)
+        reader.drain()
+        record_response(function, reader.head, reader.bytes)
+        if record:
+            cache.put_file(params, spool)
+
+
+def record_response(function, body, size=None):
+    """
+    Counts one network response, its size and whether it was a quota notice.
+    `body` may be just the start of a streamed body of `size` bytes.
+    """
+    if not metrics.ENABLED:
+        return
+    size = len(body) if size is None else size
+    metrics.inc('av_requests_total', function=function, source='network')
+    metrics.observe('av_response_bytes', size, function=function)
+    if size < RATE_LIMIT_NOTICE_BYTES:
+        try:
+            limited = is_rate_limited(json.loads(body))
+        except ValueError:
+            limited = False
+        if limited:
+            metrics.inc('av_rate_limited_total', function=function)
+
+
+def rebuild(cache=None, db=None):
+    """
+    Feeds every cached response into the matching store function.
+    """
+    from fetch_funcs import (
+        parse_intraday_data,
+        parse_news_sentiment,
+        parse_statement,
+        store_balance_sheet,
+        store_cash_flow,
+        store_income_statement,
+        store_intraday_data,
+    )
+    from news_windows import request_windows, store_news_windows
+    from storage import get_db
+
+    statement_stores = {
+        'INCOME_STATEMENT': store_income_statement,
+        'BALANCE_SHEET': store_balance_sheet,
+        'CASH_FLOW': store_cash_flow,
+    }
+    cache = cache or get_cache()
+    db = db or get_db()
+    replayed = 0
+    for params, body in cache.entries():
+        function = params.get('function')
+        if body[:1] != b'{':
+            continue  # CSV bulk responses are loaded with bulk_loader.py
+        data = json.loads(body)
+        if function == 'TIME_SERIES_INTRADAY' and 'month' in params:
+            result = parse_intraday_data(params['symbol'], data, params.get('interval', '60min'))
+            if isinstance(result, list):
+                store_intraday_data(result, db)
+        elif function == 'NEWS_SENTIMENT':
+            # Recorded windows let news_month_covered skip the month when collecting again
+            ticker = params.get('tickers')
+            result = parse_news_sentiment(ticker, data)
+            if result == "no data":
+                result = {"feed": []}
+            if isinstance(result, dict):
+                windows = request_windows(params.get('time_from'), params.get('time_to'), len(result["feed"]))
+                store_news_windows(ticker, dict(result, windows=windows), db)
+        elif function in statement_stores:
+            result = parse_statement(data)
+            if isinstance(result, dict):
+                statement_stores[function](result, db)
+        else:
+            continue
+        replayed += 1
+    db.flush()
+    return replayed
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'summary'
+    cache = get_cache()
+    if command == 'rebuild':
+        print(f"Replayed {rebuild(cache)} cached responses into finance_data.db")
+    else:
+        base = os.path.join(cache.root, 'requests')
+        for function in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+            print(f"{function}: {len(os.listdir(os.path.join(base, function)))} cached requests")
@@ -0,0 +1,225 @@
+# sankey_edges.py
+"""
+Precomputed Sankey flows behind the /*_senkey endpoints.
+
+The income statement, balance sheet and cash flow flows (source, target, value)
+the served Sankey SQL used to derive on every request are computed once per
+USD report when it is stored, and written to sankey_edges:
+
+    sankey_edges (symbol, statement, reportType, fiscalDateEnding, flow_order,
+                  source, target, value)
+
+sankey_edges.sql then answers a request with one keyed read. The flows below
+are ports of income_statement_senkey.sql, balance_sheet_senkey2.sql and
+cash_flow_senkey.sql and produce the same rows in the same order.
+
+Rebuild the table from the stored statements (and compare against the old
+queries with --benchmark) with:
+
+    python sankey_edges.py build [path/to/finance_data.db] [--benchmark]
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+from financial_facts import STATEMENT_LINE_ITEMS, parse_amount
+from storage import DB_PATH, get_db
+
+QUERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'backend', 'sql_queries')
+
+# Per-request queries the table replaces, called with (symbol, start, end, report_type)
+LEGACY_QUERIES = {
+    'balance_sheet': 'balance_sheet_senkey2.sql',
+    'cash_flow': 'cash_flow_senkey.sql',
+    'income_statement': 'income_statement_senkey.sql',
+}
+
+SANKEY_EDGE_INSERT = '''
+INSERT OR REPLACE INTO sankey_edges
+    (symbol, statement, reportType, fiscalDateEnding, flow_order, source, target, value)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# (source, target, column) flows of balance_sheet_senkey2.sql, every amount COALESCEd to 0
+BALANCE_SHEET_FLOWS = (
+    ('Cash & Cash Equivalents', 'Current Assets', 'cashAndCashEquivalentsAtCarryingValue'),
+    ('Short Term Investments', 'Current Assets', 'shortTermInvestments'),
+    ('Inventory', 'Current Assets', 'inventory'),
+    ('Current Net Receivables', 'Current Assets', 'currentNetReceivables'),
+    ('Other Current Assets', 'Current Assets', 'otherCurrentAssets'),
+    ('Current Assets', 'Total Assets', 'totalCurrentAssets'),
+    ('Property, Plant & Equipment', 'Non-Current Assets', 'propertyPlantEquipment'),
+    ('Goodwill', 'Non-Current Assets', 'goodwill'),
+    ('Intangible Assets Excluding Goodwill', 'Non-Current Assets', 'intangibleAssetsExcludingGoodwill'),
+    ('Long Term Investments', 'Non-Current Assets', 'longTermInvestments'),
+    ('Other Non-Current Assets', 'Non-Current Assets', 'otherNonCurrentAssets'),
+    ('Non-Current Assets', 'Total Assets', 'totalNonCurrentAssets'),
+    ('Total Assets', 'Total Liabilities', 'totalLiabilities'),
+    ('Total Assets', 'Total Shareholder Equity', 'totalShareholderEquity'),
+    ('Total Liabilities', 'Current Liabilities', 'totalCurrentLiabilities'),
+    ('Total Liabilities', 'Non-Current Liabilities', 'totalNonCurrentLiabilities'),
+    ('Current Liabilities', 'Current Accounts Payable', 'currentAccountsPayable'),
+    ('Current Liabilities', 'Deferred Revenue (Current)', 'deferredRevenue'),
+    ('Current Liabilities', 'Short Term Debt', 'shortTermDebt'),
+    ('Current Liabilities', 'Current Portion of Long Term Debt', 'currentLongTermDebt'),
+    ('Current Liabilities', 'Other Current Liabilities', 'otherCurrentLiabilities'),
+    ('Non-Current Liabilities', 'Long Term Debt (Noncurrent)', 'longTermDebtNoncurrent'),
+    ('Non-Current Liabilities', 'Capital Lease Obligations (Noncurrent)', 'capitalLeaseObligations'),
+    ('Non-Current Liabilities', 'Other Non-Current Liabilities', 'otherNonCurrentLiabilities'),
+    ('Total Shareholder Equity', 'Common Stock', 'commonStock'),
+    ('Total Shareholder Equity', 'Retained Earnings', 'retainedEarnings'),
+)
+
+
+def income_statement_flows(amounts):
+    value = lambda name: amounts.get(name) or 0
+    operating_expenses = amounts.get('operatingExpenses')
+    sga = amounts.get('sellingGeneralAndAdministrative')
+    other_operating_expenses = 0
+    if operating_expenses is not None and sga is not None:
+        other_operating_expenses = max(operating_expenses - sga - value('researchAndDevelopment'), 0)
+    return [
+        ('Revenue', 'Cost of Revenue', value('costOfRevenue')),
+        ('Revenue', 'Gross Profit', value('grossProfit')),
+        ('Gross Profit', 'Selling, General & Administrative', value('sellingGeneralAndAdministrative')),
+        ('Gross Profit', 'Research & Development', value('researchAndDevelopment')),
+        ('Gross Profit', 'Operating Expenses', other_operating_expenses),
+        ('Gross Profit', 'Operating Income', value('operatingIncome')),
+        ('Operating Income', 'Interest Expense', value('interestExpense')),
+        ('Operating Income', 'Other Non-Operating Income/Expense', value('otherNonOperatingIncome')),
+        ('Operating Income', 'Income Before Tax', value('incomeBeforeTax')),
+        ('Income Before Tax', 'Income Tax Expense', value('incomeTaxExpense')),
+        ('Income Before Tax', 'Net Income', value('netIncome')),
+    ]
+
+
+def balance_sheet_flows(amounts):
+    flows = [(source, target, amounts.get(column) or 0) for source, target, column in BALANCE_SHEET_FLOWS]
+    flows.append(('Total Shareholder Equity', 'Treasury Stock', abs(amounts.get('treasuryStock') or 0)))
+    return flows
+
+
+def cash_flow_flows(amounts):
+    value = lambda name: amounts.get(name) or 0
+    investing = abs(value('cashflowFromInvestment'))
+    financing = abs(value('cashflowFromFinancing'))
+    capital_expenditures = abs(value('capitalExpenditures'))
+    buybacks = abs(value('paymentsForRepurchaseOfCommonStock'))
+    dividends = abs(value('dividendPayout'))
+    depreciation = abs(value('depreciationDepletionAndAmortization'))
+    return [
+        ('Net Income', 'Cash from Operations', value('netIncome')),
+        ('Depreciation & Amortization', 'Non-cash Charges', depreciation),
+        ('Stock-based Compensation', 'Non-cash Charges', 0),
+        ('Non-cash Charges', 'Cash from Operations', depreciation),
+        ('Changes in Working Capital', 'Cash from Operations',
+         value('changeInOperatingLiabilities') - value('changeInOperatingAssets')),
+        ('Cash from Operations', 'Cash from Investing', investing),
+        ('Cash from Operations', 'Cash from Financing', financing),
+        ('Cash from Operations', 'Calculated Net Cash Flow',
+         value('operatingCashflow') + value('cashflowFromInvestment') + value('cashflowFromFinancing')),
+        ('Cash from Investing', 'Capital Expenditure', capital_expenditures),
+        ('Cash from Investing', 'Purchase of Securities', 0),
+        ('Proceeds from Securities', 'Cash from Investing', 0),
+        ('Cash from Investing', 'Other Cash from Investing', max(investing - capital_expenditures, 0)),
+        ('Cash from Financing', 'Stock Buybacks', buybacks),
+        ('Cash from Financing', 'Dividends', dividends),
+        ('Cash from Financing', 'Repayment of Commercial Paper', 0),
+        ('Cash from Financing', 'Tax (under Financing)', 0),
+        ('Cash from Financing', 'Repayment of Term Debt', 0),
+        ('Cash from Financing', 'Other Cash from Financing', max(financing - buybacks - dividends, 0)),
+    ]
+
+
+FLOWS = {
+    'income_statement': income_statement_flows,
+    'balance_sheet': balance_sheet_flows,
+    'cash_flow': cash_flow_flows,
+}
+
+
+def edge_rows(statement, rows):
+    """
+    sankey_edges rows for statement rows laid out as
+    (symbol, fiscalDateEnding, reportType, reportedCurrency, *amounts).
+    Like the served queries, only USD reports get a diagram.
+    """
+    edges = []
+    for row in rows:
+        symbol, fiscal_date, report_type, currency = row[:4]
+        if currency != 'USD':
+            continue
+        amounts = dict(zip(STATEMENT_LINE_ITEMS[statement], row[4:]))
+        for flow_order, (source, target, value) in enumerate(FLOWS[statement](amounts), start=1):
+            edges.append((symbol, statement, report_type, fiscal_date, flow_order, source, target, value))
+    return edges
+
+
+def build(db=None):
+    """
+    Recomputes sankey_edges from the three statement tables. Returns the number
+    of edges written.
+    """
+    db = db or get_db()
+    written = 0
+    with db.unit() as cursor:
+        cursor.execute("DELETE FROM sankey_edges")
+        for statement, names in STATEMENT_LINE_ITEMS.items():
+            rows = cursor.execute(
+                f"SELECT symbol, fiscalDateEnding, reportType, reportedCurrency, {', '.join(names)} FROM {statement}"
+            ).fetchall()
+            # parse_amount also covers databases not yet run through migrate_statements.py
+            edges = edge_rows(statement, [row[:4] + tuple(parse_amount(value) for value in row[4:]) for row in rows])
+            cursor.executemany(SANKEY_EDGE_INSERT, edges)
+            written += len(edges)
+    db.flush()
+    return written
+
+
+def benchmark(path, ranges, repeats=5):
+    """
+    Times the legacy per-request queries against sankey_edges.sql for every
+    symbol, report type and range, and checks that both return the same flows.
+    Statement caching is off because the backend prepares the query text on
+    every request. Returns {statement: (legacy ms, keyed ms, mismatching requests)}.
+    """
+    cursor = sqlite3.connect(path, cached_statements=0).cursor()
+    with open(os.path.join(QUERY_DIR, 'sankey_edges.sql')) as f:
+        keyed_query = f.read()
+    symbols = [row[0] for row in cursor.execute("SELECT DISTINCT symbol FROM sankey_edges LIMIT 10")]
+    results = {}
+    for statement, filename in LEGACY_QUERIES.items():
+        with open(os.path.join(QUERY_DIR, filename)) as f:
+            legacy_query = f.read()
+        legacy_ms, keyed_ms = [], []
+        mismatches = 0
+        for attempt in range(repeats):
+            for symbol in symbols:
+                for report_type in ('annual', 'quarterly'):
+                    for start, end in ranges:
+                        started = time.perf_counter()
+                        legacy = cursor.execute(legacy_query, (symbol, start, end, report_type)).fetchall()
+                        legacy_ms.append((time.perf_counter() - started) * 1000)
+                        started = time.perf_counter()
+                        keyed = cursor.execute(keyed_query, (statement, symbol, start, end, report_type)).fetchall()
+                        keyed_ms.append((time.perf_counter() - started) * 1000)
+                        if attempt == 0 and [row[:3] for row in legacy] != [row[:3] for row in keyed]:
+                            mismatches += 1
+        results[statement] = (statistics.median(legacy_ms), statistics.median(keyed_ms), mismatches)
+    return results
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args or args[0] != 'build':
+        raise SystemExit("Usage: python sankey_edges.py build [path/to/finance_data.db] [--benchmark]")
+    path = args[1] if len(args) > 1 else DB_PATH
+    print(f"Stored {build(get_db(path))} Sankey edges.")
+    if '--benchmark' in sys.argv:
+        for statement, (legacy_ms, keyed_ms, mismatches) in benchmark(
+                path, [('2020-01-01', '2020-12-31'), ('2022-01-01', '2022-12-31')]).items():
+            print(f"  {statement}: {legacy_ms:.3f} ms -> {keyed_ms:.3f} ms median per request, "
+                  f"{mismatches} mismatching requests")
@@ -0,0 +1,288 @@
+# sentiment_returns.py
+"""
+Correlation of news sentiment with subsequent price returns, for every ticker.
+
+Tickers are processed in blocks of BLOCK_TICKERS, each read once. For each
+frequency (hourly and daily) a block becomes two matrices with one column per
+ticker, where row i holds the ticker's i-th period with a return:
+
+    R   log return of the period's last close over the previous period's,
+        from the per-symbol bar files (ohlcv_store.py), or from
+        company_intraday_data for symbols without a file
+    S   relevance-weighted mean ticker_sentiment_score of the mentions
+        published in the period. News published while the ticker has no
+        bars (nights, weekends, gaps) counts towards its next period
+
+Lags and windows therefore count the ticker's own periods, and a column does
+not depend on which other tickers share its block. Entries without news, and
+the padding below shorter columns, are NaN. Every statistic is then computed
+for all columns at once with masked sums:
+
+    sentiment_return_lags     for each lag in -LAGS..LAGS: the number of
+                              (S[t], R[t + lag]) pairs, their Pearson
+                              correlation and the hit rate (share of pairs
+                              where sentiment and return have the same sign)
+    sentiment_return_rolling  correlation of S[t] with R[t + ROLLING_LAG] over
+                              a trailing window of ROLLING periods, from
+                              cumulative sums (daily only)
+
+Correlations are left NULL below MIN_PAIRS pairs. Timestamps are read the
+way the collectors store them (wall clock read as UTC, on both sides).
+
+Usage:
+    python sentiment_returns.py build [path/to/finance_data.db]
+    python sentiment_returns.py top [hourly|daily] [lag]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import ohlcv_store
+from storage import DB_PATH, get_db
+
+FREQUENCIES = {'hourly': 3600, 'daily': 86400}
+LAGS = {'hourly': 8, 'daily': 5}
+ROLLING = {'daily': 60}
+ROLLING_LAG = 1
+MIN_PAIRS = 20
+
+# Columns per block; an hourly block of ten years holds about 40,000 rows
+BLOCK_TICKERS = 128
+
+LAG_INSERT = '''
+INSERT INTO sentiment_return_lags (symbol, frequency, lag, pairs, correlation, hit_rate)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+ROLLING_INSERT = '''
+INSERT INTO sentiment_return_rolling (symbol, frequency, datetime, pairs, correlation)
+VALUES (?, ?, ?, ?, ?)
+'''
+
+# time_published is 'YYYYMMDDTHHMMSS'
+MENTIONS_QUERY = '''
+SELECT
+    CAST(strftime('%s', substr(a.time_published, 1, 4) || '-' || substr(a.time_published, 5, 2) || '-' ||
+                        substr(a.time_published, 7, 2) || ' ' || substr(a.time_published, 10, 2) || ':' ||
+                        substr(a.time_published, 12, 2)) AS INTEGER),
+    t.ticker_sentiment_score,
+    COALESCE(t.relevance_score, 1.0)
+FROM news_ticker_sentiment t
+JOIN news_articles a ON a.id = t.article_id
+WHERE t.ticker_symbol = ?
+  AND t.ticker_sentiment_score IS NOT NULL
+  AND a.time_published IS NOT NULL
+'''
+
+
+def load_closes(db, symbol):
+    """
+    (epoch seconds, close) of a symbol's bars, sorted by time.
+    """
+    bars = ohlcv_store.get_ohlcv_store(db.path).bars(symbol) if ohlcv_store.ENABLED else ohlcv_store.EMPTY
+    if len(bars) == 0:
+        bars = np.array(db.cursor().execute(
+            "SELECT datetime, close FROM company_intraday_data WHERE symbol = ? ORDER BY datetime", (symbol,)
+        ).fetchall(), dtype=[('datetime', '<i8'), ('close', '<f8')])
+    return bars['datetime'], bars['close']
+
+
+def load_mentions(db, symbol):
+    """
+    (epoch seconds, score, weight) of the symbol's scored mentions.
+    """
+    rows = np.array(db.cursor().execute(MENTIONS_QUERY, (symbol,)).fetchall(),
+                    dtype=[('datetime', '<i8'), ('score', '<f8'), ('weight', '<f8')]).reshape(-1)
+    return rows['datetime'], rows['score'], rows['weight']
+
+
+def period_returns(times, close, step):
+    """
+    (period starts, log returns) from sorted bars: each period's last close
+    over the previous period's. The first period has no return.
+    """
+    periods = times // step * step
+    last = np.flatnonzero(np.r_[periods[1:] != periods[:-1], True]) if len(periods) else np.empty(0, np.int64)
+    closes = close[last]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.log(closes[1:] / closes[:-1])
+    returns[~np.isfinite(returns)] = np.nan
+    return periods[last][1:], returns
+
+
+def load_block(db, symbols):
+    """
+    [((bar times, closes), (mention times, scores, weights))] per symbol,
+    read once for every frequency.
+    """
+    return [(load_closes(db, symbol), load_mentions(db, symbol)) for symbol in symbols]
+
+
+def block_matrices(block, step):
+    """
+    (period starts, S, R) for a loaded block, as described above. Period
+    starts are -1 in the padding.
+    """
+    series = [period_returns(*closes, step) for closes, _ in block]
+    rows, columns = max([len(periods) for periods, _ in series] + [0]), len(block)
+    starts = np.full((rows, columns), -1, dtype=np.int64)
+    returns = np.full((rows, columns), np.nan)
+    cells, scores, weights = [], [], []
+    for column, ((periods, values), (_, (times, score, relevance))) in enumerate(zip(series, block)):
+        starts[:len(periods), column] = periods
+        returns[:len(periods), column] = values
+        # First period with a return at or after the one the news was published in
+        row = np.searchsorted(periods, times // step * step)
+        kept = row < len(periods)
+        cells.append(row[kept] * columns + column)
+        scores.append(score[kept] * relevance[kept])
+        weights.append(relevance[kept])
+    cells = np.concatenate(cells + [np.empty(0, np.int64)])
+    weighted = np.bincount(cells, np.concatenate(scores + [np.empty(0)]), rows * columns)
+    total = np.bincount(cells, np.concatenate(weights + [np.empty(0)]), rows * columns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sentiment = np.where(total > 0, weighted / total, np.nan).reshape(rows, columns)
+    return starts, sentiment, returns
+
+
+def lagged(sentiment, returns, lag):
+    """
+    Pairs (S[t], R[t + lag]) as (x, y, mask) with unpaired entries zeroed.
+    """
+    rows = len(sentiment)
+    if lag >= 0:
+        x, y = sentiment[:rows - lag], returns[lag:]
+    else:
+        x, y = sentiment[-lag:], returns[:rows + lag]
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    return np.where(mask, x, 0.0), np.where(mask, y, 0.0), mask
+
+
+def correlation(n, sx, sy, sxx, syy, sxy):
+    """
+    Pearson correlation from sums over n pairs, NaN below MIN_PAIRS pairs or
+    without variance.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        result = cov / np.sqrt(var)
+    result[(n < MIN_PAIRS) | ~(var > 0)] = np.nan
+    return np.clip(result, -1.0, 1.0)
+
+
+def lag_stats(sentiment, returns, lag):
+    """
+    (pairs, correlation, hit rate) per column for one lag.
+    """
+    x, y, mask = lagged(sentiment, returns, lag)
+    n = mask.sum(axis=0)
+    corr = correlation(n, x.sum(axis=0), y.sum(axis=0), (x * x).sum(axis=0), (y * y).sum(axis=0),
+                       (x * y).sum(axis=0))
+    product = x * y
+    decided = (product != 0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit_rate = np.where(decided > 0, (product > 0).sum(axis=0) / decided, np.nan)
+    return n, corr, hit_rate
+
+
+def rolling_stats(sentiment, returns, window, lag=ROLLING_LAG):
+    """
+    (pairs, correlation) per column over each trailing window of `window`
+    pairs (S[t], R[t + lag]). Row i covers the pairs ending with return row
+    i + lag + window - 1.
+    """
+    x, y, mask = lagged(sentiment, returns, lag)
+    sums = []
+    for values in (mask.astype(np.float64), x, y, x * x, y * y, x * y):
+        cumulative = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(values, axis=0, out=cumulative[1:])
+        sums.append(cumulative[window:] - cumulative[:-window])
+    n = np.rint(sums[0]).astype(np.int64)
+    return n, correlation(n, *sums[1:])
+
+
+def nullable(values):
+    """
+    NumPy values as a list with NaN as None.
+    """
+    return [None if value != value else value for value in values.tolist()]
+
+
+def build(db=None, symbols=None, frequencies=tuple(FREQUENCIES)):
+    """
+    Recomputes both tables for symbols (every symbol with intraday coverage
+    by default). Returns {'tickers': n, 'lag_rows': n, 'rolling_rows': n}.
+    """
+    db = db or get_db()
+    db.flush()
+    if symbols is None:
+        symbols = [row[0] for row in db.cursor().execute(
+            "SELECT DISTINCT symbol FROM coverage WHERE dataset = 'intraday' ORDER BY symbol")]
+    written = {'tickers': len(symbols), 'lag_rows': 0, 'rolling_rows': 0}
+    for start in range(0, len(symbols), BLOCK_TICKERS):
+        block = symbols[start:start + BLOCK_TICKERS]
+        loaded = load_block(db, block)
+        lag_rows, rolling_rows = [], []
+        for frequency in frequencies:
+            starts, sentiment, returns = block_matrices(loaded, FREQUENCIES[frequency])
+            for lag in range(-LAGS[frequency], LAGS[frequency] + 1):
+                n, corr, hit_rate = lag_stats(sentiment, returns, lag)
+                lag_rows.extend(zip(block, [frequency] * len(block), [lag] * len(block),
+                                    n.tolist(), nullable(corr), nullable(hit_rate)))
+            window = ROLLING.get(frequency)
+            if window and len(starts) >= window + ROLLING_LAG:
+                n, corr = rolling_stats(sentiment, returns, window)
+                ends = starts[ROLLING_LAG + window - 1:]
+                # Windows ending in the padding of a shorter column are not the ticker's
+                row, column = np.nonzero((n >= MIN_PAIRS) & (ends >= 0))
+                rolling_rows.extend(zip(np.asarray(block)[column].tolist(), [frequency] * len(row),
+                                        ends[row, column].tolist(), n[row, column].tolist(),
+                                        nullable(corr[row, column])))
+        placeholders = ', '.join('?' for _ in block)
+        frequency_placeholders = ', '.join('?' for _ in frequencies)
+        # One unit per block: a failure leaves the other blocks' results
+        with db.unit() as cursor:
+            for table in ('sentiment_return_lags', 'sentiment_return_rolling'):
+                cursor.execute(f"DELETE FROM {table} WHERE frequency IN ({frequency_placeholders}) "
+                               f"AND symbol IN ({placeholders})", (*frequencies, *block))
+            cursor.executemany(LAG_INSERT, lag_rows)
+            cursor.executemany(ROLLING_INSERT, rolling_rows)
+        db.flush()
+        written['lag_rows'] += len(lag_rows)
+        written['rolling_rows'] += len(rolling_rows)
+    return written
+
+
+def top(db=None, frequency='daily', lag=1, limit=10):
+    """
+    (symbol, pairs, correlation, hit_rate) with the strongest correlation at a lag.
+    """
+    db = db or get_db()
+    return db.cursor().execute('''
+    SELECT symbol, pairs, correlation, hit_rate FROM sentiment_return_lags
+    WHERE frequency = ? AND lag = ? AND correlation IS NOT NULL
+    ORDER BY ABS(correlation) DESC
+    LIMIT ?
+    ''', (frequency, lag, limit)).fetchall()
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    command = args[0] if args else 'build'
+    if command == 'build':
+        path = args[1] if len(args) > 1 else DB_PATH
+        started = time.perf_counter()
+        written = build(get_db(path))
+        print(f"Correlated {written['tickers']} tickers in {time.perf_counter() - started:.1f}s: "
+              f"{written['lag_rows']} lag rows, {written['rolling_rows']} rolling rows")
+    elif command == 'top':
+        frequency = args[1] if len(args) > 1 else 'daily'
+        lag = int(args[2]) if len(args) > 2 else 1
+        for symbol, pairs, corr, hit_rate in top(frequency=frequency, lag=lag):
+            print(f"{symbol:<8} r={corr:+.3f}  hit rate {hit_rate:.1%}  ({pairs} pairs)")
+    else:
+        raise SystemExit("Usage: python sentiment_returns.py build [path/to/finance_data.db]\n"
+                         "       python sentiment_returns.py top [hourly|daily] [lag]")
@@ -0,0 +1,142 @@
+# sentiment_rollup.py
+"""
+Daily per-ticker sentiment rollup behind the /symbol_sentiment_speedometer
+endpoint.
+
+ticker_sentiment_daily holds one row per (ticker_symbol, day) with the sum,
+count, min and max of ticker_sentiment_score, the relevance-weighted sum and a
+histogram of ticker_sentiment_label. store_news_sentiment adds each new feed to
+it, so the average over any date range is a SUM over at most one row per day.
+
+Days are the 'YYYYMMDD' prefix of news_articles.time_published. Rebuild the
+rollup from the stored articles with:
+
+    python sentiment_rollup.py rebuild
+"""
+
+import sys
+
+from storage import get_db
+
+# Alpha Vantage ticker_sentiment_label values and their histogram columns
+LABEL_COLUMNS = {
+    'Bearish': 'bearish',
+    'Somewhat-Bearish': 'somewhat_bearish',
+    'Neutral': 'neutral',
+    'Somewhat-Bullish': 'somewhat_bullish',
+    'Bullish': 'bullish',
+}
+
+COLUMNS = ('mentions', 'score_sum', 'score_count', 'score_min', 'score_max',
+           'relevance_sum', 'relevance_weighted_sum', *LABEL_COLUMNS.values())
+
+ROLLUP_UPSERT = f'''
+INSERT INTO ticker_sentiment_daily (ticker_symbol, day, {', '.join(COLUMNS)})
+VALUES (?, ?, {', '.join('?' for _ in COLUMNS)})
+ON CONFLICT (ticker_symbol, day) DO UPDATE SET
+    mentions = mentions + excluded.mentions,
+    score_sum = score_sum + excluded.score_sum,
+    score_count = score_count + excluded.score_count,
+    score_min = MIN(COALESCE(score_min, excluded.score_min), COALESCE(excluded.score_min, score_min)),
+    score_max = MAX(COALESCE(score_max, excluded.score_max), COALESCE(excluded.score_max, score_max)),
+    relevance_sum = relevance_sum + excluded.relevance_sum,
+    relevance_weighted_sum = relevance_weighted_sum + excluded.relevance_weighted_sum,
+    {', '.join(f'{column} = {column} + excluded.{column}' for column in LABEL_COLUMNS.values())}
+'''
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DayStats:
+
+    def __init__(self):
+        self.mentions = 0
+        self.score_sum = 0.0
+        self.score_count = 0
+        self.score_min = None
+        self.score_max = None
+        self.relevance_sum = 0.0
+        self.relevance_weighted_sum = 0.0
+        self.labels = dict.fromkeys(LABEL_COLUMNS.values(), 0)
+
+    def add(self, score, relevance, label):
+        self.mentions += 1
+        if score is not None:
+            self.score_sum += score
+            self.score_count += 1
+            self.score_min = score if self.score_min is None else min(self.score_min, score)
+            self.score_max = score if self.score_max is None else max(self.score_max, score)
+            if relevance is not None:
+                self.relevance_sum += relevance
+                self.relevance_weighted_sum += relevance * score
+        if label in LABEL_COLUMNS:
+            self.labels[LABEL_COLUMNS[label]] += 1
+
+    def row(self):
+        return (self.mentions, self.score_sum, self.score_count, self.score_min, self.score_max,
+                self.relevance_sum, self.relevance_weighted_sum, *self.labels.values())
+
+
+class SentimentRollup:
+    """
+    Collects the ticker sentiment rows of one feed and writes them to
+    ticker_sentiment_daily as one upsert per (ticker, day).
+    """
+
+    def __init__(self):
+        self.days = {}
+
+    def add(self, ticker_symbol, time_published, score, relevance, label):
+        if not ticker_symbol or not time_published:
+            return
+        key = (ticker_symbol, str(time_published)[:8])
+        stats = self.days.get(key)
+        if stats is None:
+            stats = self.days[key] = DayStats()
+        stats.add(to_float(score), to_float(relevance), label)
+
+    def store(self, cursor):
+        cursor.executemany(ROLLUP_UPSERT, [(ticker, day, *stats.row()) for (ticker, day), stats in self.days.items()])
+
+
+def rebuild(db=None):
+    """
+    Recomputes ticker_sentiment_daily from news_ticker_sentiment with one
+    grouped scan. Returns the number of (ticker, day) rows.
+    """
+    db = db or get_db()
+    labels = ',\n               '.join(f"COUNT(CASE WHEN s.ticker_sentiment_label = '{label}' THEN 1 END)"
+                                    for label in LABEL_COLUMNS)
+    with db.unit() as cursor:
+        cursor.execute("DELETE FROM ticker_sentiment_daily")
+        cursor.execute(f'''
+        INSERT INTO ticker_sentiment_daily (ticker_symbol, day, {', '.join(COLUMNS)})
+        SELECT s.ticker_symbol, SUBSTR(a.time_published, 1, 8),
+               COUNT(*),
+               TOTAL(s.ticker_sentiment_score),
+               COUNT(s.ticker_sentiment_score),
+               MIN(s.ticker_sentiment_score),
+               MAX(s.ticker_sentiment_score),
+               TOTAL(CASE WHEN s.ticker_sentiment_score IS NOT NULL THEN s.relevance_score END),
+               TOTAL(s.relevance_score * s.ticker_sentiment_score),
+               {labels}
+        FROM news_ticker_sentiment s
+        JOIN news_articles a ON a.id = s.article_id
+        WHERE s.ticker_symbol IS NOT NULL AND a.time_published IS NOT NULL
+        GROUP BY 1, 2
+        ''')
+        rows = cursor.execute("SELECT COUNT(*) FROM ticker_sentiment_daily").fetchone()[0]
+    db.flush()
+    return rows
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'rebuild'
+    if command != 'rebuild':
+        raise SystemExit("Usage: python sentiment_rollup.py rebuild")
+    print(f"Rebuilt ticker_sentiment_daily with {rebuild()} ticker-days.")
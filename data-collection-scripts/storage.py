@@ -0,0 +1,504 @@
+# storage.py
+"""
+Shared SQLite storage layer for finance_data.db.
+
+Every store function in fetch_funcs used to open its own connection, run
+CREATE TABLE IF NOT EXISTS and commit per call. FinanceDB instead keeps one
+long-lived connection per thread in WAL mode and creates the schema once.
+
+Each unit of work starts its transaction with BEGIN IMMEDIATE, so the write
+lock is taken up front, and by default is committed when it is released: a
+collector never holds the lock while it waits on the network, and other
+processes writing to the same file only wait for one unit. Dedicated writers
+that store queued payloads back to back (the pipeline and backfill writers)
+open their connection with batch_size=BATCH_SIZE to commit every `batch_size`
+units instead, and flush whenever their queue runs empty.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+DB_PATH = 'finance_data.db'
+# Units per commit for dedicated writers; other connections commit every unit
+BATCH_SIZE = int(os.getenv('FINANCE_DB_BATCH_SIZE', '50'))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",  # 64 MiB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS company_intraday_data (
+        symbol TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        PRIMARY KEY (symbol, datetime)
+    ) WITHOUT ROWID;
+
+    -- Bars aggregated by intraday_pyramid.py: datetime is the epoch of the
+    -- period's last bar, period_start the day, Monday or month it starts on
+    CREATE TABLE IF NOT EXISTS intraday_daily (
+        symbol TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        period_start INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        bars INTEGER NOT NULL,
+        PRIMARY KEY (symbol, datetime)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS intraday_weekly (
+        symbol TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        period_start INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        bars INTEGER NOT NULL,
+        PRIMARY KEY (symbol, datetime)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS intraday_monthly (
+        symbol TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        period_start INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        bars INTEGER NOT NULL,
+        PRIMARY KEY (symbol, datetime)
+    ) WITHOUT ROWID;
+
+    -- Newest intraday coverage fetched_at of each symbol when its aggregates were built
+    CREATE TABLE IF NOT EXISTS intraday_pyramid_built (
+        symbol TEXT PRIMARY KEY,
+        fetched_at TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS income_statement (
+        symbol TEXT,
+        fiscalDateEnding TEXT,
+        reportType TEXT,
+        reportedCurrency TEXT,
+        grossProfit INTEGER,
+        totalRevenue INTEGER,
+        costOfRevenue INTEGER,
+        costofGoodsAndServicesSold INTEGER,
+        operatingIncome INTEGER,
+        sellingGeneralAndAdministrative INTEGER,
+        researchAndDevelopment INTEGER,
+        operatingExpenses INTEGER,
+        investmentIncomeNet INTEGER,
+        netInterestIncome INTEGER,
+        interestIncome INTEGER,
+        interestExpense INTEGER,
+        nonInterestIncome INTEGER,
+        otherNonOperatingIncome INTEGER,
+        depreciation INTEGER,
+        depreciationAndAmortization INTEGER,
+        incomeBeforeTax INTEGER,
+        incomeTaxExpense INTEGER,
+        interestAndDebtExpense INTEGER,
+        netIncomeFromContinuingOperations INTEGER,
+        comprehensiveIncomeNetOfTax INTEGER,
+        ebit INTEGER,
+        ebitda INTEGER,
+        netIncome INTEGER,
+        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
+    );
+
+    CREATE TABLE IF NOT EXISTS balance_sheet (
+        symbol TEXT,
+        fiscalDateEnding TEXT,
+        reportType TEXT,
+        reportedCurrency TEXT,
+        totalAssets INTEGER,
+        totalCurrentAssets INTEGER,
+        cashAndCashEquivalentsAtCarryingValue INTEGER,
+        cashAndShortTermInvestments INTEGER,
+        inventory INTEGER,
+        currentNetReceivables INTEGER,
+        totalNonCurrentAssets INTEGER,
+        propertyPlantEquipment INTEGER,
+        accumulatedDepreciationAmortizationPPE INTEGER,
+        intangibleAssets INTEGER,
+        intangibleAssetsExcludingGoodwill INTEGER,
+        goodwill INTEGER,
+        investments INTEGER,
+        longTermInvestments INTEGER,
+        shortTermInvestments INTEGER,
+        otherCurrentAssets INTEGER,
+        otherNonCurrentAssets INTEGER,
+        totalLiabilities INTEGER,
+        totalCurrentLiabilities INTEGER,
+        currentAccountsPayable INTEGER,
+        deferredRevenue INTEGER,
+        currentDebt INTEGER,
+        shortTermDebt INTEGER,
+        totalNonCurrentLiabilities INTEGER,
+        capitalLeaseObligations INTEGER,
+        longTermDebt INTEGER,
+        currentLongTermDebt INTEGER,
+        longTermDebtNoncurrent INTEGER,
+        shortLongTermDebtTotal INTEGER,
+        otherCurrentLiabilities INTEGER,
+        otherNonCurrentLiabilities INTEGER,
+        totalShareholderEquity INTEGER,
+        treasuryStock INTEGER,
+        retainedEarnings INTEGER,
+        commonStock INTEGER,
+        commonStockSharesOutstanding INTEGER,
+        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
+    );
+
+    CREATE TABLE IF NOT EXISTS cash_flow (
+        symbol TEXT,
+        fiscalDateEnding TEXT,
+        reportType TEXT,
+        reportedCurrency TEXT,
+        operatingCashflow INTEGER,
+        paymentsForOperatingActivities INTEGER,
+        proceedsFromOperatingActivities INTEGER,
+        changeInOperatingLiabilities INTEGER,
+        changeInOperatingAssets INTEGER,
+        depreciationDepletionAndAmortization INTEGER,
+        capitalExpenditures INTEGER,
+        changeInReceivables INTEGER,
+        changeInInventory INTEGER,
+        profitLoss INTEGER,
+        cashflowFromInvestment INTEGER,
+        cashflowFromFinancing INTEGER,
+        proceedsFromRepaymentsOfShortTermDebt INTEGER,
+        paymentsForRepurchaseOfCommonStock INTEGER,
+        paymentsForRepurchaseOfEquity INTEGER,
+        paymentsForRepurchaseOfPreferredStock INTEGER,
+        dividendPayout INTEGER,
+        dividendPayoutCommonStock INTEGER,
+        dividendPayoutPreferredStock INTEGER,
+        proceedsFromIssuanceOfCommonStock INTEGER,
+        proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet INTEGER,
+        proceedsFromIssuanceOfPreferredStock INTEGER,
+        proceedsFromRepurchaseOfEquity INTEGER,
+        proceedsFromSaleOfTreasuryStock INTEGER,
+        changeInCashAndCashEquivalents INTEGER,
+        changeInExchangeRate INTEGER,
+        netIncome INTEGER,
+        PRIMARY KEY (symbol, fiscalDateEnding, reportType)
+    );
+
+    CREATE TABLE IF NOT EXISTS line_items (
+        id INTEGER PRIMARY KEY,
+        statement TEXT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (statement, name)
+    );
+
+    CREATE TABLE IF NOT EXISTS financial_facts (
+        symbol TEXT NOT NULL,
+        reportType TEXT NOT NULL,
+        fiscalDateEnding TEXT NOT NULL,
+        line_item_id INTEGER NOT NULL REFERENCES line_items (id),
+        value INTEGER NOT NULL,
+        PRIMARY KEY (symbol, reportType, fiscalDateEnding, line_item_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS sankey_edges (
+        symbol TEXT NOT NULL,
+        statement TEXT NOT NULL,
+        reportType TEXT NOT NULL,
+        fiscalDateEnding TEXT NOT NULL,
+        flow_order INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        target TEXT NOT NULL,
+        value INTEGER,
+        PRIMARY KEY (symbol, statement, reportType, fiscalDateEnding, flow_order)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS news_articles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        url TEXT UNIQUE,
+        time_published TEXT,
+        authors TEXT,
+        summary TEXT,
+        banner_image TEXT,
+        source TEXT,
+        category_within_source TEXT,
+        source_domain TEXT,
+        topics TEXT,
+        overall_sentiment_score REAL,
+        overall_sentiment_label TEXT,
+        fetch_date TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS news_ticker_sentiment (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        article_id INTEGER,
+        ticker_symbol TEXT,
+        relevance_score REAL,
+        ticker_sentiment_score REAL,
+        ticker_sentiment_label TEXT,
+        FOREIGN KEY (article_id) REFERENCES news_articles (id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_news_ticker_sentiment_ticker
+        ON news_ticker_sentiment (ticker_symbol, article_id);
+
+    -- One row per NEWS_SENTIMENT window whose articles were stored;
+    -- complete = 0 if it still hit the 1000 article limit
+    CREATE TABLE IF NOT EXISTS news_windows (
+        ticker TEXT NOT NULL,
+        time_from TEXT NOT NULL,
+        time_to TEXT NOT NULL,
+        articles INTEGER NOT NULL,
+        complete INTEGER NOT NULL,
+        fetched_at TEXT,
+        PRIMARY KEY (ticker, time_from, time_to)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS news_word_counts (
+        article_id INTEGER NOT NULL,
+        word TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (article_id, word)
+    ) WITHOUT ROWID;
+
+    -- relevance_sum only covers scored mentions, so
+    -- relevance_weighted_sum / relevance_sum is the relevance-weighted average
+    CREATE TABLE IF NOT EXISTS ticker_sentiment_daily (
+        ticker_symbol TEXT NOT NULL,
+        day TEXT NOT NULL,
+        mentions INTEGER NOT NULL,
+        score_sum REAL NOT NULL,
+        score_count INTEGER NOT NULL,
+        score_min REAL,
+        score_max REAL,
+        relevance_sum REAL NOT NULL,
+        relevance_weighted_sum REAL NOT NULL,
+        bearish INTEGER NOT NULL,
+        somewhat_bearish INTEGER NOT NULL,
+        neutral INTEGER NOT NULL,
+        somewhat_bullish INTEGER NOT NULL,
+        bullish INTEGER NOT NULL,
+        PRIMARY KEY (ticker_symbol, day)
+    ) WITHOUT ROWID;
+
+    -- Written by sentiment_returns.py. lag is the number of periods the
+    -- return comes after the sentiment (negative: before it)
+    CREATE TABLE IF NOT EXISTS sentiment_return_lags (
+        symbol TEXT NOT NULL,
+        frequency TEXT NOT NULL,
+        lag INTEGER NOT NULL,
+        pairs INTEGER NOT NULL,
+        correlation REAL,
+        hit_rate REAL,
+        PRIMARY KEY (symbol, frequency, lag)
+    ) WITHOUT ROWID;
+
+    -- Trailing-window correlation, datetime the epoch of the window's last return
+    CREATE TABLE IF NOT EXISTS sentiment_return_rolling (
+        symbol TEXT NOT NULL,
+        frequency TEXT NOT NULL,
+        datetime INTEGER NOT NULL,
+        pairs INTEGER NOT NULL,
+        correlation REAL,
+        PRIMARY KEY (symbol, frequency, datetime)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS coverage (
+        symbol TEXT,
+        dataset TEXT,
+        period TEXT,
+        row_count INTEGER,
+        fetched_at TEXT,
+        PRIMARY KEY (symbol, dataset, period)
+    ) WITHOUT ROWID;
+'''
+
+# Kept apart from SCHEMA so a SQLite build without FTS5 can still open the database
+NEWS_FTS_SCHEMA = '''
+    -- Full-text index of news_articles, written by news_search.py. The text
+    -- stays in news_articles (external content); topics are the comma-joined names
+    CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+        title, summary, source, topics,
+        content='news_articles', content_rowid='id',
+        tokenize='porter unicode61'
+    );
+'''
+
+
+class FinanceDB:
+    """
+    One long-lived connection to finance_data.db.
+
+    Writers wrap each logical insert (one month of bars, one statement, one
+    news feed) in `with db.unit() as cursor:`. A failing unit is rolled back
+    to its savepoint without discarding earlier, not yet committed units of
+    the same batch.
+    """
+
+    def __init__(self, path=DB_PATH, batch_size=1):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.unit_callbacks = []
+        self.commit_callbacks = []
+        # Transactions are managed explicitly so savepoints nest inside one batch
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.legacy_intraday = False
+        self.news_fts = False
+        self.init_schema()
+
+    def init_schema(self):
+        """
+        Creates every collector table once per connection.
+        """
+        # Databases collected before migrate_intraday.py still store text datetimes
+        column = self.conn.execute(
+            "SELECT type FROM pragma_table_info('company_intraday_data') WHERE name = 'datetime'"
+        ).fetchone()
+        self.legacy_intraday = column is not None and column[0].upper() != 'INTEGER'
+        if self.legacy_intraday:
+            print(f"[FinanceDB] {self.path}: company_intraday_data predates the keyed layout, "
+                  "run migrate_intraday.py before storing intraday data.")
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.executescript(NEWS_FTS_SCHEMA)
+            self.news_fts = True
+        except sqlite3.OperationalError:
+            self.news_fts = False
+            print(f"[FinanceDB] {self.path}: SQLite {sqlite3.sqlite_version} has no FTS5, "
+                  "news articles will not be indexed for search.")
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    @contextmanager
+    def unit(self):
+        """
+        Runs one unit of work inside the current batch transaction.
+        """
+        if not self.conn.in_transaction:
+            # Takes the write lock now rather than at the first write, so reads
+            # made inside the unit (e.g. next_article_id) stay valid
+            self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("SAVEPOINT unit")
+        self.unit_callbacks.append([])
+        try:
+            yield self.conn.cursor()
+        except BaseException:
+            self.unit_callbacks.pop()
+            self.conn.execute("ROLLBACK TO unit")
+            self.conn.execute("RELEASE unit")
+            if not self.unit_callbacks and self.pending == 0:
+                # Nothing else in the transaction: end it, or the write lock
+                # stays held until some later unit commits
+                self.conn.execute("ROLLBACK")
+            raise
+
+        self.conn.execute("RELEASE unit")
+        callbacks = self.unit_callbacks.pop()
+        if self.unit_callbacks:
+            # Nested unit: the outer unit decides when this work is counted
+            self.unit_callbacks[-1].extend(callbacks)
+            return
+        for callback in callbacks:
+            callback()
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def after_unit(self, callback):
+        """
+        Runs callback once the current unit is released, or drops it if the
+        unit rolls back. Used to keep in-memory caches in step with the tables.
+        """
+        if self.unit_callbacks:
+            self.unit_callbacks[-1].append(callback)
+        else:
+            callback()
+
+    def after_commit(self, callback):
+        """
+        Runs callback once everything stored so far is committed (immediately
+        if nothing is pending). Used to report work as durable, e.g. JobQueue.
+        """
+        if self.unit_callbacks or self.conn.in_transaction:
+            self.commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def flush(self):
+        """
+        Commits every pending unit. Inside a unit the commit is deferred until
+        the outermost unit is released.
+        """
+        if self.unit_callbacks:
+            return
+        if self.conn.in_transaction:
+            with metrics.timer('db_commit_seconds'):
+                self.conn.execute("COMMIT")
+            metrics.inc('db_commits_total')
+            metrics.inc('db_units_committed_total', self.pending)
+        self.pending = 0
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+
+_local = threading.local()
+_open_dbs = []
+_open_lock = threading.Lock()
+
+
+def get_db(path=DB_PATH, batch_size=1):
+    """
+    Returns this thread's shared FinanceDB, opening it on first use. Only
+    dedicated writer threads and processes should pass a batch_size.
+    """
+    dbs = _local.__dict__.setdefault('dbs', {})
+    db = dbs.get(path)
+    if db is None or db.conn is None:
+        db = FinanceDB(path, batch_size)
+        dbs[path] = db
+        with _open_lock:
+            _open_dbs.append(db)
+    return db
+
+
+@atexit.register
+def close_all():
+    """
+    Flushes and closes every connection opened through get_db.
+    """
+    with _open_lock:
+        for db in _open_dbs:
+            db.close()
+        _open_dbs.clear()
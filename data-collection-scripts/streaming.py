@@ -0,0 +1,198 @@
+# streaming.py
+"""
+Bounded-memory ingestion of large responses.
+
+av_get reads a whole body into memory, decodes it to text and parses it in one
+go, so a full-history intraday CSV or a 1000 article news feed is held several
+times over before the first row is stored. With AV_STREAMING=1 the collectors
+read such responses through response_cache.av_stream instead:
+
+    news       the feed is parsed article by article with ijson and handed
+               to store_news_sentiment as an iterator, which stores it
+               NEWS_STORE_CHUNK articles at a time
+    intraday   datatype=csv responses are read CSV_CHUNK_ROWS rows at a time
+               and each chunk is stored as its own frame
+
+Responses under PEEK_BYTES (quota notices, errors, small feeds) are parsed
+whole as before. Memory then stays flat in the response size; `python
+benchmarks/stream_memory.py` measures both paths.
+
+pipeline.py keeps reading whole responses: its fetch threads hand parsed
+payloads to a single writer thread, which a feed still being read from the
+network cannot be.
+"""
+
+import io
+import json
+import os
+from contextlib import ExitStack
+
+import ijson
+import pandas as pd
+
+from bulk_loader import CUTOFF_DATE, apply_cutoff, frame_from_csv, store_intraday_frame
+from fetch_funcs import news_params, parse_news_sentiment, store_news_sentiment
+from news_windows import NEWS_LIMIT, split_window, store_news_windows
+from response_cache import av_stream, is_rate_limited
+from storage import get_db
+
+STREAMING = os.getenv('AV_STREAMING') == '1'
+
+# Bodies shorter than this are parsed whole
+PEEK_BYTES = 1 << 16
+CSV_CHUNK_ROWS = 50_000
+
+
+class PrefixedReader(io.RawIOBase):
+    """
+    A binary stream whose first bytes were already read into `head`.
+    """
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.head:
+            size = min(len(buffer), len(self.head))
+            buffer[:size], self.head = self.head[:size], self.head[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def prefixed(head, stream):
+    return io.BufferedReader(PrefixedReader(head, stream), PEEK_BYTES)
+
+
+class CountingFeed:
+    """
+    Iterates a feed, counting the articles that went by.
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.count = 0
+
+    def __iter__(self):
+        for article in self.feed:
+            self.count += 1
+            yield article
+
+
+def fetch_news_stream(ticker, time_from, time_to, api_key):
+    """
+    fetch_news_sentiment, with the feed of a large response parsed as it is
+    read. Returns a status string or {'feed': iterator}; the response stays
+    open until the iterator is exhausted, so it must be consumed.
+    """
+    stack = ExitStack()
+    try:
+        _, stream = stack.enter_context(av_stream(news_params(ticker, time_from, time_to, api_key)))
+        head = stream.read(PEEK_BYTES)
+        if len(head) < PEEK_BYTES:
+            stack.close()
+            return parse_news_sentiment(ticker, json.loads(head))
+    except Exception as e:
+        stack.close()
+        print(f"Error fetching news sentiment data: {str(e)}")
+        return "error"
+
+    def feed():
+        # An exception while parsing reaches av_stream, which then caches nothing
+        with stack:
+            yield from ijson.items(prefixed(head, stream), 'feed.item', use_float=True)
+    return {"feed": feed()}
+
+
+def stream_news_windowed(ticker, time_from, time_to, api_key, db=None):
+    """
+    fetch_news_windowed and store_news_windows in one pass. Each window's feed
+    is stored while it is read and saturated windows are split afterwards; the
+    saturated parent's articles stay stored, and its children's copies are
+    skipped by url. Returns {'windows': [...]} once everything is stored, or
+    the status string of the first request or of a failed window.
+
+    Each feed is its own unit, so the write lock is held only while that
+    window's body is read, never across the requests in between. The windows
+    are recorded in a short final unit once every feed is stored; until then
+    the month is simply not covered.
+    """
+    db = db or get_db()
+    level = [(time_from, time_to)]
+    windows = []
+    first = True
+    while level:
+        next_level = []
+        for window in level:
+            data = fetch_news_stream(ticker, *window, api_key)
+            feed = CountingFeed(data["feed"]) if isinstance(data, dict) else None
+            # A feed that failed halfway is rolled back by store_news_sentiment
+            if feed is not None and not store_news_sentiment(ticker, {"feed": feed}, db):
+                data = "error"
+            if not isinstance(data, dict):
+                if data == "no data" and not first:
+                    windows.append((*window, 0, True))
+                    continue
+                # As in WindowSplit, the stored windows stay unrecorded and the month is retried
+                return data
+            first = False
+            children = split_window(*window) if feed.count >= NEWS_LIMIT else None
+            if children:
+                next_level.extend(children)
+            else:
+                windows.append((*window, feed.count, feed.count < NEWS_LIMIT))
+        level = next_level
+    store_news_windows(ticker, {"feed": [], "windows": windows}, db)
+    return {"windows": windows}
+
+
+
+def fetch_intraday_csv_frames(ticker, api_key, interval='60min', cutoff_date=CUTOFF_DATE, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    fetch_intraday_data_bulk_csv as canonical frames of up to chunk_rows bars,
+    already cut off at cutoff_date. The response lists the newest bars first,
+    so reading stops at the first chunk reaching past the cutoff.
+    """
+    params = {
+        'function': 'TIME_SERIES_INTRADAY',
+        'symbol': ticker,
+        'interval': interval,
+        'datatype': 'csv',
+        'outputsize': 'full',
+        'apikey': api_key,
+    }
+    with av_stream(params) as (status_code, stream):
+        if status_code != 200:
+            print(f"Failed to fetch data for {ticker}. Status code: {status_code}")
+            return
+        head = stream.read(PEEK_BYTES)
+        if head[:1] == b'{':
+            # Quota notices and errors come back as JSON
+            try:
+                data = json.loads(head)
+            except ValueError:
+                data = {}
+            print(f"{'Rate limit reached' if is_rate_limited(data) else 'No CSV data'} for {ticker}: {data}")
+            return
+        for chunk in pd.read_csv(prefixed(head, stream), chunksize=chunk_rows):
+            if 'timestamp' not in chunk.columns:
+                print(f"Timestamp column not found in the response for {ticker}.")
+                print("Columns found:", chunk.columns)
+                return
+            frame = apply_cutoff(frame_from_csv(chunk, ticker), cutoff_date)
+            if not frame.empty:
+                yield frame
+            if len(frame) < len(chunk):
+                return
+
+
+def store_intraday_frames(frames, db=None):
+    """
+    store_intraday_frame for each frame of an iterable. Returns rows written.
+    """
+    return sum(store_intraday_frame(frame, db) for frame in frames)
@@ -0,0 +1,10 @@
+# conftest.py
+"""
+The collectors are flat scripts imported by module name, as when they are run
+from data-collection-scripts/.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
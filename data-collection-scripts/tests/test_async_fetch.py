@@ -0,0 +1,157 @@
+# test_async_fetch.py
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import async_fetch
+import response_cache
+from async_fetch import AsyncFetcher, KeyScheduler, TokenBucket
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(async_fetch.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_refills_over_its_period(clock):
+    bucket = TokenBucket(5, 60)
+    assert [bucket.try_take() for _ in range(5)] == [0] * 5
+    assert bucket.try_take() == pytest.approx(12.0)
+    clock.now += 6
+    assert bucket.try_take() == pytest.approx(6.0)
+    clock.now += 6
+    assert bucket.try_take() == 0
+    # Idle time never banks more than `capacity` tokens
+    clock.now += 3600
+    assert [bucket.try_take() for _ in range(6)].count(0) == 5
+
+
+def test_scheduler_spreads_calls_over_keys(clock):
+    scheduler = KeyScheduler(['a', 'b'], calls_per_minute=2, calls_per_day=100)
+
+    async def take(n):
+        return [await scheduler.acquire() for _ in range(n)]
+
+    assert asyncio.run(take(4)) == ['a', 'a', 'b', 'b']
+
+
+def test_scheduler_keeps_daily_quota_and_skips_parked_keys(clock):
+    scheduler = KeyScheduler(['a', 'b'], calls_per_minute=10, calls_per_day=1)
+    scheduler.park('b')
+
+    async def take():
+        return await scheduler.acquire()
+
+    assert asyncio.run(take()) == 'a'
+    # 'a' has spent its daily call and 'b' is parked, so nothing is free now
+    assert scheduler.day['a'].try_take() > 0
+    assert scheduler.minute['a'].tokens == pytest.approx(9)
+    assert scheduler.parked_until['b'] == clock.now + 24 * 60 * 60
+
+
+def test_scheduler_needs_a_key():
+    with pytest.raises(ValueError):
+        KeyScheduler([])
+
+
+INTRADAY = {
+    "Meta Data": {},
+    "Time Series (60min)": {
+        "2024-01-02 10:00:00": {"1. open": "1.0", "2. high": "2.0", "3. low": "0.5", "4. close": "1.5",
+                                "5. volume": "100"},
+        "2024-01-02 11:00:00": {"1. open": "1.5", "2. high": "2.5", "3. low": "1.0", "4. close": "2.0",
+                                "5. volume": "200"},
+    },
+}
+
+RATE_LIMITED = {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."}
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    """
+    No response cache and no stored coverage, so every call reaches the stub.
+    """
+    monkeypatch.setattr(response_cache, '_cache', response_cache.ResponseCache(str(tmp_path), mode='off'))
+    monkeypatch.setattr(async_fetch, 'intraday_month_exists', lambda ticker, year, month: False)
+
+
+def run_against(handler, coro_fn, **fetcher_options):
+    """
+    Serves handler on a local port and runs coro_fn(fetcher) against it.
+    """
+    async def main():
+        app = web.Application()
+        app.router.add_get('/query', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            async with AsyncFetcher(['key-a', 'key-b'], base_url=f"http://127.0.0.1:{port}/query",
+                                    **fetcher_options) as fetcher:
+                return await coro_fn(fetcher)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_fetch_intraday_parses_the_month(offline):
+    seen = []
+
+    async def handler(request):
+        seen.append(dict(request.query))
+        return web.json_response(INTRADAY)
+
+    rows = run_against(handler, lambda fetcher: fetcher.fetch_intraday('AAA', 2024, 1))
+    assert [row['close'] for row in rows] == ['1.5', '2.0']
+    assert seen == [{'function': 'TIME_SERIES_INTRADAY', 'symbol': 'AAA', 'interval': '60min', 'month': '2024-01',
+                     'apikey': seen[0]['apikey']}]
+
+
+def test_rate_limited_key_is_parked_and_call_retried(offline):
+    keys = []
+
+    async def handler(request):
+        keys.append(request.query['apikey'])
+        return web.json_response(RATE_LIMITED if len(keys) == 1 else INTRADAY)
+
+    async def fetch(fetcher):
+        rows = await fetcher.fetch_intraday('AAA', 2024, 1)
+        return rows, set(fetcher.scheduler.parked_until)
+
+    rows, parked = run_against(handler, fetch)
+    assert len(rows) == 2
+    assert keys[0] != keys[1] and parked == {keys[0]}
+
+
+def test_exhausted_retries_are_an_error_not_no_data(offline):
+    async def handler(request):
+        return web.Response(status=500)
+
+    assert run_against(handler, lambda fetcher: fetcher.fetch_intraday('AAA', 2024, 1), max_attempts=2) == 'error'
+    news = run_against(handler, lambda fetcher: fetcher.fetch_news('AAA', '20240101T0000', '20240131T2359'),
+                       max_attempts=2)
+    assert news == 'error'
+
+
+
+def test_missing_series_is_no_data(offline):
+    async def handler(request):
+        return web.json_response({"Error Message": "Invalid API call."})
+
+    assert run_against(handler, lambda fetcher: fetcher.fetch_intraday('AAA', 2024, 1)) == 'no data'
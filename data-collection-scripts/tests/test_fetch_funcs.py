@@ -0,0 +1,20 @@
+# test_fetch_funcs.py
+import pytest
+
+import fetch_funcs
+from fetch_funcs import fetch_balance_sheet, fetch_cash_flow, fetch_income_statement, parse_statement
+
+STATEMENT = {"symbol": "AAA", "annualReports": [], "quarterlyReports": []}
+
+
+@pytest.mark.parametrize('fetch', [fetch_income_statement, fetch_balance_sheet, fetch_cash_flow])
+@pytest.mark.parametrize('response, expected', [
+    (STATEMENT, STATEMENT),
+    ('data exists', 'data exists'),
+    ('no data', 'no data'),
+    ({"symbol": "AAA"}, 'no data'),
+    (None, 'no data'),
+])
+def test_statement_fetchers_follow_parse_statement(monkeypatch, fetch, response, expected):
+    monkeypatch.setattr(fetch_funcs, 'base_function_fetch_call', lambda *args: response)
+    assert fetch('AAA', 'key') == expected == parse_statement(response)
@@ -0,0 +1,26 @@
+# test_financial_facts.py
+import pytest
+
+from financial_facts import parse_amount
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('123456789', 123456789),
+    (' -42 ', -42),
+    ('1.5E9', 1500000000),
+    ('2.6', 3),
+    (7, 7),
+    ('None', None),
+    ('', None),
+    ('-', None),
+    (None, None),
+    ('n/a', None),
+    ('inf', None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+def test_parse_amount_keeps_large_values_exact():
+    # Beyond float precision, which REAL columns used to round
+    assert parse_amount('123456789012345678') == 123456789012345678
@@ -0,0 +1,101 @@
+# test_intraday_pyramid.py
+import numpy as np
+import pytest
+
+from intraday_pyramid import LTTB_NUMPY_BUCKET, TABLES, aggregate_rows, build, lttb, period_starts
+from ohlcv_store import BAR_DTYPE
+
+
+def reference_lttb(x, y, threshold):
+    """
+    Textbook largest-triangle-three-buckets, one bucket at a time.
+    """
+    count = len(x)
+    edges = np.floor(np.linspace(1, count - 1, threshold - 1)).astype(int)
+    kept = [0]
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = np.mean(x[end:edges[bucket + 2]])
+            next_y = np.mean(y[end:edges[bucket + 2]])
+        else:
+            next_x, next_y = x[-1], y[-1]
+        px, py = x[kept[-1]], y[kept[-1]]
+        areas = [abs((px - next_x) * (y[i] - py) - (px - x[i]) * (next_y - py)) for i in range(start, end)]
+        kept.append(start + int(np.argmax(areas)))
+    return kept + [count - 1]
+
+
+@pytest.mark.parametrize('count, threshold', [(100, 10), (1000, 37), (50 * LTTB_NUMPY_BUCKET, 20), (11, 3)])
+def test_lttb_matches_reference(count, threshold):
+    rng = np.random.default_rng(count)
+    x = np.cumsum(rng.integers(1, 5, count)).astype(float)
+    y = np.cumsum(rng.normal(size=count))
+    kept = lttb(x, y, threshold)
+    assert kept.tolist() == reference_lttb(x, y, threshold)
+    assert len(kept) == threshold and kept[0] == 0 and kept[-1] == count - 1
+
+
+def test_lttb_keeps_spikes_and_short_series():
+    y = np.zeros(1000)
+    y[500] = 100.0
+    assert 500 in lttb(np.arange(1000), y, 20).tolist()
+    assert lttb(np.arange(5), np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def epoch(text):
+    return int(np.datetime64(text, 's').astype(np.int64))
+
+
+def test_period_starts():
+    times = np.array([epoch('2024-01-03T15:00:00'), epoch('2024-01-07T23:00:00'), epoch('2024-02-29T10:00:00')])
+    assert period_starts(times, 'daily').tolist() == [epoch('2024-01-03'), epoch('2024-01-07'), epoch('2024-02-29')]
+    # 2024-01-01 and 2024-02-26 were Mondays
+    assert period_starts(times, 'weekly').tolist() == [epoch('2024-01-01'), epoch('2024-01-01'), epoch('2024-02-26')]
+    assert period_starts(times, 'monthly').tolist() == [epoch('2024-01-01'), epoch('2024-01-01'), epoch('2024-02-01')]
+
+
+def test_aggregate_rows():
+    bars = np.zeros(3, dtype=BAR_DTYPE)
+    bars['datetime'] = [epoch('2024-01-02T10:00:00'), epoch('2024-01-02T11:00:00'), epoch('2024-01-03T10:00:00')]
+    bars['open'] = [1, 2, 3]
+    bars['high'] = [5, 6, 7]
+    bars['low'] = [0.5, 0.25, 2]
+    bars['close'] = [1.5, 2.5, 3.5]
+    bars['volume'] = [10, 20, 30]
+    assert aggregate_rows('AAA', bars, 'daily') == [
+        ('AAA', epoch('2024-01-02T11:00:00'), epoch('2024-01-02'), 1.0, 6.0, 0.25, 2.5, 30, 2),
+        ('AAA', epoch('2024-01-03T10:00:00'), epoch('2024-01-03'), 3.0, 7.0, 2.0, 3.5, 30, 1),
+    ]
+    assert aggregate_rows('AAA', bars[:0], 'daily') == []
+
+
+def month_of_bars(symbol, year, month, seed):
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(f'{year}-{month:02d}'), np.datetime64(f'{year}-{month:02d}') + np.timedelta64(1, 'M'),
+                     dtype='datetime64[D]')
+    times = (days[:, None] + np.arange(10, 16).astype('timedelta64[h]')).ravel().astype('datetime64[s]')
+    closes = 100 + np.cumsum(rng.normal(size=len(times)))
+    return [{'symbol': symbol, 'datetime': str(time).replace('T', ' '), 'open': close, 'high': close + 1,
+             'low': close - 1, 'close': close, 'volume': 100} for time, close in zip(times, closes)]
+
+
+def aggregates(db):
+    return {table: db.cursor().execute(f"SELECT * FROM {table} ORDER BY symbol, datetime").fetchall()
+            for table in TABLES.values()}
+
+
+def test_stores_keep_the_pyramid_current(tmp_path):
+    from fetch_funcs import store_intraday_data
+    from storage import FinanceDB
+
+    db = FinanceDB(str(tmp_path / 'finance.db'))
+    # The first store builds AAA in full, later ones update only their periods,
+    # including the week that spans February and March and a month stored out of order
+    for seed, month in enumerate((2, 3, 1)):
+        store_intraday_data(month_of_bars('AAA', 2024, month, seed), db)
+    stored = aggregates(db)
+    assert len(stored['intraday_monthly']) == 3
+    build(db, full=True)
+    assert aggregates(db) == stored
+    db.close()
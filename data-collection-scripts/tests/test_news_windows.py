@@ -0,0 +1,109 @@
+# test_news_windows.py
+from news_windows import (
+    NEWS_LIMIT,
+    NEWS_WINDOW_INSERT,
+    WindowSplit,
+    empty_result,
+    news_month_covered,
+    split_window,
+    store_news_windows,
+)
+
+
+def feed(articles):
+    return {"feed": [{"url": f"https://news/{index}"} for index in range(articles)]}
+
+
+def test_split_window_steps():
+    weeks = split_window("20240101T0000", "20240131T2359")
+    assert weeks[0] == ("20240101T0000", "20240107T2359")
+    assert weeks[-1] == ("20240129T0000", "20240131T2359")
+    assert len(weeks) == 5
+    days = split_window("20240101T0000", "20240107T2359")
+    assert len(days) == 7 and days[1] == ("20240102T0000", "20240102T2359")
+    assert split_window("20240101T0000", "20240101T2359") is None
+
+
+def test_unsaturated_window_is_kept_whole():
+    split = WindowSplit("AAA", "20240101T0000", "20240131T2359")
+    split.add([feed(3)])
+    assert split.level == []
+    assert split.result() == {"feed": feed(3)["feed"], "windows": [("20240101T0000", "20240131T2359", 3, True)]}
+
+
+def test_saturated_window_is_split_and_parent_dropped():
+    split = WindowSplit("AAA", "20240101T0000", "20240131T2359")
+    split.add([feed(NEWS_LIMIT)])
+    assert split.level == split_window("20240101T0000", "20240131T2359")
+    # One week is still saturated and goes down to days, one week is empty
+    results = [feed(NEWS_LIMIT), "no data"] + [feed(2)] * (len(split.level) - 2)
+    split.add(results)
+    assert split.level == split_window("20240101T0000", "20240107T2359")
+    split.add([feed(NEWS_LIMIT)] + [feed(1)] * 6)
+    assert split.level == []
+    result = split.result()
+    assert len(result["feed"]) == NEWS_LIMIT + 6 + 2 * 3
+    windows = {window[:2]: window[2:] for window in result["windows"]}
+    assert windows[("20240108T0000", "20240114T2359")] == (0, True)
+    # A saturated day cannot be split further and is kept incomplete
+    assert windows[("20240101T0000", "20240101T2359")] == (NEWS_LIMIT, False)
+    assert split.requests == 1 + 5 + 7
+
+
+def test_failed_sub_window_is_the_result():
+    split = WindowSplit("AAA", "20240101T0000", "20240131T2359")
+    split.add([feed(NEWS_LIMIT)])
+    split.add([feed(NEWS_LIMIT), "limit reached"] + [feed(2)] * (len(split.level) - 2))
+    # Nothing is split further and the month is retried, rotating the key
+    assert split.level == []
+    assert split.result() == "limit reached"
+
+
+
+def test_first_status_is_the_result():
+    split = WindowSplit("AAA", "20240101T0000", "20240131T2359")
+    split.add(["limit reached"])
+    assert split.level == []
+    assert split.result() == "limit reached"
+
+
+class Coverage:
+
+    def __init__(self, count):
+        self.count = lambda ticker, dataset, period: count
+
+
+def news_db(tmp_path, windows):
+    from storage import FinanceDB
+
+    db = FinanceDB(str(tmp_path / 'finance.db'))
+    with db.unit() as cursor:
+        cursor.executemany(NEWS_WINDOW_INSERT, [("AAA", *window, "2024-02-01 00:00:00") for window in windows])
+    return db
+
+
+def test_incomplete_window_leaves_month_open_whatever_the_count(tmp_path):
+    db = news_db(tmp_path, [("20240101T0000", "20240107T2359", 400, 1),
+                            ("20240108T0000", "20240114T2359", 0, 0)])
+    assert not news_month_covered(Coverage(400), db.cursor(), "AAA", "2024-01", 1)
+    assert news_month_covered(Coverage(400), db.cursor(), "BBB", "2024-01", 1)
+    db.close()
+
+
+def test_failed_feed_records_no_windows(tmp_path, monkeypatch):
+    import fetch_funcs
+
+    db = news_db(tmp_path, [])
+    monkeypatch.setattr(fetch_funcs, 'store_news_sentiment', lambda ticker, data, db=None: False)
+    data = dict(feed(3), windows=[("20240101T0000", "20240131T2359", 3, True)])
+    assert not store_news_windows("AAA", data, db)
+    assert db.cursor().execute("SELECT COUNT(*) FROM news_windows").fetchone()[0] == 0
+    db.close()
+
+
+def test_empty_ended_month_is_covered(tmp_path):
+    db = news_db(tmp_path, [])
+    store_news_windows("AAA", empty_result("20240101T0000", "20240131T2359"), db)
+    assert news_month_covered(Coverage(0), db.cursor(), "AAA", "2024-01", 21)
+    assert not news_month_covered(Coverage(0), db.cursor(), "AAA", "2024-02", 21)
+    db.close()
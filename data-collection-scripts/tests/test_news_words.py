@@ -0,0 +1,18 @@
+# test_news_words.py
+from news_words import word_counts
+
+
+def test_word_counts_skips_stopwords_and_short_words():
+    assert word_counts("The Fed and the ECB hold rates; rates may rise.") == {'fed': 1, 'ecb': 1, 'hold': 1,
+                                                                              'rates': 2, 'rise': 1}
+
+
+def test_word_counts_keeps_inner_punctuation_and_drops_possessives():
+    counts = word_counts("Year-over-year U.S. sales at the company's stores don't grow")
+    assert counts == {'year-over-year': 1, 'u.s': 1, 'sales': 1, 'company': 1, 'stores': 1, "don't": 1, 'grow': 1}
+
+
+def test_word_counts_of_nothing():
+    assert word_counts(None) == {}
+    assert word_counts('') == {}
+    assert word_counts('42 % $') == {}
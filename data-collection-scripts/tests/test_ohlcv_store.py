@@ -0,0 +1,58 @@
+# test_ohlcv_store.py
+import numpy as np
+import pytest
+
+from ohlcv_store import BAR_DTYPE, OHLCVStore, sorted_unique
+
+
+def bars(times, close=1.0):
+    result = np.zeros(len(times), dtype=BAR_DTYPE)
+    result['datetime'] = times
+    result['close'] = close
+    return result
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OHLCVStore(str(tmp_path))
+
+
+def stored(store, symbol='AAA'):
+    return np.array(store.open(symbol))
+
+
+def test_sorted_unique_keeps_the_last_repeat():
+    result = sorted_unique(np.concatenate([bars([3, 1, 2], 1.0), bars([2], 9.0)]))
+    assert result['datetime'].tolist() == [1, 2, 3]
+    assert result['close'].tolist() == [1.0, 9.0, 1.0]
+
+
+def test_write_appends_newer_bars(store):
+    store.write('AAA', bars([10, 20]))
+    store.write('AAA', bars([30, 40], 2.0))
+    result = stored(store)
+    assert result['datetime'].tolist() == [10, 20, 30, 40]
+    assert result['close'].tolist() == [1.0, 1.0, 2.0, 2.0]
+
+
+def test_write_overwrites_known_bars_in_place(store):
+    store.write('AAA', bars([10, 20, 30]))
+    store.write('AAA', bars([20, 30], 5.0))
+    result = stored(store)
+    assert result['datetime'].tolist() == [10, 20, 30]
+    assert result['close'].tolist() == [1.0, 5.0, 5.0]
+
+
+def test_write_merges_interleaved_bars(store):
+    store.write('AAA', bars([10, 30, 50]))
+    store.write('AAA', bars([5, 30, 40], 7.0))
+    result = stored(store)
+    assert result['datetime'].tolist() == [5, 10, 30, 40, 50]
+    assert result['close'].tolist() == [7.0, 1.0, 7.0, 7.0, 1.0]
+
+
+def test_bars_range_and_missing_symbol(store):
+    store.write('AAA', bars([10, 20, 30, 40]))
+    assert store.bars('AAA', 20, 40)['datetime'].tolist() == [20, 30]
+    assert len(store.bars('BBB')) == 0
+    assert store.symbols() == ['AAA']
@@ -0,0 +1,95 @@
+# test_response_cache.py
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from response_cache import ResponseCache, is_final, is_snapshot, rebuild
+
+NOW = datetime(2024, 6, 15, 12, 0)
+
+OVERVIEW = {'function': 'OVERVIEW', 'symbol': 'AAA'}
+BULK = {'function': 'TIME_SERIES_INTRADAY', 'symbol': 'AAA', 'interval': '60min',
+        'outputsize': 'full', 'datatype': 'csv'}
+PAST_MONTH = {'function': 'TIME_SERIES_INTRADAY', 'symbol': 'AAA', 'interval': '60min', 'month': '2024-05'}
+
+
+@pytest.mark.parametrize('function', ['OVERVIEW', 'INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW'])
+def test_overview_and_statements_are_snapshots(function):
+    params = {'function': function, 'symbol': 'AAA'}
+    assert is_snapshot(params)
+    assert not is_final(params, NOW)
+
+
+def test_bulk_intraday_is_a_snapshot():
+    assert is_snapshot(BULK)
+    assert not is_final(BULK, NOW)
+
+
+def test_periods_are_final_once_over():
+    assert not is_snapshot(PAST_MONTH)
+    assert is_final(PAST_MONTH, NOW)
+    assert not is_final(dict(PAST_MONTH, month='2024-06'), NOW)
+    news = {'function': 'NEWS_SENTIMENT', 'tickers': 'AAA', 'time_from': '20240501T0000'}
+    assert not is_final(news, NOW)
+    assert is_final(dict(news, time_to='20240531T2359'), NOW)
+    assert not is_final(dict(news, time_to='20240615T2359'), NOW)
+
+
+@pytest.mark.parametrize('params', [OVERVIEW, {'function': 'CASH_FLOW', 'symbol': 'AAA'}, BULK])
+def test_snapshots_expire_in_record_mode(tmp_path, params):
+    cache = ResponseCache(str(tmp_path), 'record', ttl_hours=24)
+    cache.put(params, b'{"Symbol": "AAA"}')
+    assert cache.get(params) == b'{"Symbol": "AAA"}'
+    assert cache.get_ref(params, now=datetime.now() + timedelta(hours=23)) is not None
+    assert cache.get_ref(params, now=datetime.now() + timedelta(hours=25)) is None
+    # Replay has no network to go back to and serves any age
+    replay = ResponseCache(str(tmp_path), 'replay', ttl_hours=0)
+    assert replay.get(params) == b'{"Symbol": "AAA"}'
+
+
+def test_final_answers_do_not_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path), 'record', ttl_hours=0)
+    cache.put(PAST_MONTH, b'{"Meta Data": {}}')
+    assert cache.get(PAST_MONTH) == b'{"Meta Data": {}}'
+
+
+def test_growing_periods_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path), 'record')
+    current = dict(PAST_MONTH, month=datetime.now().strftime("%Y-%m"))
+    cache.put(current, b'{"Meta Data": {}}')
+    assert cache.get(current) is None
+
+
+def news_body(ticker, day, articles, offset=0):
+    feed = [{"url": f"https://news/{ticker}/{day}/{offset + index}", "title": "t", "summary": "s",
+             "time_published": f"202401{day:02d}T120000",
+             "ticker_sentiment": [{"ticker": ticker, "relevance_score": "0.5",
+                                   "ticker_sentiment_score": "0.1", "ticker_sentiment_label": "Neutral"}]}
+            for index in range(articles)]
+    return json.dumps({"feed": feed}).encode()
+
+
+def news_params(ticker, time_from, time_to):
+    return {'function': 'NEWS_SENTIMENT', 'tickers': ticker, 'time_from': time_from, 'time_to': time_to}
+
+
+def test_rebuild_records_news_windows(tmp_path):
+    from news_windows import NEWS_LIMIT, month_complete, split_window
+    from storage import FinanceDB
+
+    cache = ResponseCache(str(tmp_path / 'cache'), 'record')
+    # AAA: one request under the limit; BBB: an empty month; CCC: a saturated month split into weeks
+    cache.put(news_params('AAA', '20240101T0000', '20240131T2359'), news_body('AAA', 3, 5))
+    cache.put(news_params('BBB', '20240101T0000', '20240131T2359'), b'{"items": "0", "feed": []}')
+    cache.put(news_params('CCC', '20240101T0000', '20240131T2359'), news_body('CCC', 2, NEWS_LIMIT))
+    for index, (time_from, time_to) in enumerate(split_window('20240101T0000', '20240131T2359')):
+        cache.put(news_params('CCC', time_from, time_to), news_body('CCC', 2 + 7 * index, 300, offset=NEWS_LIMIT))
+    db = FinanceDB(str(tmp_path / 'finance.db'))
+    assert rebuild(cache, db) == 8
+    cursor = db.cursor()
+    for ticker in ('AAA', 'BBB', 'CCC'):
+        assert month_complete(cursor, ticker, '2024-01')
+    # The saturated parent's articles are stored, but its window is not recorded
+    assert cursor.execute("SELECT COUNT(*) FROM news_windows WHERE ticker = 'CCC'").fetchone()[0] == 5
+    db.close()
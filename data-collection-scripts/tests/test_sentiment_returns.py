@@ -0,0 +1,90 @@
+# test_sentiment_returns.py
+import numpy as np
+import pytest
+
+from sentiment_returns import MIN_PAIRS, block_matrices, lag_stats, period_returns, rolling_stats
+
+HOUR = 3600
+
+
+def test_period_returns_use_the_last_close_of_each_period():
+    times = np.array([0, 1800, 3600, 5400, 10800])
+    close = np.array([1.0, 2.0, 3.0, 4.0, 8.0])
+    periods, returns = period_returns(times, close, HOUR)
+    assert periods.tolist() == [3600, 10800]
+    assert returns == pytest.approx([np.log(4 / 2), np.log(8 / 4)])
+
+
+def loaded(bar_times, mentions):
+    bar_times = np.asarray(bar_times, dtype=np.int64)
+    closes = np.exp(np.arange(len(bar_times)) * 0.01)
+    times, scores, weights = (np.asarray(column, dtype=float) for column in zip(*mentions)) if mentions else \
+        (np.empty(0),) * 3
+    return (bar_times, closes), (times.astype(np.int64), scores, weights)
+
+
+def test_news_goes_to_the_tickers_own_next_period():
+    # AAA has no bars for hours 3-5; BBB has every hour
+    aaa = loaded([0, HOUR, 2 * HOUR, 6 * HOUR], [(3 * HOUR + 60, 0.5, 1.0), (4 * HOUR, -0.5, 3.0)])
+    bbb = loaded([hour * HOUR for hour in range(8)], [])
+    starts, sentiment, returns = block_matrices([aaa, bbb], HOUR)
+    assert starts[:, 0].tolist()[:3] == [HOUR, 2 * HOUR, 6 * HOUR]
+    assert starts[3:, 0].tolist() == [-1] * (len(starts) - 3)
+    # Both mentions count towards hour 6, weighted by relevance
+    assert sentiment[2, 0] == pytest.approx((0.5 * 1.0 - 0.5 * 3.0) / 4.0)
+    assert np.isnan(sentiment[:2, 0]).all() and np.isnan(returns[3:, 0]).all()
+    # The same ticker alone gives the same column
+    alone_starts, alone_sentiment, alone_returns = block_matrices([aaa], HOUR)
+    assert alone_starts[:, 0].tolist() == starts[:3, 0].tolist()
+    np.testing.assert_array_equal(alone_sentiment[:, 0], sentiment[:3, 0])
+    np.testing.assert_array_equal(alone_returns[:, 0], returns[:3, 0])
+
+
+def test_news_after_the_last_bar_is_dropped():
+    starts, sentiment, _ = block_matrices([loaded([0, HOUR], [(5 * HOUR, 1.0, 1.0)])], HOUR)
+    assert np.isnan(sentiment).all()
+
+
+def random_matrices(rows=300, columns=4, seed=0):
+    rng = np.random.default_rng(seed)
+    sentiment = rng.normal(size=(rows, columns))
+    returns = 0.3 * sentiment + rng.normal(size=(rows, columns))
+    sentiment[rng.random((rows, columns)) < 0.4] = np.nan
+    returns[rng.random((rows, columns)) < 0.1] = np.nan
+    return sentiment, returns
+
+
+@pytest.mark.parametrize('lag', [-3, 0, 1, 5])
+def test_lag_stats_match_a_per_column_reference(lag):
+    sentiment, returns = random_matrices()
+    n, corr, hit_rate = lag_stats(sentiment, returns, lag)
+    for column in range(sentiment.shape[1]):
+        # Pairs (S[t], R[t + lag]) for every t where both exist
+        t = np.arange(len(sentiment))
+        t = t[(t + lag >= 0) & (t + lag < len(returns))]
+        x, y = sentiment[t, column], returns[t + lag, column]
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        assert n[column] == valid.sum()
+        assert corr[column] == pytest.approx(np.corrcoef(x[valid], y[valid])[0, 1])
+        assert hit_rate[column] == pytest.approx(np.mean(np.sign(x[valid]) == np.sign(y[valid])))
+
+
+def test_correlation_needs_min_pairs():
+    sentiment, returns = random_matrices(rows=MIN_PAIRS + 5, columns=1)
+    sentiment[:] = np.nan
+    sentiment[:MIN_PAIRS - 1, 0] = np.arange(MIN_PAIRS - 1)
+    returns[:] = np.arange(len(returns))[:, None]
+    n, corr, _ = lag_stats(sentiment, returns, 0)
+    assert n[0] == MIN_PAIRS - 1 and np.isnan(corr[0])
+
+
+def test_rolling_stats_match_windowed_lag_stats():
+    sentiment, returns = random_matrices(rows=120, columns=3, seed=1)
+    window, lag = 30, 1
+    n, corr = rolling_stats(sentiment, returns, window, lag)
+    assert n.shape == (120 - lag - window + 1, 3)
+    for row in (0, 17, len(n) - 1):
+        # Pairs (S[t], R[t + lag]) for t in row .. row + window - 1
+        expected_n, expected_corr, _ = lag_stats(sentiment[row:row + window + lag], returns[row:row + window + lag], lag)
+        assert n[row].tolist() == expected_n.tolist()
+        np.testing.assert_allclose(corr[row], expected_corr, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,41 @@
+# test_storage.py
+import sqlite3
+
+import pytest
+
+from storage import FinanceDB
+
+
+def other_writer(path):
+    conn = sqlite3.connect(path, timeout=0.1)
+    conn.execute("INSERT INTO news_windows VALUES ('ZZZ', '20240101T0000', '20240131T2359', 0, 1, '')")
+    conn.commit()
+    conn.close()
+
+
+def test_failed_unit_releases_the_write_lock(tmp_path):
+    path = str(tmp_path / 'finance.db')
+    db = FinanceDB(path)
+    with pytest.raises(ValueError):
+        with db.unit() as cursor:
+            cursor.execute("INSERT INTO news_windows VALUES ('AAA', '20240101T0000', '20240131T2359', 0, 1, '')")
+            raise ValueError("store failed")
+    assert not db.conn.in_transaction
+    other_writer(path)
+    assert db.cursor().execute("SELECT ticker FROM news_windows").fetchall() == [('ZZZ',)]
+    db.close()
+
+
+def test_failed_unit_keeps_earlier_pending_units(tmp_path):
+    path = str(tmp_path / 'finance.db')
+    db = FinanceDB(path, batch_size=10)
+    with db.unit() as cursor:
+        cursor.execute("INSERT INTO news_windows VALUES ('AAA', '20240101T0000', '20240131T2359', 0, 1, '')")
+    with pytest.raises(ValueError):
+        with db.unit() as cursor:
+            cursor.execute("INSERT INTO news_windows VALUES ('BBB', '20240101T0000', '20240131T2359', 0, 1, '')")
+            raise ValueError("store failed")
+    db.flush()
+    other_writer(path)
+    assert db.cursor().execute("SELECT ticker FROM news_windows ORDER BY ticker").fetchall() == [('AAA',), ('ZZZ',)]
+    db.close()
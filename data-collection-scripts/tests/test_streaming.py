@@ -0,0 +1,54 @@
+# test_streaming.py
+import sqlite3
+
+import streaming
+from news_windows import NEWS_LIMIT, month_complete, split_window
+from storage import FinanceDB
+
+
+def article(day, index):
+    return {"url": f"https://news/{day}/{index}", "title": "t", "summary": "s",
+            "time_published": f"202401{day:02d}T120000",
+            "ticker_sentiment": [{"ticker": "AAA", "relevance_score": "0.5",
+                                  "ticker_sentiment_score": "0.1", "ticker_sentiment_label": "Neutral"}]}
+
+
+def test_write_lock_is_free_between_windows(tmp_path, monkeypatch):
+    path = str(tmp_path / 'finance.db')
+    db = FinanceDB(path)
+    writes = []
+
+    def fetch(ticker, time_from, time_to, api_key):
+        # Another writer gets in while this one waits on the API
+        other = sqlite3.connect(path, timeout=0.1)
+        other.execute("INSERT INTO news_windows VALUES ('ZZZ', ?, ?, 0, 1, '')", (time_from, time_to))
+        other.commit()
+        other.close()
+        writes.append(time_from)
+        if (time_from, time_to) == ("20240101T0000", "20240131T2359"):
+            return {"feed": iter([article(2, index) for index in range(NEWS_LIMIT)])}
+        day = int(time_from[6:8])
+        return {"feed": iter([article(day, NEWS_LIMIT + index) for index in range(3)])}
+
+    monkeypatch.setattr(streaming, 'fetch_news_stream', fetch)
+    result = streaming.stream_news_windowed("AAA", "20240101T0000", "20240131T2359", "key", db)
+    assert len(writes) == 1 + len(split_window("20240101T0000", "20240131T2359"))
+    assert [window[2:] for window in result["windows"]] == [(3, True)] * 5
+    assert month_complete(db.cursor(), "AAA", "2024-01")
+    db.close()
+
+
+def test_failed_window_is_the_result(tmp_path, monkeypatch):
+    db = FinanceDB(str(tmp_path / 'finance.db'))
+
+    def fetch(ticker, time_from, time_to, api_key):
+        if time_to == "20240131T2359" and time_from == "20240101T0000":
+            return {"feed": iter([article(2, index) for index in range(NEWS_LIMIT)])}
+        return "limit reached" if time_from == "20240108T0000" else "no data"
+
+    monkeypatch.setattr(streaming, 'fetch_news_stream', fetch)
+    assert streaming.stream_news_windowed("AAA", "20240101T0000", "20240131T2359", "key", db) == "limit reached"
+    # The month's articles are kept, but without windows it is fetched again
+    assert db.cursor().execute("SELECT COUNT(*) FROM news_articles").fetchone()[0] == NEWS_LIMIT
+    assert db.cursor().execute("SELECT COUNT(*) FROM news_windows").fetchone()[0] == 0
+    db.close()